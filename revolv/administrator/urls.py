@@ -1,8 +1,11 @@
 from django.conf.urls import patterns, url
 
 from revolv.administrator.views import (admin_email_csv_download,
+                                        admin_request_profile_download,
+                                        admin_sql_profile,
                                         AdministratorDashboardView,
-                                        AdministratorEmailView)
+                                        AdministratorEmailView,
+                                        AdministratorRequestProfilesView)
 from revolv.base.users import is_administrator
 
 urlpatterns = patterns(
@@ -10,4 +13,8 @@ urlpatterns = patterns(
     url(r'^$', is_administrator(AdministratorDashboardView.as_view()), name='dashboard'),
     url(r'^email$', is_administrator(AdministratorEmailView.as_view()), name='email'),
     url(r'^email/csv$', admin_email_csv_download, name='emailcsv'),
+    url(r'^sql-profile$', is_administrator(admin_sql_profile), name='sql_profile'),
+    url(r'^profiles$', is_administrator(AdministratorRequestProfilesView.as_view()), name='profiles'),
+    url(r'^profiles/(?P<name>[\w-]+)\.(?P<extension>txt|collapsed)$',
+        is_administrator(admin_request_profile_download), name='profile_download'),
 )
@@ -1,12 +1,13 @@
 import csv
+import os
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.generic import TemplateView
 from revolv.base.models import RevolvUserProfile
+from revolv.base.request_profiler import capture_path, list_captures, make_profile_token, PROFILE_PARAM
+from revolv.base.sql_profile import recent_profiles
 from revolv.base.users import UserDataMixin
-from revolv.base.utils import ProjectGroup
 from revolv.base.views import BaseStaffDashboardView
-from revolv.project.models import Project
 
 
 class AdministratorDashboardView(BaseStaffDashboardView):
@@ -17,12 +18,6 @@ class AdministratorDashboardView(BaseStaffDashboardView):
     template_name = 'base/dashboard.html'
     role = "admin"
 
-    def get_context_data(self, **kwargs):
-        context = super(AdministratorDashboardView, self).get_context_data(**kwargs)
-
-        context["project_dict"][ProjectGroup('Drafted Projects', "drafted")] = Project.objects.get_drafted()
-        return context
-
 
 class AdministratorEmailView(UserDataMixin, TemplateView):
     """View for the list of newsletter subscribers for the dashboard.
@@ -39,6 +34,20 @@ class AdministratorEmailView(UserDataMixin, TemplateView):
         return context
 
 
+class AdministratorRequestProfilesView(UserDataMixin, TemplateView):
+    """View of the recent request profiles (see revolv.base.request_profiler),
+    with the token to profile more requests with.
+    """
+    template_name = 'administrator/profiles.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(AdministratorRequestProfilesView, self).get_context_data(**kwargs)
+        context['profile_param'] = PROFILE_PARAM
+        context['profile_token'] = make_profile_token(self.principal)
+        context['captures'] = list_captures()
+        return context
+
+
 def admin_email_csv_download(request):
     """View for downloading the list of newsletter subscribers as a csv file.
     Accessed via AdministratorEmailView.
@@ -47,7 +56,7 @@ def admin_email_csv_download(request):
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="emails.csv"'
 
-    users_subscribed = RevolvUserProfile.objects.get_subscribed_to_newsletter()
+    users_subscribed = RevolvUserProfile.objects.get_subscribed_to_newsletter().select_related('user')
     newsletter_rows = [(u.user.email, u.user.first_name, u.user.last_name, u.user.date_joined) for u in users_subscribed]
 
     writer = csv.writer(response)
@@ -55,3 +64,23 @@ def admin_email_csv_download(request):
     writer.writerows(newsletter_rows)
 
     return response
+
+
+def admin_sql_profile(request):
+    """View of the SQL profiles of the last requests served by this process, as
+    JSON (see revolv.base.sql_profile).
+    """
+    return JsonResponse({'profiles': recent_profiles()})
+
+
+def admin_request_profile_download(request, name, extension):
+    """View for downloading the stats (txt) or collapsed stacks (collapsed) of
+    a request profile. Accessed via AdministratorRequestProfilesView.
+    """
+    path = capture_path(name, extension)
+    if not os.path.exists(path):
+        raise Http404
+    with open(path) as capture_file:
+        response = HttpResponse(capture_file.read(), content_type='text/plain')
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (name, extension)
+    return response
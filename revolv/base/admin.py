@@ -2,4 +2,10 @@ from django.contrib import admin
 
 from .models import RevolvUserProfile
 
-admin.site.register(RevolvUserProfile)
+
+class RevolvUserProfileAdmin(admin.ModelAdmin):
+    # reinvest_pool is a projection of the reinvestment ledger, see RevolvUserProfile.save
+    readonly_fields = ('reinvest_pool',)
+
+
+admin.site.register(RevolvUserProfile, RevolvUserProfileAdmin)
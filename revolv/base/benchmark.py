@@ -0,0 +1,372 @@
+"""
+Benchmarks of the monthly financial pipeline and of the hot views, for
+`manage.py benchmark`.
+
+They run against the synthetic data of `manage.py seed --scale N` (see
+revolv.base.synthetic). Every run of a benchmark happens in a transaction
+which is rolled back afterwards, so the runs all start from the same data and
+the database is left as it was. For every benchmark the runner reports the
+median and 95th percentile wall time of its runs, how many queries a run makes
+and the peak memory (the growth of the process' resident set) of a run.
+
+Benchmarks are grouped into the named SUITES; run_suite returns a dict which
+is written as JSON, and compare_results compares two of them, e.g. the results
+of a branch with a baseline saved from master.
+"""
+import datetime
+import math
+import resource
+import sys
+import time
+from collections import OrderedDict
+from cStringIO import StringIO
+
+from celery import current_app
+from django.core import mail
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from revolv.base.models import RevolvUserProfile
+from revolv.base.page_cache import invalidate_page_tags
+from revolv.base.synthetic import synthetic_projects, synthetic_users
+from revolv.payments.models import AdminReinvestment, AdminRepayment, Payment
+from revolv.project.models import Project
+from revolv.project.utils import aggregate_stats
+from revolv.tasks.reinvestment_allocation import calculate_montly_reinvesment_allocation
+from revolv.tasks.reinvestment_rollover import distribute_reinvestment_fund
+
+SYNTHETIC_PASSWORD = 'password'
+
+# how many users aggregate_stats is computed for in one run
+AGGREGATE_STATS_USERS = 100
+REPAYMENT_AMOUNT = 1000.0
+REINVESTMENT_AMOUNT = 1000.0
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class BenchmarkContext(object):
+    """
+    The synthetic users and projects the benchmarks work with: an
+    administrator, the ambassador with the most projects, the donors with the
+    most contributions, the completed project with the most donors and the
+    active project with the most room for reinvestment. Also keeps a logged in
+    test Client for each of the users whose dashboards are rendered.
+    """
+
+    def __init__(self):
+        users = synthetic_users()
+        projects = synthetic_projects()
+        profiles = RevolvUserProfile.objects.filter(user__in=users).select_related('user')
+        self.admin = profiles.filter(user__groups__name=RevolvUserProfile.ADMIN_GROUP).order_by('pk').first()
+        if self.admin is None:
+            raise BenchmarkError(
+                "There is no synthetic data to benchmark: generate it first with `manage.py seed --scale N`."
+            )
+        self.ambassador = profiles.annotate(
+            project_count=Count('ambassador')
+        ).filter(user__groups__name=RevolvUserProfile.AMBASSADOR_GROUP).order_by('-project_count', 'pk').first()
+        self.donors = list(profiles.exclude(
+            user__groups__name__in=[RevolvUserProfile.ADMIN_GROUP, RevolvUserProfile.AMBASSADOR_GROUP]
+        ).annotate(contribution_count=Count('contributions')).order_by(
+            '-contribution_count', 'pk'
+        )[:AGGREGATE_STATS_USERS])
+        self.completed_project = Project.objects.get_completed(projects).annotate(
+            donor_count=Count('donors')
+        ).order_by('-donor_count', 'pk').first()
+        self.active_project = Project.objects.get_active(projects).order_by('-funding_goal', 'pk').first()
+        if not self.donors or self.ambassador is None or self.completed_project is None or self.active_project is None:
+            raise BenchmarkError("The synthetic data is incomplete: generate it again with a larger --scale.")
+
+        self.clients = {}
+        for role, profile in (('admin', self.admin), ('ambassador', self.ambassador), ('donor', self.donors[0])):
+            client = Client()
+            if not client.login(username=profile.user.username, password=SYNTHETIC_PASSWORD):
+                raise BenchmarkError("Could not log in as %s." % profile.user.username)
+            self.clients[role] = client
+        self.clients[None] = Client()
+
+    def close(self):
+        for client in self.clients.values():
+            client.logout()
+
+    def volume(self):
+        """
+        :return: how much data the benchmarks ran against.
+        """
+        return OrderedDict([
+            ('users', RevolvUserProfile.objects.count()),
+            ('projects', Project.objects.count()),
+            ('synthetic_projects', synthetic_projects().count()),
+            ('payments', Payment.objects.count()),
+        ])
+
+
+class Benchmark(object):
+    """
+    One benchmark. prepare() runs before every run, outside of the
+    measurement, and run() is what is measured. Both run in the transaction
+    which is rolled back after the run.
+    """
+    description = ''
+
+    def prepare(self, context):
+        pass
+
+    def run(self, context):
+        raise NotImplementedError()
+
+
+class AllocationBenchmark(Benchmark):
+    description = 'calculate_montly_reinvesment_allocation: the monthly allocation and its reminder emails'
+
+    def run(self, context):
+        calculate_montly_reinvesment_allocation()
+
+
+class RolloverBenchmark(Benchmark):
+    description = 'distribute_reinvestment_fund: the automatic reinvestment into every eligible project'
+
+    def run(self, context):
+        distribute_reinvestment_fund()
+
+
+class AdminRepaymentBenchmark(Benchmark):
+    description = 'An AdminRepayment to the completed project with the most donors, and its fragments'
+
+    def run(self, context):
+        AdminRepayment.objects.create(amount=REPAYMENT_AMOUNT, admin=context.admin, project=context.completed_project)
+
+
+class AdminReinvestmentBenchmark(Benchmark):
+    description = 'An AdminReinvestment into an active project, pooling the reinvest pools'
+
+    def run(self, context):
+        AdminReinvestment.objects.create(
+            amount=REINVESTMENT_AMOUNT, admin=context.admin, project=context.active_project
+        )
+
+
+class AggregateStatsBenchmark(Benchmark):
+    description = 'aggregate_stats of the %d donors with the most contributions' % AGGREGATE_STATS_USERS
+
+    def run(self, context):
+        for donor in context.donors:
+            aggregate_stats(donor)
+
+
+class MonthlyDonationEmailBenchmark(Benchmark):
+    description = 'manage.py monthlydonationemail, to the locmem email backend'
+
+    def prepare(self, context):
+        mail.outbox = []
+
+    def run(self, context):
+        call_command('monthlydonationemail', override=True, silence_admin_notifications=True)
+
+
+class ViewBenchmark(Benchmark):
+    """
+    Render a view as the user of the given role (None for an anonymous
+    visitor). The anonymous pages are taken out of the page cache first.
+    """
+
+    def __init__(self, role, url_name):
+        self.role = role
+        self.url_name = url_name
+        self.description = 'GET %s as %s' % (url_name, role or 'an anonymous visitor')
+
+    def prepare(self, context):
+        invalidate_page_tags(['projects'])
+
+    def run(self, context):
+        response = context.clients[self.role].get(reverse(self.url_name))
+        if response.status_code != 200:
+            raise BenchmarkError('%s returned %s' % (self.url_name, response.status_code))
+
+
+BENCHMARKS = OrderedDict([
+    ('allocation', AllocationBenchmark()),
+    ('rollover', RolloverBenchmark()),
+    ('admin_repayment', AdminRepaymentBenchmark()),
+    ('admin_reinvestment', AdminReinvestmentBenchmark()),
+    ('aggregate_stats', AggregateStatsBenchmark()),
+    ('monthlydonationemail', MonthlyDonationEmailBenchmark()),
+    ('home', ViewBenchmark(None, 'home')),
+    ('projects_list', ViewBenchmark(None, 'projects_list')),
+    ('donor_dashboard', ViewBenchmark('donor', 'donor:dashboard')),
+    ('ambassador_dashboard', ViewBenchmark('ambassador', 'ambassador:dashboard')),
+    ('admin_dashboard', ViewBenchmark('admin', 'administrator:dashboard')),
+])
+
+SUITES = OrderedDict([
+    ('all', list(BENCHMARKS)),
+    ('pipeline', ['allocation', 'rollover', 'admin_repayment', 'admin_reinvestment', 'monthlydonationemail']),
+    ('views', ['home', 'projects_list', 'donor_dashboard', 'ambassador_dashboard', 'admin_dashboard',
+               'aggregate_stats']),
+])
+
+
+def _proc_status_kb(field):
+    """
+    :return: the given field of /proc/self/status (e.g. VmRSS) in kB, or None
+    where there is no procfs.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def reset_peak_memory():
+    """
+    Reset the resident set high water mark of the process, where Linux
+    allows it.
+
+    :return: the current resident set size in kB
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except IOError:
+        pass
+    rss = _proc_status_kb('VmRSS')
+    return rss if rss is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_memory():
+    """
+    :return: the resident set high water mark of the process in kB (since the
+    last reset_peak_memory, where Linux allows it).
+    """
+    peak = _proc_status_kb('VmHWM')
+    return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, fraction):
+    """
+    :return: the nearest-rank percentile of the values.
+    """
+    values = sorted(values)
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+def run_benchmark(benchmark, context, iterations, warmup=1):
+    """
+    Run the benchmark warmup times, then iterations times measuring it.
+
+    :return: an OrderedDict of the measurements
+    """
+    timings = []
+    query_counts = []
+    peaks = []
+    for i in range(warmup + iterations):
+        with transaction.atomic():
+            benchmark.prepare(context)
+            stdout, sys.stdout = sys.stdout, StringIO()
+            try:
+                rss = reset_peak_memory()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.time()
+                    benchmark.run(context)
+                    elapsed = time.time() - started
+                peak = peak_memory() - rss
+            except SystemExit:
+                raise BenchmarkError('%s exited: %s' % (benchmark.description, sys.stdout.getvalue().strip()))
+            finally:
+                sys.stdout = stdout
+            transaction.set_rollback(True)
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            query_counts.append(len(queries))
+            peaks.append(peak)
+    return OrderedDict([
+        ('description', benchmark.description),
+        ('median_ms', round(percentile(timings, 0.5), 3)),
+        ('p95_ms', round(percentile(timings, 0.95), 3)),
+        ('min_ms', round(min(timings), 3)),
+        ('max_ms', round(max(timings), 3)),
+        ('queries', percentile(query_counts, 0.5)),
+        ('peak_memory_kb', max(0, max(peaks))),
+    ])
+
+
+def run_suite(names, iterations, warmup=1, log=None):
+    """
+    Run the named benchmarks against the synthetic data.
+
+    :return: an OrderedDict of the results, ready to be written as JSON
+    """
+    log = log or (lambda message: None)
+    app = current_app
+    eager = app.conf.CELERY_ALWAYS_EAGER, app.conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS
+    # the monthly tasks run their subtasks in this process, and the admin
+    # reinvestment period is on, so that AdminReinvestments can be made
+    app.conf.CELERY_ALWAYS_EAGER = app.conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
+    try:
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            ADMIN_REINVESTMENT_DATE_DT=datetime.datetime(2000, 1, 1),
+            SQL_PROFILE_ENABLED=False,
+        ):
+            context = BenchmarkContext()
+            try:
+                with override_settings(ADMIN_PAYMENT_USERNAME=context.admin.user.username):
+                    results = OrderedDict()
+                    for name in names:
+                        log("[Benchmark:Info] Running %s..." % name)
+                        results[name] = run_benchmark(BENCHMARKS[name], context, iterations, warmup)
+                volume = context.volume()
+            finally:
+                context.close()
+    finally:
+        app.conf.CELERY_ALWAYS_EAGER, app.conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS = eager
+        invalidate_page_tags(['projects'])
+    return OrderedDict([
+        ('created_at', datetime.datetime.now().isoformat()),
+        ('iterations', iterations),
+        ('warmup', warmup),
+        ('volume', volume),
+        ('results', results),
+    ])
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare the results of run_suite with a baseline (the results of an
+    earlier run) benchmark by benchmark.
+
+    :return: a list of lines describing the changes, and a list of the
+        regressions: the benchmarks whose median time grew by more than
+        threshold percent, or which make more queries
+    """
+    lines = []
+    regressions = []
+    for name, result in results['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            lines.append('%-22s not in the baseline' % name)
+            continue
+        change = (result['median_ms'] - before['median_ms']) * 100.0 / (before['median_ms'] or 1.0)
+        lines.append('%-22s median %9.1f ms (%+6.1f%%)  queries %6d (%+d)  peak memory %8d kB (%+d)' % (
+            name, result['median_ms'], change, result['queries'], result['queries'] - before['queries'],
+            result['peak_memory_kb'], result['peak_memory_kb'] - before['peak_memory_kb'],
+        ))
+        if change > threshold:
+            regressions.append('%s is %.1f%% slower' % (name, change))
+        if result['queries'] > before['queries']:
+            regressions.append('%s makes %d more queries' % (name, result['queries'] - before['queries']))
+    if results['volume'] != baseline.get('volume'):
+        lines.append('The baseline ran against different data: %s' % baseline.get('volume'))
+    return lines, regressions
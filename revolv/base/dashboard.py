@@ -0,0 +1,217 @@
+"""
+The project sections of the dashboards: the sidebar of the admin and
+ambassador dashboards lists their projects in sections by status (proposed,
+staged, active, completed, drafted), and the donor dashboard has one section of
+the projects the donor supported.
+
+However many projects there are, a dashboard only loads a constant amount of
+them: DashboardService.sections() gets the count and the first page of every
+section with one query, and the following pages of a section are loaded from
+DashboardProjectsView (a JSON endpoint) as the user asks for them.
+"""
+from collections import OrderedDict
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+from revolv.base.utils import ProjectGroup
+from revolv.project.models import Project
+
+DASHBOARD_PAGE_SIZE = 10
+
+# section key -> (heading, the statuses of its projects (None for all of
+# them), the order of its projects)
+DASHBOARD_SECTIONS = OrderedDict([
+    ('proposed', ('Proposed Projects', [Project.PROPOSED], ['updated_at', 'pk'])),
+    ('staged', ('Staged projects', [Project.STAGED], ['updated_at', 'pk'])),
+    ('active', ('Active Projects', [Project.ACTIVE], ['end_date', 'updated_at', 'pk'])),
+    ('completed', ('Completed Projects', [Project.COMPLETED], ['end_date', 'updated_at', 'pk'])),
+    ('drafted', ('Drafted Projects', [Project.DRAFTED], ['updated_at', 'pk'])),
+    ('donated', ('My Projects', None, ['end_date', 'updated_at', 'pk'])),
+])
+
+STAFF_SECTIONS = ['proposed', 'staged', 'active', 'completed', 'drafted']
+
+DASHBOARD_ROLE_SECTIONS = {
+    'admin': STAFF_SECTIONS,
+    'ambassador': STAFF_SECTIONS,
+    'donor': ['donated'],
+}
+
+
+class DashboardSection(object):
+    """
+    A section of a dashboard: its ProjectGroup, how many projects it has and
+    the first page of them (dicts of their pk, title and project_status).
+    """
+
+    def __init__(self, group, count, projects, url):
+        self.group = group
+        self.count = count
+        self.projects = projects
+        self.url = url
+
+    @property
+    def has_more(self):
+        return self.count > len(self.projects)
+
+
+class DashboardService(object):
+    """
+    The projects of the dashboard of a role (see DASHBOARD_ROLE_SECTIONS), as
+    seen by the given Principal (see revolv.base.principal): admins see every
+    project, ambassadors the projects they own and donors the projects they
+    donated to.
+    """
+
+    def __init__(self, role, principal):
+        self.role = role
+        self.principal = principal
+        self.section_keys = DASHBOARD_ROLE_SECTIONS[role]
+
+    def get_queryset(self):
+        if self.role == 'admin':
+            return Project.objects.all()
+        if self.role == 'ambassador':
+            return Project.objects.owned_projects(self.principal.profile_id)
+        return Project.objects.filter(donors=self.principal.profile_id)
+
+    def get_section_queryset(self, key):
+        """
+        :return: the projects of the section with the given key, in order, with
+        their funding stats.
+        """
+        heading, statuses, ordering = DASHBOARD_SECTIONS[key]
+        queryset = self.get_queryset()
+        if statuses is not None:
+            queryset = queryset.filter(project_status__in=statuses)
+        return Project.objects.with_funding_stats(queryset).order_by(*ordering)
+
+    def section_url(self, key):
+        return reverse('dashboard_projects', kwargs={'role': self.role, 'section': key})
+
+    def section_sql(self):
+        """
+        :return: the sql and params of an expression giving the key of the
+        section a project is in, and the statuses of the projects in the
+        sections (None if a section has projects of any status).
+        """
+        qn = connection.ops.quote_name
+        status = '%s.%s' % (qn(Project._meta.db_table), qn(Project._meta.get_field('project_status').column))
+        sql = []
+        params = []
+        statuses = set()
+        for key in self.section_keys:
+            heading, section_statuses, ordering = DASHBOARD_SECTIONS[key]
+            if section_statuses is None:
+                sql.append('WHEN 1 = 1 THEN %s')
+                params.append(key)
+                statuses = None
+                break
+            sql.append('WHEN %s IN (%s) THEN %%s' % (status, ', '.join(['%s'] * len(section_statuses))))
+            params.extend(section_statuses + [key])
+            statuses.update(section_statuses)
+        return 'CASE %s END' % ' '.join(sql), params, statuses
+
+    def sections(self):
+        """
+        :return: a list of the DashboardSections of the dashboard, with their
+        counts and first pages, from one query over all the sections: every
+        project is ranked within its section (and counted) by window functions,
+        and only the first page of every section is returned, to be partitioned
+        into the sections here.
+        """
+        qn = connection.ops.quote_name
+        table = qn(Project._meta.db_table)
+        section_sql, section_params, statuses = self.section_sql()
+        # rank in the same order as get_section_queryset: the sections ordered
+        # by end_date first by it, and all of them by updated_at and pk
+        end_date_keys = [key for key in self.section_keys if DASHBOARD_SECTIONS[key][2][0] == 'end_date']
+        end_date_sql = 'CASE WHEN (%s) IN (%s) THEN %s.%s END' % (
+            section_sql, ', '.join(['%s'] * len(end_date_keys)),
+            table, qn(Project._meta.get_field('end_date').column)
+        ) if end_date_keys else 'NULL'
+        end_date_params = section_params + end_date_keys if end_date_keys else []
+        order_sql = '%s, %s.%s, %s.%s' % (
+            end_date_sql,
+            table, qn(Project._meta.get_field('updated_at').column),
+            table, qn(Project._meta.pk.column),
+        )
+
+        queryset = self.get_queryset()
+        if statuses is not None:
+            queryset = queryset.filter(project_status__in=statuses)
+        queryset = queryset.extra(
+            select=OrderedDict([
+                ('dashboard_section', section_sql),
+                ('dashboard_rank', 'ROW_NUMBER() OVER (PARTITION BY %s ORDER BY %s)' % (section_sql, order_sql)),
+                ('dashboard_count', 'COUNT(*) OVER (PARTITION BY %s)' % section_sql),
+            ]),
+            select_params=section_params + section_params + end_date_params + section_params,
+        ).values('pk', 'title', 'project_status', 'dashboard_section', 'dashboard_rank', 'dashboard_count')
+        sql, params = queryset.query.sql_with_params()
+
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT * FROM (%s) AS dashboard_projects WHERE dashboard_rank <= %%s '
+            'ORDER BY dashboard_section, dashboard_rank' % sql,
+            tuple(params) + (DASHBOARD_PAGE_SIZE,)
+        )
+        columns = [column[0] for column in cursor.description]
+        counts = {}
+        projects = dict((key, []) for key in self.section_keys)
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            key = row['dashboard_section']
+            counts[key] = row['dashboard_count']
+            projects[key].append({
+                'pk': row[Project._meta.pk.column],
+                'title': row['title'],
+                'project_status': row['project_status'],
+            })
+
+        return [
+            DashboardSection(
+                ProjectGroup(DASHBOARD_SECTIONS[section_key][0], section_key),
+                counts.get(section_key, 0),
+                projects[section_key],
+                self.section_url(section_key),
+            )
+            for section_key in self.section_keys
+        ]
+
+    def page(self, key, page_number):
+        """
+        :return: a JSON-serializable dict of the given page of the section
+        with the given key: its projects, with the figures their cards show,
+        and where the section's pages end.
+        """
+        paginator = Paginator(self.get_section_queryset(key), DASHBOARD_PAGE_SIZE)
+        try:
+            page = paginator.page(page_number)
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        return {
+            'section': key,
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+            'next_page': page.next_page_number() if page.has_next() else None,
+            'projects': [self.project_card(project) for project in page],
+        }
+
+    @staticmethod
+    def project_card(project):
+        return {
+            'pk': project.pk,
+            'title': project.title,
+            'project_status': project.project_status,
+            'url': project.get_absolute_url(),
+            'funding_goal': project.funding_goal,
+            'amount_donated': project.amount_donated,
+            'percent_complete': project.percent_complete,
+            'donor_count': project.donor_count,
+        }
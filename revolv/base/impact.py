@@ -0,0 +1,142 @@
+"""
+RE-volv wide impact counters for the home page and the dashboards: how many
+people donated, how many projects were completed, how many people they (and
+all the projects) affect and how many distinct organic donors there are.
+
+Computing them takes several aggregate queries over all profiles, projects and
+payments, so they are kept in the cache instead. They are recomputed by the
+periodic revolv.tasks.global_impacts.refresh_global_impacts task and, shortly
+after payments or projects change, by the same task scheduled from the payment
+signal handlers. A request which misses the cache recomputes them, but only one
+request at a time does: the others wait for its result.
+
+A refresh scheduled inside a transaction is only enqueued once the transaction
+is over (when the request or Celery task finishes, see
+flush_global_impacts_refresh), and a broker which can't be reached is logged
+rather than failing whatever changed the payments or projects.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Sum
+
+from revolv.base.models import RevolvUserProfile
+from revolv.base.page_cache import invalidate_page_tags
+from revolv.payments.models import Payment
+from revolv.project.models import Project
+
+# change the suffix whenever the counters do, so that no old dict is read
+GLOBAL_IMPACTS_CACHE_KEY = 'revolv:global_impacts:2'
+# the periodic task refreshes the counters well within this
+GLOBAL_IMPACTS_TIMEOUT = 60 * 60
+
+# held by the one request which recomputes the counters on a cache miss
+GLOBAL_IMPACTS_LOCK_KEY = 'revolv:global_impacts:lock'
+GLOBAL_IMPACTS_LOCK_TIMEOUT = 30
+GLOBAL_IMPACTS_LOCK_POLLS = 20
+GLOBAL_IMPACTS_LOCK_POLL_INTERVAL = 0.1
+
+# payments and project changes within this many seconds share one refresh
+GLOBAL_IMPACTS_REFRESH_PENDING_KEY = 'revolv:global_impacts:refresh_pending'
+GLOBAL_IMPACTS_REFRESH_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+_pending = threading.local()
+
+
+def compute_global_impacts():
+    """
+    :return: a dict of the RE-volv wide impact counters, computed from the
+    database.
+    """
+    completed = Project.objects.get_completed()
+    return {
+        # users who have backed at least one project
+        'num_people_donated': RevolvUserProfile.objects.exclude(project=None).count(),
+        'num_projects_completed': completed.count(),
+        'num_people_affected': completed.aggregate(n=Sum('people_affected'))['n'] or 0,
+        'num_people_served': Project.objects.aggregate(n=Sum('people_affected'))['n'] or 0,
+        'num_organic_donors': Payment.objects.total_distinct_organic_donors(),
+    }
+
+
+def refresh_global_impacts():
+    """
+    Recompute the counters and store them in the cache, invalidating the
+    cached pages which show them.
+
+    :return: the counters
+    """
+    impacts = compute_global_impacts()
+    cache.set(GLOBAL_IMPACTS_CACHE_KEY, impacts, GLOBAL_IMPACTS_TIMEOUT)
+    invalidate_page_tags(['impacts'])
+    return impacts
+
+
+def get_global_impacts():
+    """
+    :return: the RE-volv wide impact counters (see compute_global_impacts),
+    from the cache if they are there.
+    """
+    impacts = cache.get(GLOBAL_IMPACTS_CACHE_KEY)
+    if impacts is not None:
+        return impacts
+    if cache.add(GLOBAL_IMPACTS_LOCK_KEY, True, GLOBAL_IMPACTS_LOCK_TIMEOUT):
+        try:
+            return refresh_global_impacts()
+        finally:
+            cache.delete(GLOBAL_IMPACTS_LOCK_KEY)
+    # another request is recomputing them: wait for its result rather than
+    # running the same queries alongside it
+    for _ in range(GLOBAL_IMPACTS_LOCK_POLLS):
+        time.sleep(GLOBAL_IMPACTS_LOCK_POLL_INTERVAL)
+        impacts = cache.get(GLOBAL_IMPACTS_CACHE_KEY)
+        if impacts is not None:
+            return impacts
+    return compute_global_impacts()
+
+
+def schedule_global_impacts_refresh(using=DEFAULT_DB_ALIAS):
+    """
+    Have the counters refreshed in the background soon, e.g. because a payment
+    was made. However many times this is called within
+    GLOBAL_IMPACTS_REFRESH_DELAY seconds, the counters are refreshed once.
+    Inside a transaction, the refresh is only enqueued once it is over (see
+    flush_global_impacts_refresh).
+    """
+    if connections[using].in_atomic_block:
+        _pending.refresh = True
+        return
+    enqueue_global_impacts_refresh()
+
+
+def flush_global_impacts_refresh(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Enqueue the refresh scheduled inside a transaction, unless the transaction
+    is still open. Connected to the end of every request and Celery task (see
+    revolv.base.signals), and takes any signal's keyword arguments.
+    """
+    if not getattr(_pending, 'refresh', False) or connections[using].in_atomic_block:
+        return
+    _pending.refresh = False
+    enqueue_global_impacts_refresh()
+
+
+def enqueue_global_impacts_refresh():
+    """
+    Enqueue the refresh task, unless one is already pending. Failing to reach
+    the broker is logged, not raised: the periodic task refreshes the counters
+    anyway.
+    """
+    from revolv.tasks.global_impacts import refresh_global_impacts as refresh_task
+    if not cache.add(GLOBAL_IMPACTS_REFRESH_PENDING_KEY, True, GLOBAL_IMPACTS_REFRESH_DELAY):
+        return
+    try:
+        refresh_task.apply_async(countdown=GLOBAL_IMPACTS_REFRESH_DELAY)
+    except Exception:
+        logger.exception("Couldn't schedule a refresh of the global impacts")
+        cache.delete(GLOBAL_IMPACTS_REFRESH_PENDING_KEY)
@@ -0,0 +1,53 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from revolv.payments.allocation import ALLOCATION_STRATEGIES, AllocationPlannerException, plan_allocation
+from revolv.tasks.reinvestment_allocation import calculate_montly_reinvesment_allocation
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-s",
+            "--strategy",
+            dest="strategy",
+            default=None,
+            help="How to split the balance between projects: one of %s." % ", ".join(sorted(ALLOCATION_STRATEGIES))
+        ),
+        make_option(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Only print the plan, don't enter repayments or change any caps."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        """
+        This handle function is run when the command "python manage.py allocatereinvestment"
+        is run.
+
+        It plans this month's reinvestment allocation (the Solar Seed Fund repayments of
+        completed projects, and the monthly reinvestment caps of active projects) and
+        prints it. Unless --dry-run is given, it then runs the monthly allocation task,
+        exactly as the scheduler does on the user reinvestment date.
+
+        Options:
+            --strategy [name]: the allocation strategy to use, by default
+                settings.REINVESTMENT_ALLOCATION_STRATEGY.
+            --dry-run: only print the plan.
+        """
+        strategy = options["strategy"] or settings.REINVESTMENT_ALLOCATION_STRATEGY
+        try:
+            plan = plan_allocation(strategy)
+        except AllocationPlannerException as e:
+            raise CommandError(str(e))
+        for line in plan.describe():
+            print "[AllocateReinvestment:Info] %s" % line
+        if options["dry_run"]:
+            return
+        calculate_montly_reinvesment_allocation(strategy)
+        print "[AllocateReinvestment:Info] Allocation applied."
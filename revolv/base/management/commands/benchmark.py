@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from revolv.base.benchmark import BENCHMARKS, BenchmarkError, compare_results, run_suite, SUITES
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-s",
+            "--suite",
+            dest="suite",
+            default="all",
+            help="The suite to run: one of %s." % ", ".join(SUITES)
+        ),
+        make_option(
+            "-b",
+            "--benchmark",
+            action="append",
+            dest="benchmarks",
+            default=[],
+            help="Only run this benchmark (may be given more than once)."
+        ),
+        make_option(
+            "-n",
+            "--iterations",
+            type="int",
+            dest="iterations",
+            default=5,
+            help="How many measured runs of every benchmark to make."
+        ),
+        make_option(
+            "--warmup",
+            type="int",
+            dest="warmup",
+            default=1,
+            help="How many unmeasured runs of every benchmark to make first."
+        ),
+        make_option(
+            "-o",
+            "--output",
+            dest="output",
+            default=None,
+            help="Where to write the results as JSON (benchmark-<suite>.json in the temp directory by default)."
+        ),
+        make_option(
+            "--baseline",
+            dest="baseline",
+            default=None,
+            help="The JSON results of an earlier run to compare the results with."
+        ),
+        make_option(
+            "--threshold",
+            type="float",
+            dest="threshold",
+            default=10.0,
+            help="How many percent slower than the baseline a benchmark may get before it fails."
+        ),
+        make_option(
+            "-l", "--list",
+            action="store_true",
+            dest="list",
+            default=False,
+            help="Show the available suites and benchmarks and exit."
+        ),
+        make_option(
+            "--quiet",
+            action="store_true",
+            dest="quiet",
+            default=False,
+            help="Don't print logging information."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        """
+        This handle function is run when the command "python manage.py benchmark" is run.
+
+        It runs a suite of benchmarks (see revolv.base.benchmark) of the monthly financial
+        pipeline and of the hot views against the synthetic data of "manage.py seed
+        --scale N", and writes the median and 95th percentile wall time, query count and
+        peak memory of every benchmark as JSON. Every run is rolled back, so the data is
+        left as it was.
+
+        To compare a branch with master, save the results of master and pass them as the
+        baseline of the branch's run: the command then prints the changes, and fails if a
+        benchmark got more than --threshold percent slower or makes more queries.
+
+        Options:
+            --suite [name]: the suite to run, "all" by default.
+            --benchmark [name]: only run the given benchmark(s) instead.
+            --iterations [n]: how many measured runs to make (5 by default).
+            --warmup [n]: how many unmeasured runs to make first (1 by default).
+            --output [path]: where to write the results (benchmark-<suite>.json in the
+                temp directory by default, so that they stay out of the checkout).
+            --baseline [path]: the results to compare with.
+            --threshold [percent]: how much slower than the baseline is a regression.
+            --list: list the suites and benchmarks and stop.
+            --quiet: don't print logging information.
+        """
+        def log(message):
+            """Log a message if the --quiet flag was not passed."""
+            if not options["quiet"]:
+                print message
+
+        if options["list"]:
+            for name, benchmarks in SUITES.items():
+                log("[Benchmark:Info] Suite %s: %s" % (name, ", ".join(benchmarks)))
+            for name, benchmark in BENCHMARKS.items():
+                log("[Benchmark:Info]    %-22s %s" % (name, benchmark.description))
+            return
+
+        if options["benchmarks"]:
+            names = options["benchmarks"]
+        elif options["suite"] in SUITES:
+            names = SUITES[options["suite"]]
+        else:
+            raise CommandError("There is no suite %s: use one of %s." % (options["suite"], ", ".join(SUITES)))
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError("There is no benchmark %s." % ", ".join(unknown))
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        try:
+            results = run_suite(names, options["iterations"], options["warmup"], log)
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        results["suite"] = options["suite"] if not options["benchmarks"] else None
+
+        output = options["output"] or os.path.join(tempfile.gettempdir(), "benchmark-%s.json" % options["suite"])
+        with open(output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+            output_file.write("\n")
+
+        for name, result in results["results"].items():
+            log("[Benchmark:Info] %-22s median %9.1f ms  p95 %9.1f ms  %6d queries  peak memory %8d kB" % (
+                name, result["median_ms"], result["p95_ms"], result["queries"], result["peak_memory_kb"]
+            ))
+        log("[Benchmark:Info] Wrote the results to %s." % output)
+
+        if baseline is not None:
+            lines, regressions = compare_results(results, baseline, options["threshold"])
+            for line in lines:
+                log("[Benchmark:Info] %s" % line)
+            if regressions:
+                raise CommandError("Regressions against %s: %s." % (options["baseline"], "; ".join(regressions)))
@@ -0,0 +1,52 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from revolv.project.models import Project, ProjectContribution, ProjectFundingTotals
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-p",
+            "--project",
+            action="append",
+            type="int",
+            dest="projects",
+            default=[],
+            help="Only rebuild the totals of the project with this id (may be given more than once)."
+        ),
+        make_option(
+            "--quiet",
+            action="store_true",
+            dest="quiet",
+            default=False,
+            help="Don't print logging information."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        """
+        This handle function is run when the command "python manage.py rebuildfundingtotals"
+        is run.
+
+        It recomputes the denormalized ProjectFundingTotals (amount donated, donated
+        organically, repaid, reinvested and donor count) of every project from the
+        Payment and AdminRepayment tables, and the ProjectContributions (each donor's
+        organic and reinvested totals and number of payments) to every project from the
+        Payment table. These are normally kept up to date by the payment signal
+        handlers, so this is only needed after loading data with signals disabled, or
+        if they are suspected to have drifted.
+
+        Options:
+            --project [id]: only rebuild the given project(s).
+            --quiet: don't print logging information.
+        """
+        queryset = Project.objects.all()
+        if options["projects"]:
+            queryset = queryset.filter(pk__in=options["projects"])
+        contributions = ProjectContribution.objects.rebuild(queryset)
+        totals = ProjectFundingTotals.objects.rebuild(queryset)
+        if not options["quiet"]:
+            print "[RebuildFundingTotals:Info] Rebuilt funding totals for %i project(s)." % len(totals)
+            print "[RebuildFundingTotals:Info] Rebuilt %i contribution(s)." % len(contributions)
@@ -0,0 +1,74 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from revolv.base.models import RevolvUserProfile
+from revolv.payments.models import USER_IMPACT_SNAPSHOT_VERSION, UserImpactSnapshot
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-u",
+            "--user",
+            action="append",
+            type="int",
+            dest="users",
+            default=[],
+            help="Only rebuild the snapshot of the user profile with this id (may be given more than once)."
+        ),
+        make_option(
+            "--stale",
+            action="store_true",
+            dest="stale",
+            default=False,
+            help="Only rebuild snapshots that are missing or of an older version."
+        ),
+        make_option(
+            "--batch-size",
+            type="int",
+            dest="batch_size",
+            default=500,
+            help="How many users to rebuild at a time."
+        ),
+        make_option(
+            "--quiet",
+            action="store_true",
+            dest="quiet",
+            default=False,
+            help="Don't print logging information."
+        ),
+    )
+
+    def handle(self, *args, **options):
+        """
+        This handle function is run when the command "python manage.py rebuildimpactsnapshots"
+        is run.
+
+        It recomputes the denormalized UserImpactSnapshot (impact, amount donated, amount
+        repaid and number of projects) of every user from the Payment, RepaymentFragment and
+        donor tables, and stamps it with the current USER_IMPACT_SNAPSHOT_VERSION. The
+        snapshots are normally kept up to date by the payment signal handlers, so this is
+        only needed after the version is bumped, after loading data with signals disabled,
+        or if the snapshots are suspected to have drifted.
+
+        Options:
+            --user [id]: only rebuild the given user(s).
+            --stale: only rebuild missing snapshots and snapshots of an older version.
+            --batch-size [n]: how many users to rebuild at a time.
+            --quiet: don't print logging information.
+        """
+        queryset = RevolvUserProfile.objects.all()
+        if options["users"]:
+            queryset = queryset.filter(pk__in=options["users"])
+        if options["stale"]:
+            current = UserImpactSnapshot.objects.filter(version__gte=USER_IMPACT_SNAPSHOT_VERSION)
+            queryset = queryset.exclude(pk__in=current.values('user'))
+        user_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        batch_size = options["batch_size"]
+        for start in range(0, len(user_ids), batch_size):
+            UserImpactSnapshot.objects.rebuild(user_ids[start:start + batch_size])
+        if not options["quiet"]:
+            print "[RebuildImpactSnapshots:Info] Rebuilt impact snapshots (version %i) for %i user(s)." % (
+                USER_IMPACT_SNAPSHOT_VERSION, len(user_ids)
+            )
@@ -4,9 +4,10 @@ from optparse import make_option
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.management.base import BaseCommand
-from django.db import IntegrityError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, IntegrityError
 from revolv.base.models import RevolvUserProfile
+from revolv.base.synthetic import clear_synthetic_data, synthetic_users, SyntheticDataGenerator
 from revolv.payments.models import Payment, ProjectMontlyRepaymentConfig
 from revolv.project.models import Project
 from revolv.revolv_cms.models import RevolvCustomPage, RevolvLinkPage
@@ -608,6 +609,22 @@ class Command(BaseCommand):
             default=False,
             help="Show available seeds and exit."
         ),
+        make_option(
+            "--scale",
+            action="store",
+            type="int",
+            dest="scale",
+            default=None,
+            help="Generate synthetic data at the given scale instead of running the seed specs."
+        ),
+        make_option(
+            "--random-seed",
+            action="store",
+            type="int",
+            dest="random_seed",
+            default=0,
+            help="Random seed of the synthetic data generated with --scale."
+        ),
     )
 
     def handle(self, *args, **options):
@@ -629,6 +646,13 @@ class Command(BaseCommand):
             --list: list available seed specs and stop.
             --quiet: don't print warnings, info notices, etc. Used mostly for keeping test
                 output clean.
+            --scale [n]: instead of running the seed specs, generate synthetic data at
+                production volume: 2000 users, 200 projects and 100,000 payments per unit
+                of scale, with their repayments and reinvestments (see
+                revolv.base.synthetic). This needs PostgreSQL, and bypasses the signals.
+                With --clear, delete the synthetic data instead.
+            --random-seed [n]: the random seed of the synthetic data (0 by default). The
+                same scale and seed always generate the same data.
         """
         def log(message):
             """Log a message if the --quiet flag was not passed."""
@@ -641,6 +665,10 @@ class Command(BaseCommand):
             log("[Seed:Info] Done.")
             return
 
+        if options["scale"] is not None:
+            self.handle_scale(options, log)
+            return
+
         if options["clear"]:
             verb = "Clearing"
         else:
@@ -663,3 +691,19 @@ class Command(BaseCommand):
             else:
                 spec.seed(quiet=options["quiet"])
         log("[Seed:Info] Done!")
+
+    def handle_scale(self, options, log):
+        """Generate (or with --clear, delete) the synthetic data of --scale."""
+        if connection.vendor != "postgresql":
+            raise CommandError("--scale needs PostgreSQL, not %s." % connection.vendor)
+        if options["clear"]:
+            log("[Seed:Info] Clearing synthetic data...")
+            clear_synthetic_data()
+        else:
+            if options["scale"] < 1:
+                raise CommandError("--scale must be at least 1.")
+            if synthetic_users().exists():
+                raise CommandError("There is synthetic data already: clear it first with --clear --scale 1.")
+            generator = SyntheticDataGenerator(options["scale"], options["random_seed"], log)
+            generator.seed()
+        log("[Seed:Info] Done!")
@@ -1,12 +1,14 @@
 import datetime
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models
 from django_facebook.models import FacebookModel
 
+from revolv.base.principal import Principal, invalidate_principals, invalidate_principals_on_commit
 from revolv.base.utils import get_group_by_name, get_profile
 from revolv.lib.utils import ImportProxy
 from revolv.payments.models import Payment
+from revolv.project.stats import KilowattStatsAggregator
 
 
 class RevolvUserProfileManager(models.Manager):
@@ -45,6 +47,59 @@ class RevolvUserProfileManager(models.Manager):
         ).order_by('user__date_joined')
         return subscribed_users
 
+    def load_principal(self, user_id):
+        """ Load the Principal (see revolv.base.principal) of the user with
+        the given User pk, with one query for just their profile's pk and
+        reinvest_pool and the names of their groups.
+        """
+        rows = self.filter(user_id=user_id).values_list('pk', 'reinvest_pool', 'user__groups__name')
+        if not rows:
+            raise self.model.DoesNotExist()
+        roles = Principal.DONOR
+        for profile_id, reinvest_pool, group_name in rows:
+            if group_name == self.model.AMBASSADOR_GROUP:
+                roles |= Principal.AMBASSADOR
+            elif group_name == self.model.ADMIN_GROUP:
+                roles |= Principal.ADMINISTRATOR
+        return Principal(profile_id, user_id, roles, reinvest_pool)
+
+    def set_reinvest_pools(self, balances, batch_size=500):
+        """ Set the reinvest_pool of many users at once, using one UPDATE per
+        batch of users instead of loading and saving every profile.
+
+        reinvest_pool is a projection of the reinvestment ledger, so this should
+        only be called by revolv.payments.models.ReinvestLedgerEntryManager,
+        which holds a lock on the users' rows while it does.
+
+        :balances: A dict mapping RevolvUserProfile pks to their new reinvest_pool
+        :batch_size: The maximum number of users to update per statement
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        pool = qn(self.model._meta.get_field('reinvest_pool').column)
+        pk = qn(self.model._meta.pk.column)
+        user_ids = sorted(balances)
+        cursor = connection.cursor()
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            params = []
+            for user_id in batch:
+                params.extend([user_id, float(balances[user_id])])
+            params.extend(batch)
+            cursor.execute(
+                'UPDATE %(table)s SET %(pool)s = CASE %(pk)s %(cases)s END '
+                'WHERE %(pk)s IN (%(ids)s)' % {
+                    'table': table,
+                    'pool': pool,
+                    'pk': pk,
+                    'cases': ' '.join(['WHEN %s THEN %s'] * len(batch)),
+                    'ids': ', '.join(['%s'] * len(batch)),
+                },
+                params
+            )
+        invalidate_principals_on_commit(user_ids, using=self.db)
+
 
 class RevolvUserProfile(FacebookModel):
     """
@@ -84,17 +139,58 @@ class RevolvUserProfile(FacebookModel):
 
     address = models.CharField(max_length=255, null=True, blank=True)
 
+    def __init__(self, *args, **kwargs):
+        super(RevolvUserProfile, self).__init__(*args, **kwargs)
+        # what the ledger last said, to tell when reinvest_pool is set by hand
+        # (read from __dict__, so that a deferred reinvest_pool isn't loaded)
+        self._ledger_reinvest_pool = self.__dict__.get('reinvest_pool')
+
+    def set_ledger_balance(self, balance):
+        """
+        Update this instance's reinvest_pool to the balance the reinvestment
+        ledger has (or will have) for the user. Only meant for
+        revolv.payments.models.ReinvestLedgerEntryManager and the payment
+        effects.
+        """
+        self.reinvest_pool = self._ledger_reinvest_pool = balance
+
+    def save(self, *args, **kwargs):
+        """
+        reinvest_pool is a projection of the user's reinvestment ledger (see
+        revolv.payments.models.ReinvestLedgerEntry), so when updating a profile
+        we never write back this instance's (possibly stale) copy of it, and a
+        reinvest_pool changed by hand raises ValueError instead of being lost:
+        the pool can only be changed through ReinvestLedgerEntry.objects.record
+        (or credit).
+        """
+        inserting = self.pk is None or kwargs.get('force_insert')
+        pool = self.__dict__.get('reinvest_pool')
+        if inserting:
+            changed = bool(pool)
+        else:
+            changed = self._ledger_reinvest_pool is not None and pool != self._ledger_reinvest_pool
+        update_fields = kwargs.get('update_fields')
+        if changed and (update_fields is None or 'reinvest_pool' in update_fields):
+            raise ValueError(
+                "%s's reinvest_pool can only be changed through the reinvestment ledger "
+                "(ReinvestLedgerEntry.objects.record)" % self
+            )
+        if not inserting and update_fields is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'reinvest_pool'
+            ]
+        super(RevolvUserProfile, self).save(*args, **kwargs)
+
     def is_donor(self):
         """Return whether the associated user can donate."""
         return True
 
     def is_ambassador(self):
-        return get_group_by_name(
-            self.AMBASSADOR_GROUP
-        ) in self.user.groups.all()
+        return self.user.groups.filter(name=self.AMBASSADOR_GROUP).exists()
 
     def is_administrator(self):
-        return get_group_by_name(self.ADMIN_GROUP) in self.user.groups.all()
+        return self.user.groups.filter(name=self.ADMIN_GROUP).exists()
 
     def make_administrator(self):
         self.user.groups.add(get_group_by_name(self.AMBASSADOR_GROUP))
@@ -102,6 +198,7 @@ class RevolvUserProfile(FacebookModel):
         self.user.is_staff = True
         self.user.is_superuser = True
         self.user.save()
+        invalidate_principals([self.pk])
 
     def make_ambassador(self):
         self.user.is_staff = False
@@ -109,6 +206,7 @@ class RevolvUserProfile(FacebookModel):
         self.user.groups.remove(get_group_by_name(self.ADMIN_GROUP))
         self.user.groups.add(get_group_by_name(self.AMBASSADOR_GROUP))
         self.user.save()
+        invalidate_principals([self.pk])
 
     def make_donor(self):
         """Take away all the user's permissions."""
@@ -117,21 +215,15 @@ class RevolvUserProfile(FacebookModel):
         self.user.groups.remove(get_group_by_name(self.ADMIN_GROUP))
         self.user.groups.remove(get_group_by_name(self.AMBASSADOR_GROUP))
         self.user.save()
+        invalidate_principals([self.pk])
 
     def get_statistic_for_user(self, attr):
-        """Calculates a user's individual impact by iterating through all the users payments, calculating
-        what fraction of that project comprises of this user's donation, and calculates individual
-        user impact using the statistics attribute (a KilowattStatsAggregator) and the fraction."""
-        all_payments = Payment.objects.payments(user=self)
-        user_impact = 0
-        for payment in all_payments:
-            project = payment.project
-            user_financial_contribution = payment.amount
-            project_funding_total = (int)(project.funding_goal)
-            project_impact = getattr(project.statistics, attr)
-            user_impact_for_project = project_impact * user_financial_contribution * 1.0 / project_funding_total
-            user_impact += user_impact_for_project
-        return user_impact
+        """Calculates a user's individual impact: for each of the user's payments, what fraction
+        of that project's funding goal the payment comprises, times the project's impact for the
+        given statistics attribute (of a KilowattStatsAggregator). All of the user's payments are
+        summed up with one query (see PaymentManager.impact_kilowatts)."""
+        kilowatts = Payment.objects.impact_kilowatts([self])[self.pk]
+        return getattr(KilowattStatsAggregator(kilowatts), attr)
 
     def get_full_name(self):
         name = '{0} {1}'.format(self.user.first_name.strip(), self.user.last_name.strip())
@@ -0,0 +1,149 @@
+"""
+Whole-page caching of the public pages (the home page, the project list, the
+pages of active and completed projects and the CMS pages) for anonymous
+visitors, who all get exactly the same page.
+
+Every cached page is tagged with what it shows (e.g. 'projects', 'project:12',
+'cms'), and every tag has a version in the cache which is part of the keys of
+the pages tagged with it. invalidate_page_tags bumps the versions of tags, so
+that none of the pages cached under the old versions is served again:
+
+    * 'projects' and 'project:<pk>' whenever a project's cache version is
+      bumped (see ProjectManager.bump_cache_versions), i.e. when the project,
+      its payments, updates, donation levels or categories change
+    * 'impacts' whenever the global impact counters are refreshed
+    * 'cms' whenever a Wagtail page is published, unpublished, saved or
+      deleted, or a site or setting is saved (see revolv.revolv_cms.signals),
+      which also makes the cached menus and settings stale (see
+      revolv.revolv_cms.menus and revolv.revolv_cms.site_settings)
+
+Pages are never cached for (or served from the cache to) logged in users,
+sessions with pending flash messages, requests other than GET and HEAD or
+with a query string, or responses which aren't 200s, set cookies or use a CSRF token
+(which is why the cached pages only render their forms for logged in users).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import get_language
+
+PAGE_CACHE_KEY = 'revolv:page:%s'
+PAGE_TAG_VERSION_KEY = 'revolv:page_tag:%s:version'
+
+
+def get_page_cache_timeout():
+    return getattr(settings, 'ANONYMOUS_PAGE_CACHE_TIMEOUT', 60 * 60)
+
+
+def page_tag_versions(tags):
+    """
+    :return: a dict mapping each of the given tags to its current version,
+    with one cache lookup. Tags without a version yet get one based on the
+    current time, so that they never repeat an old version.
+    """
+    keys = dict((PAGE_TAG_VERSION_KEY % tag, tag) for tag in tags)
+    versions = cache.get_many(keys.keys())
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        initial = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, initial, None)
+        versions.update(cache.get_many(missing))
+    return dict((tag, versions.get(key, 0)) for key, tag in keys.items())
+
+
+def invalidate_page_tags(tags):
+    """
+    Make every cached page tagged with any of the given tags stale.
+    """
+    for tag in set(tags):
+        key = PAGE_TAG_VERSION_KEY % tag
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def is_cacheable_request(request):
+    """
+    :return: whether the page for this request may be served from (and stored
+    in) the page cache.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # every distinct query string (tracking parameters, cache busters) would
+    # otherwise get its own copy of the page, so anybody could fill the cache
+    if request.META.get('QUERY_STRING'):
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return False
+    # the pending messages would be shown on (and then missing from) the page
+    if len(messages.get_messages(request)):
+        return False
+    return True
+
+
+def is_cacheable_response(request, response):
+    return (
+        response.status_code == 200 and
+        not response.cookies and
+        not request.META.get('CSRF_COOKIE_USED') and
+        not response.has_header('Cache-Control')
+    )
+
+
+def page_cache_key(request, tags):
+    """
+    :return: the cache key of the page for this request, under the current
+    versions of its tags.
+    """
+    versions = page_tag_versions(tags)
+    parts = [request.get_host(), request.path, get_language() or '']
+    parts.extend('%s=%s' % (tag, versions[tag]) for tag in sorted(versions))
+    return PAGE_CACHE_KEY % hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def serve_from_page_cache(request, tags, view, *args, **kwargs):
+    """
+    Serve the page for this request from the page cache, or call view (with
+    the request and the given arguments) and cache its response, if both are
+    cacheable.
+
+    :tags: the tags of the page
+    """
+    if not is_cacheable_request(request):
+        return view(request, *args, **kwargs)
+    key = page_cache_key(request, tags)
+    response = cache.get(key)
+    if response is not None:
+        return response
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    if is_cacheable_response(request, response):
+        # the page is different for logged in users
+        patch_vary_headers(response, ('Cookie',))
+        cache.set(key, response, get_page_cache_timeout())
+    return response
+
+
+def cache_anonymous_page(tags):
+    """
+    Decorator caching a view's pages for anonymous visitors.
+
+    :tags: the tags of the view's pages, or a function taking the view's
+        arguments (request included) and returning them.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            page_tags = tags(request, *args, **kwargs) if callable(tags) else tags
+            return serve_from_page_cache(request, page_tags, view, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,123 @@
+"""
+The principal of a request: the little that most views need to know about
+the logged in user (their RevolvUserProfile's pk, their roles and their
+reinvest_pool), without loading the whole RevolvUserProfile or looking up
+their groups.
+
+A principal is loaded with one narrow query (see
+RevolvUserProfileManager.load_principal) and cached by profile pk, and the
+profile pk is kept in the user's session, so most requests get it from the
+cache without any query. It is invalidated whenever the user's roles change
+(RevolvUserProfile.make_administrator, make_ambassador and make_donor, or any
+other change to their groups) or their reinvest_pool does
+(RevolvUserProfileManager.set_reinvest_pools).
+
+A principal invalidated inside a transaction can be cached again, with the
+old reinvest_pool, by a concurrent request before the transaction commits, so
+invalidate_principals_on_commit also remembers the pks and invalidates them
+again once the outermost transaction is over: when the request or Celery task
+finishes, or sooner if the caller calls flush_pending_principals.
+"""
+import threading
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRINCIPAL_CACHE_KEY = 'revolv:principal:%s'
+PRINCIPAL_SESSION_KEY = '_revolv_profile_id'
+PRINCIPAL_CACHE_TIMEOUT = 60 * 60
+
+_pending = threading.local()
+
+
+class Principal(object):
+    """
+    The pk, roles and reinvest_pool of a RevolvUserProfile (see the roles
+    described there).
+
+    :roles: a bitmask of DONOR, AMBASSADOR and ADMINISTRATOR
+    """
+    DONOR = 1
+    AMBASSADOR = 2
+    ADMINISTRATOR = 4
+
+    def __init__(self, profile_id, user_id, roles, reinvest_pool):
+        self.profile_id = profile_id
+        self.user_id = user_id
+        self.roles = roles
+        self.reinvest_pool = reinvest_pool
+
+    def is_donor(self):
+        return bool(self.roles & self.DONOR)
+
+    def is_ambassador(self):
+        return bool(self.roles & self.AMBASSADOR)
+
+    def is_administrator(self):
+        return bool(self.roles & self.ADMINISTRATOR)
+
+    def __repr__(self):
+        return '<Principal: %s>' % self.profile_id
+
+
+def invalidate_principals(profile_ids):
+    """
+    Forget the cached principals of the given RevolvUserProfile pks.
+    """
+    cache.delete_many([PRINCIPAL_CACHE_KEY % profile_id for profile_id in profile_ids])
+
+
+def invalidate_principals_on_commit(profile_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Forget the cached principals of the given RevolvUserProfile pks now and,
+    if this runs inside a transaction, again once it is over (see
+    flush_pending_principals), so that a principal cached by a concurrent
+    request before the transaction committed doesn't outlive it.
+    """
+    profile_ids = list(profile_ids)
+    invalidate_principals(profile_ids)
+    if connections[using].in_atomic_block:
+        if not hasattr(_pending, 'profile_ids'):
+            _pending.profile_ids = set()
+        _pending.profile_ids.update(profile_ids)
+
+
+def flush_pending_principals(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Forget the cached principals left to invalidate_principals_on_commit, unless
+    the transaction that changed them is still open. Connected to the end of
+    every request and Celery task (see revolv.base.signals), and takes any
+    signal's keyword arguments.
+    """
+    profile_ids = getattr(_pending, 'profile_ids', None)
+    if not profile_ids or connections[using].in_atomic_block:
+        return
+    _pending.profile_ids = set()
+    invalidate_principals(profile_ids)
+
+
+def get_principal(request):
+    """
+    :return: the Principal of the request's user, or None if they aren't
+    logged in. The principal is kept on the request, so it is only looked up
+    once per request.
+    """
+    # revolv.base.models invalidates principals, so it can't be imported here
+    from revolv.base.models import RevolvUserProfile
+
+    if hasattr(request, '_revolv_principal'):
+        return request._revolv_principal
+    user = getattr(request, 'user', None)
+    principal = None
+    if user is not None and user.is_authenticated():
+        session = getattr(request, 'session', None)
+        profile_id = session.get(PRINCIPAL_SESSION_KEY) if session is not None else None
+        if profile_id is not None:
+            principal = cache.get(PRINCIPAL_CACHE_KEY % profile_id)
+        if principal is None or principal.user_id != user.pk:
+            principal = RevolvUserProfile.objects.load_principal(user.pk)
+            cache.set(PRINCIPAL_CACHE_KEY % principal.profile_id, principal, PRINCIPAL_CACHE_TIMEOUT)
+            if session is not None and profile_id != principal.profile_id:
+                session[PRINCIPAL_SESSION_KEY] = principal.profile_id
+    request._revolv_principal = principal
+    return principal
@@ -0,0 +1,211 @@
+"""
+On-demand profiling of single requests by administrators.
+
+An administrator gets a signed token from the administrator:profiles page and
+adds it to any request, as the PROFILE_PARAM query parameter or the
+PROFILE_HEADER header:
+
+    /what-we-do/projects/?_profile=<token>
+
+RequestProfilerMiddleware then profiles the request under cProfile, from its
+process_request to its process_response, and stores a capture in
+REQUEST_PROFILE_ROOT (/profiles/ in the checkout by default, which git
+ignores):
+
+    <capture>.json       what was profiled: the method, path, user and times
+    <capture>.txt        the REQUEST_PROFILE_TOP_N functions with the highest
+                         cumulative time, as printed by pstats
+    <capture>.collapsed  the call stacks in the collapsed format of
+                         flamegraph.pl and speedscope, one 'a;b;c <us>' line
+                         per stack
+
+Only the last REQUEST_PROFILE_KEEP captures are kept. Tokens are only valid
+for the administrator they were made for, and expire after
+REQUEST_PROFILE_TOKEN_MAX_AGE seconds. Requests without a token only pay for
+the lookup of the parameter and the header.
+
+The request goes through the handler as any other, so the profile covers the
+view and everything the handler does around it: the process_view,
+process_exception and process_template_response of the middleware, the
+transaction of ATOMIC_REQUESTS and the rendering of a TemplateResponse. It
+doesn't cover the process_request and process_response of the middleware
+listed before RequestProfilerMiddleware, which is why it comes last.
+"""
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import time
+import uuid
+from cStringIO import StringIO
+
+from django.conf import settings
+from django.core import signing
+
+from revolv.base.principal import get_principal
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_REVOLV_PROFILE'
+PROFILE_SALT = 'revolv.base.request_profiler'
+
+CAPTURE_EXTENSIONS = ('json', 'txt', 'collapsed')
+
+
+def get_profile_root():
+    return getattr(settings, 'REQUEST_PROFILE_ROOT', os.path.join(settings.PROJECT_ROOT, 'profiles'))
+
+
+def make_profile_token(principal):
+    """
+    :return: a token which has the requests of the given administrator's
+    Principal profiled.
+    """
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign(str(principal.profile_id))
+
+
+def is_profile_token_valid(token, principal):
+    """
+    :return: whether the token was made for the given Principal, who is still
+    an administrator, and hasn't expired.
+    """
+    if principal is None or not principal.is_administrator():
+        return False
+    max_age = getattr(settings, 'REQUEST_PROFILE_TOKEN_MAX_AGE', 60 * 60)
+    try:
+        profile_id = signing.TimestampSigner(salt=PROFILE_SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return profile_id == str(principal.profile_id)
+
+
+def collapsed_stacks(stats, min_microseconds=10):
+    """
+    :return: the lines of the collapsed call stacks of the given pstats.Stats.
+
+    cProfile only records who called whom, not whole stacks, so the time of a
+    function called from many places is split between the stacks leading to it
+    in proportion to the cumulative time of each of its callers' calls.
+    """
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, (cc, nc, tt, ct, callers) in stats.stats.items() if not callers]
+
+    def label(func):
+        filename, line, name = func
+        if filename == '~':
+            return name
+        return '%s:%s(%s)' % (os.path.basename(filename), line, name)
+
+    totals = {}
+    # (func, share of the func's time spent in this stack, stack, funcs in the stack)
+    pending = [(root, 1.0, (label(root),), frozenset([root])) for root in roots]
+    while pending:
+        func, share, stack, path = pending.pop()
+        cc, nc, tt, ct, callers = stats.stats[func]
+        microseconds = int(tt * share * 1000000)
+        if microseconds >= min_microseconds:
+            key = ';'.join(stack)
+            totals[key] = totals.get(key, 0) + microseconds
+        for callee, edge_ct in callees.get(func, []):
+            callee_ct = stats.stats[callee][3]
+            if callee in path or not callee_ct:
+                continue
+            callee_share = share * edge_ct / callee_ct
+            if callee_share * callee_ct * 1000000 < min_microseconds:
+                continue
+            pending.append((callee, callee_share, stack + (label(callee),), path | frozenset([callee])))
+    return ['%s %d' % (stack_key, value) for stack_key, value in sorted(totals.items())]
+
+
+def save_capture(profiler, request, elapsed, principal):
+    """
+    Store the capture of the profiled request, and delete the oldest ones.
+
+    :return: the name of the capture
+    """
+    root = get_profile_root()
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    started = datetime.datetime.now()
+    name = '%s-%s' % (started.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+
+    stream = StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(getattr(settings, 'REQUEST_PROFILE_TOP_N', 50))
+    with open(os.path.join(root, '%s.txt' % name), 'w') as stats_file:
+        stats_file.write(stream.getvalue())
+    with open(os.path.join(root, '%s.collapsed' % name), 'w') as collapsed_file:
+        collapsed_file.write('\n'.join(collapsed_stacks(stats)) + '\n')
+    with open(os.path.join(root, '%s.json' % name), 'w') as meta_file:
+        json.dump({
+            'name': name,
+            'method': request.method,
+            'path': request.path,
+            'profile_id': principal.profile_id,
+            'created_at': started.isoformat(),
+            'time_ms': round(elapsed * 1000, 3),
+        }, meta_file)
+
+    for old in list_captures()[getattr(settings, 'REQUEST_PROFILE_KEEP', 50):]:
+        for extension in CAPTURE_EXTENSIONS:
+            path = capture_path(old['name'], extension)
+            if os.path.exists(path):
+                os.remove(path)
+    return name
+
+
+def list_captures():
+    """
+    :return: the metadata of the stored captures, the most recent first.
+    """
+    root = get_profile_root()
+    if not os.path.isdir(root):
+        return []
+    captures = []
+    for filename in sorted(os.listdir(root), reverse=True):
+        if filename.endswith('.json'):
+            with open(os.path.join(root, filename)) as meta_file:
+                captures.append(json.load(meta_file))
+    return captures
+
+
+def capture_path(name, extension):
+    """
+    :return: the path of the file of the capture with the given name and
+    extension (one of CAPTURE_EXTENSIONS).
+    """
+    return os.path.join(get_profile_root(), '%s.%s' % (os.path.basename(name), extension))
+
+
+class RequestProfilerMiddleware(object):
+    """
+    Profile the requests of administrators which carry a profile token, as
+    described above. It has to come after the authentication middleware, and
+    should come last in MIDDLEWARE_CLASSES.
+    """
+
+    def process_request(self, request):
+        token = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+        if not token:
+            return None
+        principal = get_principal(request)
+        if not is_profile_token_valid(token, principal):
+            return None
+
+        profiler = cProfile.Profile()
+        request._request_profile = (profiler, time.time(), principal)
+        profiler.enable()
+        return None
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_request_profile'):
+            return response
+        profiler, started, principal = request._request_profile
+        profiler.disable()
+        del request._request_profile
+        elapsed = time.time() - started
+        response['X-Revolv-Profile'] = save_capture(profiler, request, elapsed, principal)
+        return response
@@ -1,7 +1,11 @@
-from django.db.models.signals import post_delete, post_save
+from celery.signals import task_postrun
+from django.core.signals import request_finished
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django_facebook.utils import get_user_model
+from revolv.base.impact import flush_global_impacts_refresh
 from revolv.base.models import RevolvUserProfile
+from revolv.base.principal import flush_pending_principals, invalidate_principals
 
 
 @receiver(post_save, sender=get_user_model())
@@ -22,3 +26,29 @@ def delete_profile_of_user(sender, instance, **kwargs):
         RevolvUserProfile.objects.get(user=instance).delete()
     except:
         pass
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    When users are added to or removed from groups (e.g. in the admin), forget
+    their cached principals (see revolv.base.principal), whose roles come from
+    their groups.
+    """
+    if action == 'pre_clear':
+        user_ids = instance.user_set.values_list('pk', flat=True) if reverse else [instance.pk]
+    elif action in ('post_add', 'post_remove'):
+        user_ids = pk_set if reverse else [instance.pk]
+    else:
+        return
+    invalidate_principals(
+        RevolvUserProfile.objects.filter(user_id__in=list(user_ids)).values_list('pk', flat=True)
+    )
+
+
+# principals changed inside a transaction are invalidated again once it is over
+request_finished.connect(flush_pending_principals, dispatch_uid='revolv.base.flush_pending_principals')
+task_postrun.connect(flush_pending_principals, dispatch_uid='revolv.base.flush_pending_principals')
+# and the global impacts refreshes scheduled inside one are enqueued
+request_finished.connect(flush_global_impacts_refresh, dispatch_uid='revolv.base.flush_global_impacts_refresh')
+task_postrun.connect(flush_global_impacts_refresh, dispatch_uid='revolv.base.flush_global_impacts_refresh')
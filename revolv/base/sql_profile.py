@@ -0,0 +1,159 @@
+"""
+Per-request SQL instrumentation.
+
+SQLProfileMiddleware records the SQL statements every request runs (by
+turning on the debug cursor of the database connections for the duration of
+the request) and summarizes them into a profile:
+
+    {
+        'method': 'GET', 'path': '/project/1/', 'status': 200,
+        'time_ms': 84.2, 'queries': 23, 'sql_time_ms': 31.0,
+        'slowest': [{'fingerprint': 'SELECT ... WHERE email = ?', 'time_ms': 12.0}, ...],
+        'repeated': [{'fingerprint': 'SELECT ... WHERE id = ?', 'count': 10, 'time_ms': 9.0}, ...],
+    }
+
+The statements are only ever kept as their fingerprint, their sql with the
+literals replaced by placeholders, so that no session data, password hash or
+email address ends up in the logs or the endpoint. They are grouped by
+fingerprint, and a fingerprint run at least
+SQL_PROFILE_REPEAT_THRESHOLD times in one request is reported as repeated:
+that is the shape of an N+1 query, one statement per object of a list.
+
+Every profile is logged as one JSON line (at WARNING when it has repeated
+statements) and kept in a ring buffer of the last SQL_PROFILE_BUFFER_SIZE
+profiles, which administrators can read from the administrator:sql_profile
+endpoint. The buffer is per process, so it holds the requests served by the
+process that answers the endpoint.
+
+Profiling is off unless SQL_PROFILE_ENABLED is set (it is in the dev
+settings, which the tests use). With SQL_PROFILE_STRICT (meant for tests, e.g.
+with override_settings), a request with repeated statements raises
+NPlusOneError instead.
+"""
+import json
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_profiles = deque(maxlen=getattr(settings, 'SQL_PROFILE_BUFFER_SIZE', 200))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(Exception):
+    """
+    Raised in strict mode (SQL_PROFILE_STRICT) by a request which ran a
+    statement of the same fingerprint too many times.
+    """
+    pass
+
+
+def fingerprint(sql):
+    """
+    :return: the sql with its string and number literals replaced by ?, its IN
+    lists collapsed and its whitespace normalized, so that the statements which
+    only differ by their parameters have the same fingerprint.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def summarize_queries(queries):
+    """
+    :return: the query count, total time, slowest statements and repeated
+    fingerprints of the given queries (dicts of their sql and time in seconds,
+    as in connection.queries), as in the profiles described above.
+    """
+    threshold = getattr(settings, 'SQL_PROFILE_REPEAT_THRESHOLD', 5)
+    slowest = getattr(settings, 'SQL_PROFILE_SLOWEST', 5)
+    statements = [(query['sql'], float(query['time']) * 1000) for query in queries]
+
+    fingerprints = OrderedDict()
+    for sql, time_ms in statements:
+        shape = fingerprint(sql)
+        count, total_ms = fingerprints.get(shape, (0, 0.0))
+        fingerprints[shape] = (count + 1, total_ms + time_ms)
+
+    return {
+        'queries': len(statements),
+        'sql_time_ms': round(sum(time_ms for sql, time_ms in statements), 3),
+        'slowest': [
+            {'fingerprint': fingerprint(slow_sql), 'time_ms': round(slow_ms, 3)}
+            for slow_sql, slow_ms in sorted(statements, key=lambda statement: -statement[1])[:slowest]
+        ],
+        'repeated': [
+            {'fingerprint': repeated_shape, 'count': repeated_count, 'time_ms': round(repeated_ms, 3)}
+            for repeated_shape, (repeated_count, repeated_ms) in sorted(
+                fingerprints.items(), key=lambda item: -item[1][0]
+            )
+            if repeated_count >= threshold
+        ],
+    }
+
+
+def recent_profiles():
+    """
+    :return: the profiles of the last requests served by this process, the
+    most recent first.
+    """
+    return list(reversed(_profiles))
+
+
+class SQLProfileMiddleware(object):
+    """
+    Profile the SQL of every request, as described above. It should come first
+    in MIDDLEWARE_CLASSES, so that the queries of the other middleware are
+    profiled too.
+    """
+
+    def process_request(self, request):
+        if not getattr(settings, 'SQL_PROFILE_ENABLED', False):
+            return
+        cursors = {}
+        for connection in connections.all():
+            cursors[connection.alias] = (connection.use_debug_cursor, len(connection.queries))
+            connection.use_debug_cursor = True
+        request._sql_profile = (time.time(), cursors)
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_sql_profile'):
+            return response
+        started, cursors = request._sql_profile
+        del request._sql_profile
+
+        queries = []
+        for connection in connections.all():
+            if connection.alias not in cursors:
+                continue
+            use_debug_cursor, start = cursors[connection.alias]
+            queries.extend(connection.queries[start:])
+            connection.use_debug_cursor = use_debug_cursor
+
+        profile = OrderedDict([
+            ('method', request.method),
+            ('path', request.path),
+            ('status', response.status_code),
+            ('time_ms', round((time.time() - started) * 1000, 3)),
+        ])
+        profile.update(summarize_queries(queries))
+        _profiles.append(profile)
+
+        level = logging.WARNING if profile['repeated'] else logging.INFO
+        logger.log(level, 'sql_profile %s', json.dumps(profile))
+
+        if profile['repeated'] and getattr(settings, 'SQL_PROFILE_STRICT', False):
+            raise NPlusOneError('%s %s ran %s' % (request.method, request.path, '; '.join(
+                '%s x %s' % (repeated['count'], repeated['fingerprint']) for repeated in profile['repeated']
+            )))
+        return response
@@ -0,0 +1,661 @@
+"""
+Synthetic data at production volume, for `manage.py seed --scale N`.
+
+Every unit of scale adds USERS_PER_SCALE users, PROJECTS_PER_SCALE projects
+and PAYMENTS_PER_SCALE donations, so e.g. --scale 10 makes 20,000 users, 2,000
+projects and a million donations, together with what follows from them: the
+projects' repayment configs and AdminRepayments, their RepaymentFragments,
+AdminReinvestments and UserReinvestments spending the fragments, and the
+users' reinvestment ledgers. The data is skewed like the real data: a few
+donors and projects get most of the donations, and donation amounts are
+log-normal.
+
+The data only depends on the scale and the random seed (and on the current
+date, which the projects' dates are relative to). Synthetic users are named
+SYNTHETIC_PREFIX_<n> (their password is 'password') and synthetic projects are
+titled "Synthetic Project <n>".
+
+The rows are inserted with COPY (so this needs PostgreSQL) and with a few
+INSERT ... SELECT statements, without saving any model, so none of the
+signals which keep the denormalized tables up to date run. Those tables are
+rebuilt at the end instead, the way the rebuildfundingtotals and
+rebuildimpactsnapshots commands rebuild them.
+"""
+import bisect
+import collections
+import datetime
+import math
+import random
+from cStringIO import StringIO
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import AutoField, Max
+from django.utils import timezone
+
+from revolv.base.impact import refresh_global_impacts
+from revolv.base.models import RevolvUserProfile
+from revolv.base.page_cache import invalidate_page_tags
+from revolv.payments.models import (AdminReinvestment, AdminRepayment, Payment, PaymentType,
+                                    ProjectMontlyRepaymentConfig, ReinvestLedgerEntry, RepaymentFragment,
+                                    UserImpactSnapshot, UserReinvestment)
+from revolv.project.models import Category, Project, ProjectContribution, ProjectFundingTotals
+
+SYNTHETIC_PREFIX = 'synthetic'
+SYNTHETIC_PROJECT_TITLE = 'Synthetic Project %d'
+
+USERS_PER_SCALE = 2000
+PROJECTS_PER_SCALE = 200
+PAYMENTS_PER_SCALE = 100000
+
+# status -> relative share of the projects
+PROJECT_STATUSES = [
+    (Project.COMPLETED, 45),
+    (Project.ACTIVE, 25),
+    (Project.PROPOSED, 10),
+    (Project.STAGED, 5),
+    (Project.DRAFTED, 15),
+]
+
+# donation amounts are log-normal, with a median of about $33
+DONATION_MU = 3.5
+DONATION_SIGMA = 1.0
+
+COPY_BATCH_SIZE = 50000
+REBUILD_BATCH_SIZE = 500
+
+SyntheticProject = collections.namedtuple('SyntheticProject', 'pk status funding_goal start end')
+
+
+def copy_value(value):
+    """
+    :return: value in the text format of COPY.
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    if not isinstance(value, unicode):
+        value = unicode(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r').encode('utf-8')
+
+
+class CopyWriter(object):
+    """
+    Insert rows into the table of a model with COPY, COPY_BATCH_SIZE rows at a
+    time. The rows are dicts of field attnames to values, and the fields
+    missing from them get their defaults. With with_pk=False, the table's
+    sequence picks the pks.
+
+        with CopyWriter(Payment) as payments:
+            payments.write({'project_id': 1, ...})
+    """
+
+    def __init__(self, model, with_pk=True):
+        self.model = model
+        self.fields = [
+            field for field in model._meta.local_concrete_fields
+            if with_pk or not isinstance(field, AutoField)
+        ]
+        self.defaults = {}
+        for field in self.fields:
+            default = field.get_default()
+            if default is None and not field.null and field.empty_strings_allowed:
+                default = ''
+            self.defaults[field.attname] = default
+        self.buffer = StringIO()
+        self.pending = 0
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def write(self, row):
+        self.buffer.write('\t'.join(
+            copy_value(row[field.attname] if field.attname in row else self.defaults[field.attname])
+            for field in self.fields
+        ))
+        self.buffer.write('\n')
+        self.pending += 1
+        if self.pending >= COPY_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        qn = connection.ops.quote_name
+        self.buffer.seek(0)
+        connection.cursor().copy_expert('COPY %s (%s) FROM STDIN' % (
+            qn(self.model._meta.db_table), ', '.join(qn(field.column) for field in self.fields)
+        ), self.buffer)
+        self.count += self.pending
+        self.buffer = StringIO()
+        self.pending = 0
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def synthetic_users():
+    return User.objects.filter(username__startswith='%s_' % SYNTHETIC_PREFIX)
+
+
+def synthetic_projects():
+    return Project.objects.filter(title__startswith=SYNTHETIC_PROJECT_TITLE.split('%')[0])
+
+
+class WeightedChoice(object):
+    """
+    Pick items at random, in proportion to their weights.
+    """
+
+    def __init__(self, rng, items, weights):
+        self.rng = rng
+        self.items = items
+        self.cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def pick(self):
+        return self.items[bisect.bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+
+
+class SyntheticDataGenerator(object):
+    """
+    Generates the synthetic data of a scale, as described above.
+    """
+
+    def __init__(self, scale, random_seed=0, log=None):
+        self.scale = scale
+        self.rng = random.Random(random_seed)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.today = timezone.localtime(self.now).date()
+
+    def next_pk(self, model):
+        """
+        :return: the first pk of model after all the existing ones. The rows
+        inserted with explicit pks from there are all synthetic, since this
+        runs in a transaction.
+        """
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def datetime_on(self, day):
+        """
+        :return: a random (UTC) time of the given day.
+        """
+        return datetime.datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + datetime.timedelta(
+            seconds=self.rng.randint(0, 86399)
+        )
+
+    def seed(self):
+        with transaction.atomic():
+            self.seed_users()
+            self.seed_projects()
+            self.seed_donations()
+            self.rebuild_contributions()
+            self.seed_repayments()
+            self.seed_reinvestments()
+            self.seed_ledger()
+            self.seed_donors()
+            self.rebuild()
+            cursor = connection.cursor()
+            for sql in connection.ops.sequence_reset_sql(no_style(), [
+                User, RevolvUserProfile, Project, AdminReinvestment, UserReinvestment
+            ]):
+                cursor.execute(sql)
+        # refresh the planner's statistics, which are way off after the bulk load
+        connection.cursor().execute('ANALYZE')
+        refresh_global_impacts()
+        invalidate_page_tags(['projects'])
+
+    def seed_users(self):
+        count = USERS_PER_SCALE * self.scale
+        self.log("[Seed:Info] Generating %i users..." % count)
+        password = make_password('password')
+        first_user = self.next_pk(User)
+        self.first_profile = self.next_pk(RevolvUserProfile)
+        self.profile_ids = range(self.first_profile, self.first_profile + count)
+        admin_count = max(1, count // 500)
+        ambassador_count = max(1, count // 100)
+        self.admin_ids = self.profile_ids[:admin_count]
+        self.ambassador_ids = self.profile_ids[admin_count:admin_count + ambassador_count]
+        admin_group, _ = Group.objects.get_or_create(name=RevolvUserProfile.ADMIN_GROUP)
+        ambassador_group, _ = Group.objects.get_or_create(name=RevolvUserProfile.AMBASSADOR_GROUP)
+        categories = list(Category.objects.values_list('pk', flat=True))
+
+        with CopyWriter(User) as users, CopyWriter(RevolvUserProfile) as profiles, \
+                CopyWriter(User.groups.through, with_pk=False) as groups, \
+                CopyWriter(RevolvUserProfile.preferred_categories.through, with_pk=False) as preferences:
+            for i in range(count):
+                user_id = first_user + i
+                profile_id = self.first_profile + i
+                joined = self.now - datetime.timedelta(seconds=self.rng.randint(0, 4 * 365 * 86400))
+                is_admin = i < admin_count
+                users.write({
+                    'id': user_id,
+                    'password': password,
+                    'last_login': joined,
+                    'is_superuser': False,
+                    'username': '%s_%d' % (SYNTHETIC_PREFIX, i),
+                    'first_name': 'Synthetic',
+                    'last_name': 'User %d' % i,
+                    'email': '%s_%d@example.com' % (SYNTHETIC_PREFIX, i),
+                    'is_staff': is_admin,
+                    'is_active': True,
+                    'date_joined': joined,
+                })
+                profiles.write({
+                    'id': profile_id,
+                    'user_id': user_id,
+                    'subscribed_to_newsletter': self.rng.random() < 0.3,
+                    'subscribed_to_updates': True,
+                    'reinvest_pool': 0.0,
+                })
+                if is_admin:
+                    groups.write({'user_id': user_id, 'group_id': admin_group.pk})
+                elif i < admin_count + ambassador_count:
+                    groups.write({'user_id': user_id, 'group_id': ambassador_group.pk})
+                if categories and self.rng.random() < 0.2:
+                    preferences.write({'revolvuserprofile_id': profile_id, 'category_id': self.rng.choice(categories)})
+
+    def seed_projects(self):
+        count = PROJECTS_PER_SCALE * self.scale
+        self.log("[Seed:Info] Generating %i projects..." % count)
+        first_project = self.next_pk(Project)
+        self.first_project = first_project
+        statuses = WeightedChoice(self.rng, [status for status, _ in PROJECT_STATUSES],
+                                  [share for _, share in PROJECT_STATUSES])
+        categories = list(Category.objects.values_list('pk', flat=True))
+
+        # every funded project gets a popularity, and a goal in line with the
+        # donations it can expect from it
+        drafts = [(first_project + i, statuses.pick()) for i in range(count)]
+        weights = dict(
+            (pk, self.rng.paretovariate(1.2)) for pk, status in drafts
+            if status in (Project.ACTIVE, Project.COMPLETED)
+        )
+        total_weight = sum(weights.values()) or 1.0
+        mean_donation = math.exp(DONATION_MU + DONATION_SIGMA ** 2 / 2)
+        total_donated = PAYMENTS_PER_SCALE * self.scale * mean_donation
+
+        self.projects = []
+        with CopyWriter(Project) as projects, CopyWriter(Category.projects.through, with_pk=False) as project_categories:
+            for i, (pk, status) in enumerate(drafts):
+                if status == Project.COMPLETED:
+                    start = self.today - datetime.timedelta(days=self.rng.randint(400, 1100))
+                    end = start + datetime.timedelta(days=60)
+                    goal = total_donated * weights[pk] / total_weight * 0.9
+                elif status == Project.ACTIVE:
+                    start = self.today - datetime.timedelta(days=self.rng.randint(1, 50))
+                    end = self.today + datetime.timedelta(days=self.rng.randint(10, 90))
+                    goal = total_donated * weights[pk] / total_weight * 1.6
+                else:
+                    start = self.today - datetime.timedelta(days=1) if status == Project.STAGED else None
+                    end = self.today + datetime.timedelta(days=self.rng.randint(30, 120))
+                    goal = self.rng.uniform(5000, 50000)
+                goal = Decimal('%.2f' % max(1000.0, round(goal, -2)))
+                ambassador = self.rng.choice(self.ambassador_ids)
+                created = self.datetime_on(start or self.today - datetime.timedelta(days=self.rng.randint(1, 60)))
+                projects.write({
+                    'id': pk,
+                    'funding_goal': goal,
+                    'title': SYNTHETIC_PROJECT_TITLE % i,
+                    'tagline': 'Solar panels for synthetic organization %d.' % i,
+                    'video_url': 'https://www.youtube.com/watch?v=9bZkp7q19f0',
+                    'impact_power': round(self.rng.uniform(5.0, 120.0), 1),
+                    'solar_url': 'http://home.solarlog-web.net/1445.html',
+                    'location': '%d Bowditch St, Berkeley, CA 94704, United States' % (i + 1),
+                    'location_latitude': Decimal('%.14f' % self.rng.uniform(25.0, 48.0)),
+                    'location_longitude': Decimal('%.14f' % self.rng.uniform(-123.0, -70.0)),
+                    'created_at': created,
+                    'updated_at': created,
+                    'end_date': end,
+                    'start_date': start,
+                    'project_status': status,
+                    'cover_photo': '',
+                    'org_start_date': datetime.date(self.rng.randint(1950, 2010), 1, 1),
+                    'org_name': 'Synthetic Organization %d' % i,
+                    'people_affected': self.rng.randint(10, 5000),
+                    'mission_statement': 'We do solar!',
+                    'org_about': 'A synthetic organization.',
+                    'description': '<p>A synthetic project.</p>',
+                    'created_by_user_id': ambassador,
+                    'ambassador_id': ambassador,
+                    'actual_energy': round(self.rng.uniform(0.0, 100.0), 1) if status == Project.COMPLETED else 0.0,
+                    'internal_rate_return': Decimal('%.2f' % self.rng.uniform(2.0, 8.0)),
+                    'monthly_reinvestment_cap': float(goal) * 0.1 if status == Project.ACTIVE else 0.0,
+                    'is_paid_off': status == Project.COMPLETED,
+                })
+                if categories:
+                    project_categories.write({'category_id': self.rng.choice(categories), 'project_id': pk})
+                self.projects.append(SyntheticProject(pk, status, float(goal), start, end))
+        self.project_weights = weights
+
+    def seed_donations(self):
+        count = PAYMENTS_PER_SCALE * self.scale
+        self.log("[Seed:Info] Generating %i donations..." % count)
+        funded = [project for project in self.projects if project.pk in self.project_weights]
+        if not funded:
+            return
+        projects = WeightedChoice(self.rng, funded, [self.project_weights[project.pk] for project in funded])
+        donors = WeightedChoice(self.rng, self.profile_ids, [self.rng.paretovariate(1.1) for _ in self.profile_ids])
+        paypal = PaymentType.objects.get_paypal().pk
+        stripe = PaymentType.objects.get_stripe().pk
+        check = PaymentType.objects.get_check().pk
+
+        with CopyWriter(Payment, with_pk=False) as payments:
+            for i in range(count):
+                project = projects.pick()
+                user = donors.pick()
+                roll = self.rng.random()
+                if roll < 0.02:
+                    # an anonymous check, entered by an administrator
+                    user, entrant, payment_type = None, self.rng.choice(self.admin_ids), check
+                elif roll < 0.07:
+                    user, entrant, payment_type = user, self.rng.choice(self.admin_ids), check
+                else:
+                    entrant, payment_type = user, paypal if roll < 0.45 else stripe
+                last_day = min(project.end, self.today) if project.status == Project.COMPLETED else self.today
+                day = project.start + datetime.timedelta(days=self.rng.randint(0, (last_day - project.start).days))
+                payments.write({
+                    'user_id': user,
+                    'project_id': project.pk,
+                    'entrant_id': entrant,
+                    'payment_type_id': payment_type,
+                    'created_at': self.datetime_on(day),
+                    'amount': round(max(5.0, self.rng.lognormvariate(DONATION_MU, DONATION_SIGMA)), 2),
+                })
+
+    def seed_repayments(self):
+        """
+        Completed projects get their repayment configs and monthly
+        AdminRepayments, and every AdminRepayment is split into
+        RepaymentFragments between the project's donors, in proportion to their
+        organic donations (as RepaymentFragment.objects.create_for_admin_repayment
+        would).
+        """
+        self.log("[Seed:Info] Generating repayments...")
+        year = self.today.year
+        latest = self.today - datetime.timedelta(days=40)
+        with CopyWriter(ProjectMontlyRepaymentConfig, with_pk=False) as configs, \
+                CopyWriter(AdminRepayment, with_pk=False) as repayments:
+            for project in self.projects:
+                if project.status != Project.COMPLETED:
+                    continue
+                monthly = round(project.funding_goal * 0.008, 2)
+                configs.write({'project_id': project.pk, 'year': year,
+                               'repayment_type': ProjectMontlyRepaymentConfig.SOLAR_SEED_FUND, 'amount': monthly})
+                configs.write({'project_id': project.pk, 'year': year,
+                               'repayment_type': ProjectMontlyRepaymentConfig.REVOLVE_OVERHEAD,
+                               'amount': round(project.funding_goal * 0.002, 2)})
+                months = min(24, (latest - project.end).days // 30)
+                for month in range(1, months + 1):
+                    repayments.write({
+                        'amount': monthly,
+                        'admin_id': self.rng.choice(self.admin_ids),
+                        'project_id': project.pk,
+                        'created_at': self.datetime_on(project.end + datetime.timedelta(days=30 * month)),
+                    })
+
+        contributions = ProjectContribution
+        connection.cursor().execute(
+            'INSERT INTO {fragment} ({f_user}, {f_project}, {f_repayment}, {f_amount}, {f_created}) '
+            'SELECT c.{c_user}, r.{r_project}, r.{r_id}, r.{r_amount} * c.{c_organic} / t.total, r.{r_created} '
+            'FROM {repayment} r '
+            'JOIN {contribution} c ON c.{c_project} = r.{r_project} '
+            'JOIN (SELECT {c_project} AS project_id, SUM({c_organic}) AS total FROM {contribution} '
+            '      GROUP BY {c_project}) t ON t.project_id = r.{r_project} '
+            'WHERE r.{r_project} >= %s AND c.{c_organic} > 0'.format(
+                fragment=table(RepaymentFragment),
+                f_user=column(RepaymentFragment, 'user'),
+                f_project=column(RepaymentFragment, 'project'),
+                f_repayment=column(RepaymentFragment, 'admin_repayment'),
+                f_amount=column(RepaymentFragment, 'amount'),
+                f_created=column(RepaymentFragment, 'created_at'),
+                repayment=table(AdminRepayment),
+                r_id=column(AdminRepayment, 'id'),
+                r_project=column(AdminRepayment, 'project'),
+                r_amount=column(AdminRepayment, 'amount'),
+                r_created=column(AdminRepayment, 'created_at'),
+                contribution=table(contributions),
+                c_user=column(contributions, 'user'),
+                c_project=column(contributions, 'project'),
+                c_organic=column(contributions, 'organic_total'),
+            ),
+            [self.first_project]
+        )
+
+    def seed_reinvestments(self):
+        """
+        Spend some of the repaid money: administrators reinvest it into some of
+        the active projects (pooling the users with money to reinvest, as
+        AdminReinvestment.objects.pool_reinvestors would), and some users
+        reinvest their own.
+        """
+        self.log("[Seed:Info] Generating reinvestments...")
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT {user}, SUM({amount}) FROM {fragment} WHERE {project} >= %s GROUP BY {user} ORDER BY {user}'.format(
+                fragment=table(RepaymentFragment),
+                user=column(RepaymentFragment, 'user'),
+                amount=column(RepaymentFragment, 'amount'),
+                project=column(RepaymentFragment, 'project'),
+            ),
+            [self.first_project]
+        )
+        balances = collections.OrderedDict(cursor.fetchall())
+        active = [project for project in self.projects if project.status == Project.ACTIVE]
+        if not balances or not active:
+            return
+        reinvestment_type = PaymentType.objects.get_reinvestment_fragment().pk
+        first_admin_reinvestment = self.next_pk(AdminReinvestment)
+        first_user_reinvestment = self.next_pk(UserReinvestment)
+        recently = self.today - datetime.timedelta(days=30)
+        reinvestors = collections.deque(balances)
+
+        with CopyWriter(AdminReinvestment) as admin_reinvestments, \
+                CopyWriter(UserReinvestment) as user_reinvestments, \
+                CopyWriter(Payment, with_pk=False) as payments:
+            for i, project in enumerate(self.rng.sample(active, len(active) // 3)):
+                reinvestment_id = first_admin_reinvestment + i
+                admin = self.rng.choice(self.admin_ids)
+                created = self.datetime_on(recently + datetime.timedelta(days=self.rng.randint(0, 29)))
+                needed = round(project.funding_goal * self.rng.uniform(0.01, 0.05), 2)
+                pooled = 0.0
+                for _ in range(len(reinvestors)):
+                    if pooled >= needed:
+                        break
+                    user_id = reinvestors[0]
+                    reinvestors.rotate(-1)
+                    amount = round(min(balances[user_id], needed - pooled), 2)
+                    if amount <= 0.0:
+                        continue
+                    balances[user_id] -= amount
+                    pooled += amount
+                    payments.write({
+                        'user_id': user_id,
+                        'project_id': project.pk,
+                        'entrant_id': admin,
+                        'payment_type_id': reinvestment_type,
+                        'created_at': created,
+                        'admin_reinvestment_id': reinvestment_id,
+                        'amount': amount,
+                    })
+                if pooled:
+                    admin_reinvestments.write({
+                        'id': reinvestment_id,
+                        'amount': pooled,
+                        'admin_id': admin,
+                        'project_id': project.pk,
+                        'created_at': created,
+                    })
+
+            i = 0
+            for user_id, balance in balances.items():
+                if balance < 1.0 or self.rng.random() >= 0.05:
+                    continue
+                reinvestment_id = first_user_reinvestment + i
+                i += 1
+                project = self.rng.choice(active)
+                amount = round(balance * self.rng.uniform(0.2, 0.8), 2)
+                created = self.datetime_on(recently + datetime.timedelta(days=self.rng.randint(0, 29)))
+                user_reinvestments.write({
+                    'id': reinvestment_id,
+                    'amount': amount,
+                    'user_id': user_id,
+                    'project_id': project.pk,
+                    'created_at': created,
+                })
+                payments.write({
+                    'user_id': user_id,
+                    'project_id': project.pk,
+                    'entrant_id': user_id,
+                    'payment_type_id': reinvestment_type,
+                    'created_at': created,
+                    'user_reinvestment_id': reinvestment_id,
+                    'amount': amount,
+                })
+
+    def seed_ledger(self):
+        """
+        Record the fragments and reinvestments in the users' reinvestment
+        ledgers, with their running balances, and set the users'
+        reinvest_pools to their final balances.
+        """
+        self.log("[Seed:Info] Generating reinvestment ledgers...")
+        cursor = connection.cursor()
+        ledger = ReinvestLedgerEntry
+        columns = ', '.join(column(ledger, name) for name in (
+            'user', 'entry_type', 'amount', 'balance', 'repayment_fragment', 'payment', 'created_at'
+        ))
+        # one INSERT, in chronological order, so that the entries' pks are in
+        # the order of their running balances (see ReinvestLedgerEntryManager.balances)
+        cursor.execute(
+            'INSERT INTO {ledger} ({columns}) SELECT * FROM ('
+            '  SELECT {f_user}, %s, {f_amount}, 0.0, {f_id}, NULL::integer, {f_created} FROM {fragment} '
+            '  WHERE {f_project} >= %s '
+            '  UNION ALL '
+            '  SELECT {p_user}, %s, {p_amount}, 0.0, NULL::integer, {p_id}, {p_created} FROM {payment} '
+            '  WHERE {p_project} >= %s AND {p_type} = %s'
+            ') entries ORDER BY 7, 5, 6'.format(
+                ledger=table(ledger), columns=columns,
+                fragment=table(RepaymentFragment), f_user=column(RepaymentFragment, 'user'),
+                f_amount=column(RepaymentFragment, 'amount'), f_id=column(RepaymentFragment, 'id'),
+                f_created=column(RepaymentFragment, 'created_at'), f_project=column(RepaymentFragment, 'project'),
+                payment=table(Payment), p_user=column(Payment, 'user'), p_amount=column(Payment, 'amount'),
+                p_id=column(Payment, 'id'), p_created=column(Payment, 'created_at'),
+                p_project=column(Payment, 'project'), p_type=column(Payment, 'payment_type'),
+            ),
+            [ledger.CREDIT, self.first_project,
+             ledger.DEBIT, self.first_project, PaymentType.objects.get_reinvestment_fragment().pk]
+        )
+
+        signed = 'CASE WHEN {entry_type} = %s THEN {amount} ELSE -{amount} END'.format(
+            entry_type=column(ledger, 'entry_type'), amount=column(ledger, 'amount')
+        )
+        cursor.execute(
+            'UPDATE {ledger} SET {balance} = running.balance FROM ('
+            '  SELECT {id}, SUM({signed}) OVER (PARTITION BY {user} ORDER BY {id}) AS balance '
+            '  FROM {ledger} WHERE {user} >= %s'
+            ') running WHERE {ledger}.{id} = running.{id}'.format(
+                ledger=table(ledger), balance=column(ledger, 'balance'), id=column(ledger, 'id'),
+                signed=signed, user=column(ledger, 'user'),
+            ),
+            [ledger.CREDIT, self.first_profile]
+        )
+        cursor.execute(
+            'UPDATE {profile} SET {pool} = totals.balance FROM ('
+            '  SELECT {user} AS user_id, SUM({signed}) AS balance FROM {ledger} WHERE {user} >= %s GROUP BY {user}'
+            ') totals WHERE {profile}.{id} = totals.user_id'.format(
+                profile=table(RevolvUserProfile), pool=column(RevolvUserProfile, 'reinvest_pool'),
+                id=column(RevolvUserProfile, 'id'), user=column(ledger, 'user'), signed=signed,
+                ledger=table(ledger),
+            ),
+            [ledger.CREDIT, self.first_profile]
+        )
+
+    def seed_donors(self):
+        """
+        Make every user who paid into a project one of its donors.
+        """
+        through = Project.donors.through
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT INTO {donors} ({d_project}, {d_user}) '
+            'SELECT DISTINCT {project}, {user} FROM {payment} WHERE {project} >= %s AND {user} IS NOT NULL'.format(
+                donors=table(through), d_project=column(through, 'project'),
+                d_user=column(through, 'revolvuserprofile'), payment=table(Payment),
+                project=column(Payment, 'project'), user=column(Payment, 'user'),
+            ),
+            [self.first_project]
+        )
+
+    def rebuild_contributions(self):
+        for start in range(0, len(self.projects), REBUILD_BATCH_SIZE):
+            batch = [project.pk for project in self.projects[start:start + REBUILD_BATCH_SIZE]]
+            ProjectContribution.objects.rebuild(Project.objects.filter(pk__in=batch))
+
+    def rebuild(self):
+        """
+        Rebuild the denormalized tables of the synthetic projects and users.
+        """
+        self.log("[Seed:Info] Rebuilding contributions, funding totals and impact snapshots...")
+        self.rebuild_contributions()
+        for start in range(0, len(self.projects), REBUILD_BATCH_SIZE):
+            batch = [project.pk for project in self.projects[start:start + REBUILD_BATCH_SIZE]]
+            ProjectFundingTotals.objects.rebuild(Project.objects.filter(pk__in=batch))
+        for start in range(0, len(self.profile_ids), REBUILD_BATCH_SIZE):
+            UserImpactSnapshot.objects.rebuild(self.profile_ids[start:start + REBUILD_BATCH_SIZE])
+
+
+def clear_synthetic_data():
+    """
+    Delete all the synthetic users and projects, and everything of theirs,
+    without running any signal.
+    """
+    projects = synthetic_projects()
+    profiles = RevolvUserProfile.objects.filter(user__in=synthetic_users())
+    with transaction.atomic():
+        for queryset in [
+            ReinvestLedgerEntry.objects.filter(user__in=profiles),
+            Payment.objects.filter(project__in=projects),
+            RepaymentFragment.objects.filter(project__in=projects),
+            AdminRepayment.objects.filter(project__in=projects),
+            AdminReinvestment.objects.filter(project__in=projects),
+            UserReinvestment.objects.filter(project__in=projects),
+            ProjectMontlyRepaymentConfig.objects.filter(project__in=projects),
+            ProjectContribution.objects.filter(project__in=projects),
+            ProjectFundingTotals.objects.filter(project__in=projects),
+            Project.donors.through.objects.filter(project__in=projects),
+            Category.projects.through.objects.filter(project__in=projects),
+            projects,
+            UserImpactSnapshot.objects.filter(user__in=profiles),
+            RevolvUserProfile.preferred_categories.through.objects.filter(revolvuserprofile__in=profiles),
+            profiles,
+            User.groups.through.objects.filter(user__in=synthetic_users()),
+            synthetic_users(),
+        ]:
+            queryset._raw_delete(queryset.db)
+    refresh_global_impacts()
+    invalidate_page_tags(['projects'])
@@ -0,0 +1,73 @@
+import mock
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase
+from revolv.base.impact import (GLOBAL_IMPACTS_CACHE_KEY, GLOBAL_IMPACTS_REFRESH_PENDING_KEY, get_global_impacts,
+                                refresh_global_impacts)
+from revolv.base.models import RevolvUserProfile
+from revolv.payments.models import Payment
+from revolv.project.models import Project
+
+
+class GlobalImpactsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_global_impacts(self):
+        """Test that the counters are computed once, then read from the cache."""
+        donor = RevolvUserProfile.factories.base.create()
+        Project.factories.completed.create(people_affected=30)
+        Payment.factories.base.create(user=donor, entrant=donor)
+        cache.delete(GLOBAL_IMPACTS_CACHE_KEY)
+
+        impacts = get_global_impacts()
+        self.assertEqual(impacts['num_projects_completed'], 1)
+        self.assertEqual(impacts['num_people_affected'], 30)
+        self.assertEqual(impacts['num_people_donated'], 1)
+        self.assertEqual(impacts['num_organic_donors'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_global_impacts(), impacts)
+
+    def test_refresh(self):
+        """Test that refreshing the counters replaces the cached ones."""
+        get_global_impacts()
+        Project.factories.completed.create(people_affected=10)
+        refresh_global_impacts()
+        self.assertEqual(get_global_impacts()['num_people_affected'], 10)
+
+    @mock.patch('revolv.tasks.global_impacts.refresh_global_impacts.apply_async')
+    def test_refresh_scheduled_after_commit(self, apply_async):
+        """
+        Test that a refresh scheduled by a payment is only enqueued once the
+        transaction is over, and that a project edit which can't change the
+        counters doesn't schedule one.
+        """
+        donor = RevolvUserProfile.factories.base.create()
+        project = Project.factories.active.create()
+        Payment.factories.base.create(user=donor, entrant=donor, project=project)
+        # the test's transaction is still open
+        request_finished.send(sender=self.__class__)
+        self.assertFalse(apply_async.called)
+
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+            request_finished.send(sender=self.__class__)
+        self.assertEqual(apply_async.call_count, 1)
+
+        cache.delete(GLOBAL_IMPACTS_REFRESH_PENDING_KEY)
+        project.title = 'A new title'
+        project.save()
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+            request_finished.send(sender=self.__class__)
+        self.assertEqual(apply_async.call_count, 1)
+
+    @mock.patch('revolv.tasks.global_impacts.refresh_global_impacts.apply_async', side_effect=IOError('no broker'))
+    def test_refresh_without_broker(self, apply_async):
+        """Test that a refresh which can't be enqueued is logged, not raised, and can be tried again."""
+        donor = RevolvUserProfile.factories.base.create()
+        Payment.factories.base.create(user=donor, entrant=donor)
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+            request_finished.send(sender=self.__class__)
+        self.assertTrue(apply_async.called)
+        self.assertEqual(Payment.objects.filter(user=donor).count(), 1)
+        self.assertIsNone(cache.get(GLOBAL_IMPACTS_REFRESH_PENDING_KEY))
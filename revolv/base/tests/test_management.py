@@ -1,9 +1,17 @@
+import json
+import os
+import shutil
+import tempfile
+
+import mock
 from django.contrib.auth.models import User
 from django.core.management import call_command
+from django.db.models import Sum
 from django.test import TestCase
 from revolv.base.models import RevolvUserProfile
-from revolv.payments.models import Payment
-from revolv.project.models import Project
+from revolv.payments.models import (USER_IMPACT_SNAPSHOT_VERSION, Payment, ReinvestLedgerEntry, RepaymentFragment,
+                                    UserImpactSnapshot)
+from revolv.project.models import Project, ProjectContribution
 from revolv.revolv_cms.models import MainPageSettings
 
 
@@ -78,3 +86,73 @@ class SeedTest(TestCase):
         self.assertEqual(RevolvUserProfile.objects.count(), profile_count)
         self.assertEqual(Project.objects.count(), project_count)
         self.assertEqual(Payment.objects.count(), payment_count)
+
+
+@mock.patch.multiple(
+    "revolv.base.synthetic", USERS_PER_SCALE=50, PROJECTS_PER_SCALE=10, PAYMENTS_PER_SCALE=1000, COPY_BATCH_SIZE=100
+)
+class SyntheticSeedTest(TestCase):
+    def payment_total(self):
+        return Payment.objects.aggregate(total=Sum("amount"))["total"]
+
+    def test_seed_scale(self):
+        """Test that seed --scale generates consistent data, deterministically, and --clear deletes it."""
+        user_count = User.objects.count()
+        project_count = Project.objects.count()
+        payment_count = Payment.objects.count()
+
+        call_command("seed", scale=2, random_seed=7, quiet=True)
+        self.assertEqual(User.objects.count(), user_count + 100)
+        self.assertEqual(Project.objects.count(), project_count + 20)
+        self.assertGreaterEqual(Payment.objects.count(), payment_count + 2000)
+        self.assertTrue(RepaymentFragment.objects.exists())
+        self.assertEqual(
+            Project.donors.through.objects.count(),
+            ProjectContribution.objects.count()
+        )
+        for profile in RevolvUserProfile.objects.filter(reinvestledgerentry__isnull=False).distinct()[:20]:
+            balance = ReinvestLedgerEntry.objects.balances([profile.pk])[profile.pk]
+            self.assertAlmostEqual(profile.reinvest_pool, balance, places=5)
+        total = self.payment_total()
+
+        call_command("seed", scale=2, random_seed=7, clear=True, quiet=True)
+        self.assertEqual(User.objects.count(), user_count)
+        self.assertEqual(Project.objects.count(), project_count)
+        self.assertEqual(Payment.objects.count(), payment_count)
+
+        call_command("seed", scale=2, random_seed=7, quiet=True)
+        self.assertAlmostEqual(self.payment_total(), total, places=2)
+
+    def test_benchmark(self):
+        """Test that manage.py benchmark writes its results, leaves the data as it was and compares baselines."""
+        call_command("seed", scale=2, random_seed=7, quiet=True)
+        payment_count = Payment.objects.count()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        output = os.path.join(root, "baseline.json")
+
+        call_command("benchmark", benchmarks=["admin_repayment", "aggregate_stats", "home"], iterations=2,
+                     output=output, quiet=True)
+        self.assertEqual(Payment.objects.count(), payment_count)
+        with open(output) as output_file:
+            results = json.load(output_file)["results"]
+        self.assertEqual(sorted(results), ["admin_repayment", "aggregate_stats", "home"])
+        self.assertGreater(results["admin_repayment"]["queries"], 0)
+        self.assertLessEqual(results["home"]["median_ms"], results["home"]["p95_ms"])
+
+        call_command("benchmark", benchmarks=["aggregate_stats"], iterations=1, baseline=output, threshold=1000000.0,
+                     output=os.path.join(root, "results.json"), quiet=True)
+
+
+class RebuildImpactSnapshotsTest(TestCase):
+    def test_rebuild(self):
+        """Test that manage.py rebuildimpactsnapshots builds missing and outdated snapshots."""
+        donor = RevolvUserProfile.factories.base.create()
+        Payment.factories.base.create(user=donor, entrant=donor, amount=20.0)
+        UserImpactSnapshot.objects.filter(user=donor).delete()
+
+        call_command("rebuildimpactsnapshots", stale=True, quiet=True)
+        snapshot = UserImpactSnapshot.objects.get(user=donor)
+        self.assertEqual(snapshot.version, USER_IMPACT_SNAPSHOT_VERSION)
+        self.assertEqual(snapshot.total_donated, 20.0)
+        self.assertEqual(snapshot.project_count, 1)
@@ -3,6 +3,10 @@ from django.test import TestCase
 from revolv.base.models import RevolvUserProfile
 from revolv.base.utils import get_group_by_name
 from revolv.lib.testing import TestUserMixin, UserTestingMixin
+from revolv.payments.models import Payment
+from revolv.project.models import Project
+from revolv.project.stats import KilowattStatsAggregator
+from revolv.project.utils import user_impact_stats
 
 
 class RevolvUserProfileManagerTestCase(TestCase):
@@ -17,6 +21,27 @@ class RevolvUserProfileManagerTestCase(TestCase):
         self.assertEqual(context[0].user.email, "revolv@gmail.com")
 
 
+class RevolvUserProfileImpactTestCase(TestCase):
+    """Tests for computing a user's impact."""
+
+    def test_statistic_for_user(self):
+        """Test that a user's impact is their share of each project's funding goal times its impact."""
+        donor, other = RevolvUserProfile.factories.base.create_batch(2)
+        project1 = Project.factories.base.create(funding_goal=100.0, impact_power=10.0)
+        project2 = Project.factories.base.create(funding_goal=50.0, impact_power=40.0)
+        Payment.factories.base.create(user=donor, entrant=donor, project=project1, amount=50.0)
+        Payment.factories.base.create(user=donor, entrant=donor, project=project2, amount=5.0)
+
+        expected = KilowattStatsAggregator(9.0)
+        self.assertAlmostEqual(
+            donor.get_statistic_for_user("kilowatt_hours_per_month"), expected.kilowatt_hours_per_month
+        )
+        with self.assertNumQueries(1):
+            impact = user_impact_stats([donor, other])
+        self.assertAlmostEqual(impact[donor.pk]["acres_of_trees_saved_per_year"], expected.acres_of_trees_saved_per_year)
+        self.assertEqual(impact[other.pk]["kilowatts"], 0.0)
+
+
 class UserPermissionsTestCase(TestCase):
 
     def setUp(self):
@@ -0,0 +1,103 @@
+from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from wagtail.wagtailcore.models import Site
+from revolv.base.page_cache import invalidate_page_tags, is_cacheable_request, page_cache_key
+from revolv.lib.testing import TestUserMixin
+from revolv.payments.models import Payment
+from revolv.project.models import DonationLevel, Project
+from revolv.revolv_cms.models import RevolvCustomPage
+
+
+class PageCacheTestCase(TestUserMixin, TestCase):
+    def setUp(self):
+        super(PageCacheTestCase, self).setUp()
+        cache.clear()
+
+    def test_anonymous_pages_are_cached(self):
+        """Test that anonymous visitors get the cached page until a project changes."""
+        project = Project.factories.base.create(project_status=Project.ACTIVE, funding_goal=10000.0)
+        url = reverse('projects_list')
+        with CaptureQueriesContext(connection) as rendered:
+            first = self.client.get(url)
+        with CaptureQueriesContext(connection) as cached:
+            second = self.client.get(url)
+        self.assertLess(len(cached), len(rendered))
+        self.assertEqual(first.content, second.content)
+        self.assertIn('Cookie', second['Vary'])
+
+        Payment.factories.donation.create(project=project, amount=4321.0)
+        self.assertContains(self.client.get(url), '$4,321')
+
+    def assertCached(self, url):
+        """Assert that the second anonymous request for the url is served from the cache."""
+        with CaptureQueriesContext(connection) as rendered:
+            first = self.client.get(url)
+        with CaptureQueriesContext(connection) as cached:
+            second = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertLess(len(cached), len(rendered))
+        self.assertEqual(first.content, second.content)
+
+    def test_project_page_is_cached(self):
+        """Test that a project's page, donation levels included, is cached until it gets a donation."""
+        project = Project.factories.base.create(project_status=Project.ACTIVE, funding_goal=10000.0)
+        DonationLevel.objects.create(project=project, description='A thank you card', amount=50)
+        url = reverse('project:view', kwargs={'pk': project.pk})
+        self.assertCached(url)
+
+        Payment.factories.donation.create(project=project, amount=4321.0)
+        self.assertContains(self.client.get(url), '$4,321')
+
+    def test_cms_page_is_cached(self):
+        """Test that a CMS page is cached until a page is saved."""
+        site = Site.objects.get(is_default_site=True)
+        page = RevolvCustomPage(title='About', slug='about', body=[], live=True)
+        site.root_page.add_child(instance=page)
+        url = page.relative_url(site)
+        self.assertCached(url)
+
+        page.title = 'About us'
+        page.save()
+        self.assertContains(self.client.get(url), 'About us')
+
+    def test_logged_in_users_bypass_cache(self):
+        """Test that logged in users never get the anonymous page."""
+        self.client.get(reverse('home'))
+        self.send_test_user_login_request()
+        self.assertContains(self.client.get(reverse('home')), 'MY PORTFOLIO')
+
+    def test_cacheable_requests(self):
+        factory = RequestFactory()
+        request = factory.get('/')
+        request.user = AnonymousUser()
+        request._messages = CookieStorage(request)
+        self.assertTrue(is_cacheable_request(request))
+
+        messages.info(request, 'Your project has been created!')
+        self.assertFalse(is_cacheable_request(request))
+
+        request = factory.post('/')
+        request.user = AnonymousUser()
+        self.assertFalse(is_cacheable_request(request))
+
+        request = factory.get('/', {'utm_source': 'newsletter'})
+        request.user = AnonymousUser()
+        request._messages = CookieStorage(request)
+        self.assertFalse(is_cacheable_request(request))
+
+        request = factory.get('/')
+        request.user = self.test_user
+        self.assertFalse(is_cacheable_request(request))
+
+    def test_invalidate_page_tags(self):
+        request = RequestFactory().get('/')
+        key = page_cache_key(request, ['projects', 'cms'])
+        self.assertEqual(page_cache_key(request, ['projects', 'cms']), key)
+        invalidate_page_tags(['cms'])
+        self.assertNotEqual(page_cache_key(request, ['projects', 'cms']), key)
@@ -0,0 +1,190 @@
+"""
+Query budgets of the public and dashboard views.
+
+Every view is rendered with the same fixtures at two scales, and must run as
+many queries at both (so that none of them grows with the number of projects
+or payments, i.e. has an N+1) and no more than its budget in
+query_budgets.json. The budgets can be rewritten from the counts at the large
+scale by running the tests with UPDATE_QUERY_BUDGETS=1.
+
+The large scale has a hundred times as many projects, donations and donors
+as the small one, so an N+1 shows up as hundreds of extra queries.
+
+The views are measured in their steady state: each is rendered once to warm
+the caches (e.g. the projects' cached fragments) before the measured request,
+but the anonymous pages are taken out of the page cache. The wall time of the
+measured requests is reported after the tests.
+"""
+import datetime
+import json
+import os
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from revolv.base.impact import refresh_global_impacts
+from revolv.base.models import RevolvUserProfile
+from revolv.base.page_cache import invalidate_page_tags
+from revolv.lib.testing import TestUserMixin
+from revolv.payments.models import Payment, PaymentType, ReinvestLedgerEntry, UserImpactSnapshot
+from revolv.project.models import Project, ProjectContribution, ProjectFundingTotals
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+
+SMALL_SCALE = 10
+LARGE_SCALE = 1000
+
+
+@override_settings(ADMIN_REINVESTMENT_DATE_DT=datetime.datetime(2100, 1, 1))
+class QueryBudgetTestCase(TestUserMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(QueryBudgetTestCase, cls).setUpClass()
+        cls.timings = []
+
+    @classmethod
+    def tearDownClass(cls):
+        super(QueryBudgetTestCase, cls).tearDownClass()
+        sys.stderr.write('\nView wall times (ms):\n')
+        for name, scale, queries, elapsed in cls.timings:
+            sys.stderr.write('  %-22s %5d projects %4d queries %8.1f\n' % (name, scale, queries, elapsed * 1000))
+
+    def setUp(self):
+        super(QueryBudgetTestCase, self).setUp()
+        self.test_profile.make_administrator()
+        self.ambassador_user, self.ambassador = self.create_new_user_with_password(
+            'ambassador', 'ambassador_password', ambassador=True
+        )
+        self.donor_user, self.donor = self.create_new_user_with_password('donor', 'donor_password')
+        ReinvestLedgerEntry.objects.credit(self.donor, 1000.0)
+        self.featured = Project.factories.active.create(
+            ambassador=self.ambassador, funding_goal=1000000.0, monthly_reinvestment_cap=1000.0
+        )
+        self.scale = 0
+
+    def seed(self, scale):
+        """
+        Grow the fixtures to the given scale: as many active projects donated
+        to by the donor, drafted and proposed projects of the ambassador and
+        donors of the featured project.
+
+        Saving thousands of projects and payments one by one, with the
+        bookkeeping of their signals, would take minutes, so the rows are bulk
+        inserted and the denormalized tables are rebuilt from them afterwards,
+        the way revolv.base.synthetic seeds its data.
+        """
+        indexes = range(self.scale, scale)
+        projects = []
+        for i in indexes:
+            projects.append(Project.factories.active.build(
+                ambassador=self.ambassador, created_by_user=self.ambassador, title='Active %d' % i
+            ))
+            projects.append(Project.factories.drafted.build(
+                ambassador=self.ambassador, created_by_user=self.ambassador, title='Drafted %d' % i
+            ))
+            projects.append(Project.factories.proposed.build(
+                ambassador=self.ambassador, created_by_user=self.ambassador, title='Proposed %d' % i
+            ))
+        Project.objects.bulk_create(projects)
+        active = list(Project.objects.filter(title__in=['Active %d' % i for i in indexes]))
+
+        usernames = ['featured_donor_%d' % i for i in indexes]
+        User.objects.bulk_create([
+            User(username=username, first_name='Featured', last_name=username) for username in usernames
+        ])
+        RevolvUserProfile.objects.bulk_create([
+            RevolvUserProfile(user=user) for user in User.objects.filter(username__in=usernames)
+        ])
+        featured_donors = list(RevolvUserProfile.objects.filter(user__username__in=usernames))
+
+        paypal = PaymentType.objects.get_paypal()
+        donations = [(self.donor, project) for project in active]
+        donations.extend((donor, self.featured) for donor in featured_donors)
+        Payment.objects.bulk_create([
+            Payment(user=user, entrant=user, project=project, amount=20.0, payment_type=paypal)
+            for user, project in donations
+        ])
+        Project.donors.through.objects.bulk_create([
+            Project.donors.through(project_id=project.pk, revolvuserprofile_id=user.pk)
+            for user, project in donations
+        ])
+
+        ProjectContribution.objects.rebuild()
+        ProjectFundingTotals.objects.rebuild()
+        UserImpactSnapshot.objects.rebuild([self.donor.pk] + [donor.pk for donor in featured_donors])
+        refresh_global_impacts()
+        self.scale = scale
+
+    def views(self):
+        """
+        :return: the name, user (or None for anonymous visitors), method, url
+        and data of the request of every view.
+        """
+        project = self.featured.pk
+        return [
+            ('home', None, 'get', reverse('home'), {}),
+            ('projects_list', None, 'get', reverse('projects_list'), {}),
+            ('project', None, 'get', reverse('project:view', kwargs={'pk': project}), {}),
+            ('donor_dashboard', ('donor', 'donor_password'), 'get', reverse('donor:dashboard'), {}),
+            ('ambassador_dashboard', ('ambassador', 'ambassador_password'), 'get',
+             reverse('ambassador:dashboard'), {}),
+            ('admin_dashboard', (self.test_user.username, 'test_user_password'), 'get',
+             reverse('administrator:dashboard'), {}),
+            ('reinvest_list', ('donor', 'donor_password'), 'get', reverse('project:reinvest_list'), {}),
+            ('reinvest', ('donor', 'donor_password'), 'post',
+             reverse('project:reinvest', kwargs={'pk': project}), {'amount': 1.0}),
+        ]
+
+    def measure(self):
+        """
+        :return: a dict of the number of queries of every view at the current
+        scale.
+        """
+        counts = {}
+        for name, credentials, method, url, data in self.views():
+            self.client.logout()
+            if credentials is not None:
+                self.assertTrue(self.client.login(username=credentials[0], password=credentials[1]))
+            getattr(self.client, method)(url, data)
+            invalidate_page_tags(['projects', 'project:%s' % self.featured.pk])
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.time()
+                response = getattr(self.client, method)(url, data)
+                elapsed = time.time() - started
+            self.assertEqual(response.status_code, 200, '%s returned %s' % (name, response.status_code))
+            counts[name] = len(queries)
+            self.timings.append((name, self.scale, len(queries), elapsed))
+        return counts
+
+    def test_query_budgets(self):
+        """Test that no view's queries grow with scale or exceed its budget."""
+        self.seed(SMALL_SCALE)
+        small = self.measure()
+        self.seed(LARGE_SCALE)
+        large = self.measure()
+
+        if os.environ.get('UPDATE_QUERY_BUDGETS'):
+            with open(BUDGETS_PATH, 'w') as budgets_file:
+                json.dump(large, budgets_file, indent=4, sort_keys=True)
+                budgets_file.write('\n')
+        with open(BUDGETS_PATH) as budgets_file:
+            budgets = json.load(budgets_file)
+
+        failures = []
+        for name in sorted(large):
+            if small[name] != large[name]:
+                failures.append('%s ran %d queries with %d projects but %d with %d' % (
+                    name, small[name], SMALL_SCALE, large[name], LARGE_SCALE
+                ))
+            if name not in budgets:
+                failures.append('%s has no budget in %s' % (name, BUDGETS_PATH))
+            elif large[name] > budgets[name]:
+                failures.append('%s ran %d queries, over its budget of %d' % (name, large[name], budgets[name]))
+        if failures:
+            self.fail('\n'.join(failures))
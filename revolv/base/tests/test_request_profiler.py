@@ -0,0 +1,82 @@
+import cProfile
+import pstats
+import shutil
+import tempfile
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+from revolv.base.models import RevolvUserProfile
+from revolv.base.request_profiler import (collapsed_stacks, is_profile_token_valid, list_captures,
+                                          make_profile_token, PROFILE_PARAM)
+from revolv.lib.testing import TestUserMixin
+
+
+def leaf():
+    return sum(range(10000))
+
+
+def branch():
+    return leaf() + leaf()
+
+
+class RequestProfilerTestCase(TestUserMixin, TestCase):
+    def setUp(self):
+        super(RequestProfilerTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(REQUEST_PROFILE_ROOT=self.root)
+        self.settings_override.enable()
+        self.test_profile.make_administrator()
+        self.send_test_user_login_request()
+        self.token = make_profile_token(RevolvUserProfile.objects.load_principal(self.test_user.pk))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root)
+        super(RequestProfilerTestCase, self).tearDown()
+
+    def test_token(self):
+        """Test that tokens only work for the administrator they were made for."""
+        principal = RevolvUserProfile.objects.load_principal(self.test_user.pk)
+        self.assertTrue(is_profile_token_valid(self.token, principal))
+        self.assertFalse(is_profile_token_valid(self.token + 'x', principal))
+
+        user, profile = self.create_new_user_with_password('other_admin', 'password', admin=True)
+        self.assertFalse(is_profile_token_valid(self.token, RevolvUserProfile.objects.load_principal(user.pk)))
+
+        self.test_profile.make_donor()
+        self.assertFalse(is_profile_token_valid(self.token, RevolvUserProfile.objects.load_principal(self.test_user.pk)))
+
+    def test_profiled_request(self):
+        """Test that only requests with a valid token are profiled, and listed."""
+        url = reverse('projects_list')
+        self.client.get(url)
+        self.client.get(url, {PROFILE_PARAM: 'invalid'})
+        self.assertEqual(list_captures(), [])
+
+        response = self.client.get(url, {PROFILE_PARAM: self.token})
+        self.assertEqual(response.status_code, 200)
+        captures = list_captures()
+        self.assertEqual([capture['name'] for capture in captures], [response['X-Revolv-Profile']])
+        self.assertEqual(captures[0]['path'], url)
+
+        profiles = self.client.get(reverse('administrator:profiles'))
+        self.assertContains(profiles, url)
+        stats = self.client.get(reverse('administrator:profile_download', kwargs={
+            'name': captures[0]['name'], 'extension': 'txt'
+        }))
+        self.assertContains(stats, 'cumulative')
+
+    def test_profiled_error(self):
+        """Test that a profiled request is handled as any other, errors included."""
+        response = self.client.get('/no-such-page/', {PROFILE_PARAM: self.token})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual([capture['name'] for capture in list_captures()], [response['X-Revolv-Profile']])
+
+    def test_collapsed_stacks(self):
+        """Test that the collapsed stacks follow the calls."""
+        profiler = cProfile.Profile()
+        profiler.runcall(branch)
+        stacks = collapsed_stacks(pstats.Stats(profiler), min_microseconds=0)
+        self.assertTrue(any('(branch);' in stack and stack.endswith('(leaf)')
+                            for stack in (line.rsplit(' ', 1)[0] for line in stacks)))
@@ -0,0 +1,83 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import override_settings
+from revolv.base.sql_profile import fingerprint, NPlusOneError, recent_profiles, SQLProfileMiddleware
+from revolv.lib.testing import TestUserMixin
+
+
+@override_settings(SQL_PROFILE_ENABLED=True)
+class SQLProfileTestCase(TestUserMixin, TestCase):
+    def profile_request(self, view):
+        """Run the view through SQLProfileMiddleware and return its response."""
+        middleware = SQLProfileMiddleware()
+        request = RequestFactory().get('/profiled/')
+        middleware.process_request(request)
+        return middleware.process_response(request, view())
+
+    def n_plus_one_view(self):
+        for user in User.objects.all():
+            User.objects.filter(pk=user.pk).exists()
+        return HttpResponse()
+
+    def test_fingerprint(self):
+        """Test that statements differing only by their parameters have the same fingerprint."""
+        self.assertEqual(
+            fingerprint("SELECT * FROM  \"auth_user\" WHERE \"id\" = 12 AND \"username\" = 'it''s'"),
+            fingerprint("SELECT * FROM \"auth_user\" WHERE \"id\" = 7 AND \"username\" = 'John'"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM "auth_user" WHERE "id" IN (1, 2, 3)'),
+            'SELECT * FROM "auth_user" WHERE "id" IN (...)'
+        )
+
+    def test_repeated_queries_are_profiled(self):
+        """Test that a request's profile counts its queries and reports its N+1s."""
+        for i in range(5):
+            User.objects.create_user('user%d' % i)
+        self.profile_request(self.n_plus_one_view)
+        profile = recent_profiles()[0]
+        self.assertEqual(profile['path'], '/profiled/')
+        self.assertEqual(profile['queries'], 7)
+        self.assertEqual(len(profile['repeated']), 1)
+        self.assertEqual(profile['repeated'][0]['count'], 6)
+        self.assertLessEqual(len(profile['slowest']), 5)
+
+    def test_literals_are_not_kept(self):
+        """Test that the profiled statements are only kept as their fingerprints."""
+        self.profile_request(lambda: HttpResponse(User.objects.filter(email='secret@example.com').exists()))
+        profile = recent_profiles()[0]
+        self.assertEqual(len(profile['slowest']), 1)
+        self.assertIn('?', profile['slowest'][0]['fingerprint'])
+        self.assertNotIn('secret@example.com', json.dumps(profile))
+
+    @override_settings(SQL_PROFILE_ENABLED=False)
+    def test_disabled(self):
+        """Test that nothing is profiled unless profiling is enabled."""
+        request = RequestFactory().get('/profiled/')
+        SQLProfileMiddleware().process_request(request)
+        self.assertFalse(hasattr(request, '_sql_profile'))
+
+    @override_settings(SQL_PROFILE_STRICT=True)
+    def test_strict_mode(self):
+        """Test that N+1s raise in strict mode, and nothing else does."""
+        self.profile_request(self.n_plus_one_view)
+        for i in range(5):
+            User.objects.create_user('user%d' % i)
+        with self.assertRaises(NPlusOneError):
+            self.profile_request(self.n_plus_one_view)
+
+    def test_endpoint(self):
+        """Test that only administrators can read the profiles."""
+        url = reverse('administrator:sql_profile')
+        self.send_test_user_login_request()
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+        self.test_profile.make_administrator()
+        self.client.get(reverse('home'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['profiles'][0]['path'], reverse('home'))
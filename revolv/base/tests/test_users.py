@@ -1,4 +1,11 @@
-from django.test import TestCase
+import mock
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.core.urlresolvers import reverse
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import RequestFactory, TestCase
+from revolv.base.models import RevolvUserProfile
+from revolv.base.principal import PRINCIPAL_CACHE_KEY, PRINCIPAL_CACHE_TIMEOUT, flush_pending_principals, get_principal
 from revolv.lib.testing import TestUserMixin
 
 
@@ -22,3 +29,57 @@ class UserDataMixinTestCase(TestUserMixin, TestCase):
         self.assertEqual(response.context["is_donor"], True)
         self.assertEqual(response.context["is_ambassador"], True)
         self.assertEqual(response.context["is_administrator"], True)
+
+    def test_principal_is_cached(self):
+        """Test that the roles are cached between requests until they change."""
+        self.send_test_user_login_request()
+        response = self.client.get("/")
+        self.assertEqual(response.context["is_ambassador"], False)
+
+        request = RequestFactory().get("/")
+        request.user = self.test_user
+        request.session = self.client.session
+        request.session.keys()  # load the session before counting
+        with self.assertNumQueries(0):
+            self.assertEqual(get_principal(request).profile_id, self.test_profile.pk)
+        self.test_profile.make_ambassador()
+        self.assertEqual(self.client.get("/").context["is_ambassador"], True)
+
+        self.test_user.groups.clear()
+        self.assertEqual(self.client.get("/").context["is_ambassador"], False)
+
+
+class PrincipalTestCase(TestUserMixin, TestCase):
+    def test_load_principal(self):
+        self.test_profile.make_administrator()
+        principal = RevolvUserProfile.objects.load_principal(self.test_user.pk)
+        self.assertEqual(principal.profile_id, self.test_profile.pk)
+        self.assertTrue(principal.is_donor())
+        self.assertTrue(principal.is_ambassador())
+        self.assertTrue(principal.is_administrator())
+
+    def test_reinvest_pool_invalidated_after_commit(self):
+        """
+        Test that a principal cached again by a concurrent request before the
+        reinvest_pools were committed is forgotten once the transaction is over.
+        """
+        key = PRINCIPAL_CACHE_KEY % self.test_profile.pk
+        stale = RevolvUserProfile.objects.load_principal(self.test_user.pk)
+        RevolvUserProfile.objects.set_reinvest_pools({self.test_profile.pk: 12.5})
+        self.assertIsNone(cache.get(key))
+        cache.set(key, stale, PRINCIPAL_CACHE_TIMEOUT)
+
+        # the test's transaction is still open, so nothing is forgotten yet
+        flush_pending_principals()
+        self.assertIsNotNone(cache.get(key))
+
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', False):
+            request_finished.send(sender=self.__class__)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(RevolvUserProfile.objects.load_principal(self.test_user.pk).reinvest_pool, 12.5)
+
+    def test_role_decorators(self):
+        self.send_test_user_login_request()
+        self.assertEqual(self.client.get(reverse("administrator:dashboard")).status_code, 302)
+        self.test_profile.make_administrator()
+        self.assertEqual(self.client.get(reverse("administrator:dashboard")).status_code, 200)
@@ -1,9 +1,12 @@
+import json
+
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from revolv.base.dashboard import DASHBOARD_PAGE_SIZE, DashboardService
 from revolv.base.models import RevolvUserProfile
 from revolv.lib.testing import TestUserMixin, UserTestingMixin
-from revolv.project.models import Category
+from revolv.project.models import Category, Project
 
 
 class CategorySetterTestCase(TestUserMixin, UserTestingMixin, TestCase):
@@ -135,3 +138,40 @@ class AuthPagesTestCase(UserTestingMixin, TestUserMixin, TestCase):
         # make sure the user was actually saved
         test_user = User.objects.get(username="john123")
         RevolvUserProfile.objects.get(user=test_user)
+
+
+class DashboardSectionsTestCase(TestUserMixin, TestCase):
+    def setUp(self):
+        super(DashboardSectionsTestCase, self).setUp()
+        self.test_profile.make_administrator()
+        self.send_test_user_login_request()
+
+    def test_sections(self):
+        """Test that the sections come with their counts and first pages, from one query."""
+        active = Project.factories.active.create_batch(DASHBOARD_PAGE_SIZE + 2)
+        drafted = Project.factories.drafted.create()
+        principal = RevolvUserProfile.objects.load_principal(self.test_user.pk)
+
+        with self.assertNumQueries(1):
+            sections = dict((section.group.key, section) for section in DashboardService('admin', principal).sections())
+        self.assertEqual(sections['active'].count, DASHBOARD_PAGE_SIZE + 2)
+        self.assertTrue(sections['active'].has_more)
+        self.assertEqual(
+            [project['pk'] for project in sections['active'].projects],
+            [project.pk for project in active[:DASHBOARD_PAGE_SIZE]]
+        )
+        self.assertEqual([project['pk'] for project in sections['drafted'].projects], [drafted.pk])
+        self.assertEqual(sections['proposed'].count, 0)
+
+    def test_dashboard_projects_endpoint(self):
+        """Test that the following pages of a section are served as JSON."""
+        active = Project.factories.active.create_batch(DASHBOARD_PAGE_SIZE + 2)
+        url = reverse('dashboard_projects', kwargs={'role': 'admin', 'section': 'active'})
+
+        data = json.loads(self.client.get(url, {'page': 2}).content)
+        self.assertEqual(data['count'], DASHBOARD_PAGE_SIZE + 2)
+        self.assertEqual(data['next_page'], None)
+        self.assertEqual([project['pk'] for project in data['projects']], [project.pk for project in active[-2:]])
+
+        self.test_profile.make_donor()
+        self.assertEqual(self.client.get(url).status_code, 302)
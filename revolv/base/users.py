@@ -1,23 +1,45 @@
+from functools import wraps
+
 from django.contrib import messages
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from django.http import Http404
 from django.shortcuts import redirect
+from django.utils.decorators import available_attrs
+from django.utils.functional import cached_property
 from revolv.base.models import RevolvUserProfile
-from revolv.base.utils import get_profile
+from revolv.base.principal import get_principal
 from revolv.tasks.sfdc import send_signup_info
 
 from social.pipeline.user import create_user
 from social.apps.django_app.middleware import SocialAuthExceptionMiddleware
 
 
+def principal_passes_test(test_func, redirect_field_name=REDIRECT_FIELD_NAME, login_url=None):
+    """
+    Like django.contrib.auth.decorators.user_passes_test, but test_func is
+    passed the request's Principal (see revolv.base.principal), which is then
+    shared with the view (e.g. UserDataMixin), instead of the User.
+    """
+    def decorator(view_func):
+        @wraps(view_func, assigned=available_attrs(view_func))
+        def _wrapped_view(request, *args, **kwargs):
+            principal = get_principal(request)
+            if principal is not None and test_func(principal):
+                return view_func(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url, redirect_field_name)
+        return _wrapped_view
+    return decorator
+
+
 def is_ambassador(function=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url=None):
     """
     Decorator for views that checks that the user is logged in and an ambassador, redirecting
     to the log-in page if necessary.
     """
-    actual_decorator = user_passes_test(
-        lambda u: u.is_authenticated() and get_profile(u).is_ambassador(),
+    actual_decorator = principal_passes_test(
+        lambda principal: principal.is_ambassador(),
         login_url=login_url,
         redirect_field_name=redirect_field_name
     )
@@ -31,8 +53,8 @@ def is_administrator(function=None, redirect_field_name=REDIRECT_FIELD_NAME, log
     Decorator for views that checks that the user is logged in and an administrator, redirecting
     to the log-in page if necessary.
     """
-    actual_decorator = user_passes_test(
-        lambda u: u.is_authenticated() and get_profile(u).is_administrator(),
+    actual_decorator = principal_passes_test(
+        lambda principal: principal.is_administrator(),
         login_url=login_url,
         redirect_field_name=redirect_field_name
     )
@@ -73,21 +95,31 @@ class UserDataMixin(object):
         information, if applicable. If the user isn't logged in, then self.user
         is an AnonymousUser, which is a built-in Django user type. If the user
         is logged in, self.user is a django.contrib.auth.models.User.
+
+        The roles come from the request's Principal (see
+        revolv.base.principal), which is usually cached. self.user_profile is
+        only loaded if the view uses it.
         """
         self.user = request.user
         self.is_authenticated = self.user.is_authenticated()
-        if self.is_authenticated:
-            self.user_profile = RevolvUserProfile.objects.get(user=self.user)
-            self.is_donor = self.user_profile.is_donor()
-            self.is_ambassador = self.user_profile.is_ambassador()
-            self.is_administrator = self.user_profile.is_administrator()
+        self.principal = get_principal(request)
+        if self.principal is not None:
+            self.is_donor = self.principal.is_donor()
+            self.is_ambassador = self.principal.is_ambassador()
+            self.is_administrator = self.principal.is_administrator()
         else:
-            self.user_profile = None
             self.is_donor = False
             self.is_ambassador = False
             self.is_administrator = False
         return super(UserDataMixin, self).dispatch(request, *args, **kwargs)
 
+    @cached_property
+    def user_profile(self):
+        """The whole RevolvUserProfile of the logged in user, or None."""
+        if self.principal is None:
+            return None
+        return RevolvUserProfile.objects.get(pk=self.principal.profile_id)
+
     def get_context_data(self, **kwargs):
         """ 'revolv_user' is included here for convenience. By default, the
         variable {{ user }} in the templates refers to 'request.user' above,
@@ -1,5 +1,3 @@
-from collections import OrderedDict
-
 from django.contrib import messages
 from django.contrib.auth import login as auth_login
 from django.contrib.auth import logout as auth_logout
@@ -7,22 +5,20 @@ from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.core.urlresolvers import reverse
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import redirect, render_to_response
 from django.utils.decorators import method_decorator
 from django.views.decorators.debug import sensitive_post_parameters
 from django.views.decorators.http import require_http_methods
 from django.views.generic import FormView, TemplateView, View
 from django.template.context import RequestContext
+from revolv.base.dashboard import DASHBOARD_ROLE_SECTIONS, DashboardService
 from revolv.base.forms import SignupForm
+from revolv.base.impact import get_global_impacts
 from revolv.base.users import UserDataMixin
-from revolv.base.utils import ProjectGroup
-from revolv.payments.models import Payment
 from revolv.project.models import Category, Project
 from revolv.project.utils import aggregate_stats
-from revolv.donor.views import humanize_integers, total_donations
-from revolv.base.models import RevolvUserProfile
+from revolv.donor.views import humanize_integers
 from revolv.tasks.sfdc import send_signup_info
 
 from social.apps.django_app.default.models import UserSocialAuth
@@ -46,8 +42,8 @@ class HomePageView(UserDataMixin, TemplateView):
         # Assume 20 year lifetime.
         # We use str() to avoid django adding commas to integer in the template.
         #carbon_saved = str(int(carbon_saved_by_month * 12 * 20))
-        people_donated_sys_count = RevolvUserProfile.objects.exclude(project=None).count()
-        people_donated_stat_Count = str(int(people_donated_sys_count + 615))
+        impacts = get_global_impacts()
+        people_donated_stat_Count = str(int(impacts['num_people_donated'] + 615))
         #total_kwh = float(Project.objects.aggregate(n=Sum('total_kwh_value'))['n'])
         #carbon_value_calc = total_kwh * 1.5
         #funding_goal_value = float(Project.objects.aggregate(n=Sum('funding_goal'))['n'])
@@ -56,8 +52,8 @@ class HomePageView(UserDataMixin, TemplateView):
         global_impacts = {
             # Users who have backed at least one project:
             'num_people_donated': people_donated_stat_Count,
-            'num_projects': Project.objects.get_completed().count(),
-            'num_people_affected': Project.objects.filter(project_status=Project.COMPLETED).aggregate(n=Sum('people_affected'))['n'],
+            'num_projects': impacts['num_projects_completed'],
+            'num_people_affected': impacts['num_people_affected'],
             #'co2_avoided': final_carbon_avoided,
 	   	'co2_avoided': 7452670, 
         }
@@ -65,13 +61,15 @@ class HomePageView(UserDataMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(HomePageView, self).get_context_data(**kwargs)
-        featured_projects = Project.objects.get_featured(HomePageView.FEATURED_PROJECT_TO_SHOW)
-        active_projects = Project.objects.get_active()
-        context["first_project"] = active_projects[0] if len(active_projects) > 0 else None
         # Get top 6 featured projects, Changed to active Projects in final fix
-        context["featured_projects"] = active_projects[:6]
-        context["completed_projects_count"] = Project.objects.get_completed().count()
-        context["total_donors_count"] = Payment.objects.total_distinct_organic_donors()
+        active_projects = Project.objects.prime_cache_versions(
+            list(Project.objects.get_active()[:HomePageView.FEATURED_PROJECT_TO_SHOW])
+        )
+        context["first_project"] = active_projects[0] if len(active_projects) > 0 else None
+        context["featured_projects"] = active_projects
+        impacts = get_global_impacts()
+        context["completed_projects_count"] = impacts['num_projects_completed']
+        context["total_donors_count"] = impacts['num_organic_donors']
         context["global_impacts"] = self.get_global_impacts()
         return context
 
@@ -81,36 +79,52 @@ class BaseStaffDashboardView(UserDataMixin, TemplateView):
     Base view for the administrator and ambassador dashboard views. The
     specific views in administrator/views.py and ambassador/views.py
     will inherit from this view.
-    """
 
-    def get_filter_args(self):
-        """
-        Return an array of arguments to pass to Project.objects.get_[drafted|proposed|active|completed].
-        """
-        return []
+    The sidebar's project sections (see revolv.base.dashboard) only come
+    with their counts and first pages: the following pages are loaded from
+    DashboardProjectsView.
+    """
 
     def get_context_data(self, **kwargs):
         context = super(BaseStaffDashboardView, self).get_context_data(**kwargs)
 
-        project_dict = OrderedDict()
-        project_dict[ProjectGroup('Proposed Projects', "proposed")] = Project.objects.get_proposed(*self.get_filter_args())
-        project_dict[ProjectGroup('Staged projects', "staged")] = Project.objects.get_staged(*self.get_filter_args())
-        project_dict[ProjectGroup('Active Projects', "active")] = Project.objects.get_active(*self.get_filter_args())
-        project_dict[ProjectGroup('Completed Projects', "completed")] = Project.objects.get_completed(*self.get_filter_args())
-
-        context["project_dict"] = project_dict
+        context["dashboard_sections"] = DashboardService(self.role, self.principal).sections()
         context["role"] = self.role or "donor"
 
-        context['donated_projects'] = Project.objects.donated_projects(self.user_profile)
+        context['donated_projects'] = Project.objects.prime_cache_versions(
+            list(Project.objects.donated_projects(self.user_profile))
+        )
         statistics_dictionary = aggregate_stats(self.user_profile)
-        statistics_dictionary['total_donated'] = total_donations(self.user_profile)
-        statistics_dictionary['people_served'] = Project.objects.aggregate(n=Sum('people_affected'))['n']
+        statistics_dictionary['people_served'] = get_global_impacts()['num_people_served']
         humanize_integers(statistics_dictionary)
         context['statistics'] = statistics_dictionary
 
         return context
 
 
+class DashboardProjectsView(UserDataMixin, View):
+    """
+    A page of the projects of a section of a dashboard (see
+    revolv.base.dashboard), as JSON, for loading the sections of the
+    dashboards lazily. The page is given by the "page" GET parameter.
+
+    Accessed through /my-portfolio/{role}/projects/{section}/
+    """
+
+    def get(self, request, role, section):
+        allowed = {
+            'admin': self.is_administrator,
+            'ambassador': self.is_ambassador,
+            'donor': self.is_authenticated,
+        }
+        if not allowed.get(role):
+            return self.deny_access()
+        if section not in DASHBOARD_ROLE_SECTIONS[role]:
+            raise Http404('No such dashboard section.')
+        service = DashboardService(role, self.principal)
+        return JsonResponse(service.page(section, request.GET.get('page', 1)))
+
+
 class CategoryPreferenceSetterView(UserDataMixin, View):
     http_methods = ['post']
 
@@ -134,7 +148,7 @@ class ProjectListView(UserDataMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(ProjectListView, self).get_context_data(**kwargs)
-        active = Project.objects.get_active()
+        active = Project.objects.prime_cache_versions(list(Project.objects.get_active()))
         context["active_projects"] = active
         context["is_reinvestment"] = False
         return context
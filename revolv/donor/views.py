@@ -1,11 +1,9 @@
 from django.contrib import messages
 from django.core.urlresolvers import reverse
 from django.views.generic import TemplateView
-from django.db.models import Sum
 
+from revolv.base.impact import get_global_impacts
 from revolv.base.users import UserDataMixin
-from revolv.base.utils import ProjectGroup
-from revolv.payments.models import Payment
 from revolv.project.models import Project, Category
 from revolv.project.utils import aggregate_stats
 
@@ -26,13 +24,6 @@ def humanize_integers(d):
     for k in d:
         d[k] = humanize_int(int(d[k]))
 
-def total_donations(profile):
-    payments = Payment.objects.filter(entrant=profile, user=profile)
-    if payments:
-        return payments.aggregate(Sum('amount'))['amount__sum']
-    else:
-        return 0
-
 class DonorDashboardView(UserDataMixin, TemplateView):
     """
     Basic view for the Donor dashboard.
@@ -48,23 +39,19 @@ class DonorDashboardView(UserDataMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super(DonorDashboardView, self).get_context_data(**kwargs)
 
-        project_dict = {}
-        project_dict[ProjectGroup('My Projects', "donated")] = Project.objects.donated_projects(self.user_profile)
-        context["project_dict"] = project_dict
-
-        active = Project.objects.get_active()
-        context["first_project"] = active[0] if active.count() > 0 else None
+        donated_projects = Project.objects.prime_cache_versions(
+            list(Project.objects.donated_projects(self.user_profile))
+        )
+        context["first_project"] = Project.objects.get_active().first()
         context["role"] = "donor"
-        context["donor_has_no_donated_projects"] = Project.objects.donated_projects(self.user_profile).count() == 0
+        context["donor_has_no_donated_projects"] = not donated_projects
 
-        context['donated_projects'] = Project.objects.donated_projects(self.user_profile)
+        context['donated_projects'] = donated_projects
         statistics_dictionary = aggregate_stats(self.user_profile)
-        statistics_dictionary['total_donated'] = total_donations(self.user_profile)
-        statistics_dictionary['people_served'] = Project.objects.aggregate(n=Sum('people_affected'))['n']
+        statistics_dictionary['people_served'] = get_global_impacts()['num_people_served']
         humanize_integers(statistics_dictionary)
         context['statistics'] = statistics_dictionary
 
-
         context['category_setter_url'] = reverse('dashboard_category_setter')
         context['categories'] = Category.objects.all().order_by('title')
         context['preferred_categories'] = self.user_profile.preferred_categories.all()
@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from .models import (
     AdminReinvestment, AdminRepayment, Payment, ProjectMontlyRepaymentConfig,
-    PaymentType, RepaymentFragment, UserReinvestment, Tip
+    PaymentType, ReinvestLedgerEntry, ReinvestmentRollover, RepaymentFragment, UserReinvestment, Tip
 )
 
 admin.site.register(AdminReinvestment)
@@ -10,6 +10,8 @@ admin.site.register(AdminRepayment)
 admin.site.register(Payment)
 admin.site.register(ProjectMontlyRepaymentConfig)
 admin.site.register(PaymentType)
+admin.site.register(ReinvestLedgerEntry)
+admin.site.register(ReinvestmentRollover)
 admin.site.register(RepaymentFragment)
 admin.site.register(UserReinvestment)
 admin.site.register(Tip)
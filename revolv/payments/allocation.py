@@ -0,0 +1,154 @@
+"""
+Planning of the monthly reinvestment allocation: which completed projects
+repay into the Solar Seed Fund this month, and how the resulting reinvestable
+balance is split into monthly_reinvestment_caps for the active projects.
+
+A plan is computed with a handful of aggregate queries, can be inspected (e.g.
+printed by `manage.py allocatereinvestment --dry-run`) and is applied in one
+transaction. The split is decided by a strategy, chosen by name from
+ALLOCATION_STRATEGIES.
+"""
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from revolv.base.models import RevolvUserProfile
+from revolv.payments.models import AdminRepayment, ProjectMontlyRepaymentConfig
+from revolv.project.models import Project
+
+
+class AllocationPlannerException(Exception):
+    """Exception for something that went wrong planning an allocation."""
+    pass
+
+
+def equal_split(balance, recipients):
+    """
+    Give every recipient project the same share of the balance.
+    """
+    share = balance / len(recipients)
+    return dict((project.pk, share) for project in recipients)
+
+
+def proportional_to_amount_left(balance, recipients):
+    """
+    Split the balance in proportion to how much each project still needs to
+    reach its goal.
+    """
+    total_left = sum(project.funding_amount_left for project in recipients)
+    return dict(
+        (project.pk, balance * project.funding_amount_left / total_left) for project in recipients
+    )
+
+
+def category_weighted(balance, recipients):
+    """
+    Split the balance in proportion to how many users prefer one of each
+    project's categories (counting one extra for every project, so that
+    projects nobody prefers still get a share).
+    """
+    fans = dict(
+        Project.objects.filter(pk__in=[project.pk for project in recipients]).annotate(
+            fans=Count('category__revolvuserprofile', distinct=True)
+        ).values_list('pk', 'fans')
+    )
+    weights = dict((project.pk, 1 + fans.get(project.pk, 0)) for project in recipients)
+    total_weight = float(sum(weights.values()))
+    return dict((pk, balance * weight / total_weight) for pk, weight in weights.items())
+
+
+ALLOCATION_STRATEGIES = {
+    'equal': equal_split,
+    'proportional': proportional_to_amount_left,
+    'category': category_weighted,
+}
+
+
+class AllocationPlan(object):
+    """
+    The plan for one month's reinvestment allocation.
+
+    :repayments: list of (project, amount) Solar Seed Fund repayments to enter
+    :missing_configs: list of completed projects without a repayment config
+    :opening_balance: the users' total reinvest pool before the repayments
+    :caps: list of (project, monthly_reinvestment_cap) for the recipients
+    """
+
+    def __init__(self, strategy, repayments, missing_configs, opening_balance, caps):
+        self.strategy = strategy
+        self.repayments = repayments
+        self.missing_configs = missing_configs
+        self.opening_balance = opening_balance
+        self.caps = caps
+
+    @property
+    def total_repayment(self):
+        return sum(amount for _, amount in self.repayments)
+
+    @property
+    def balance(self):
+        return self.opening_balance + self.total_repayment
+
+    def describe(self):
+        """
+        :return: a list of lines describing the plan, for logging or a dry-run.
+        """
+        lines = ['Allocation plan (%s strategy)' % self.strategy]
+        lines.append('Current reinvestment balance: %.2f' % self.opening_balance)
+        for project, amount in self.repayments:
+            lines.append('Repayment of %.2f from %s - %s' % (amount, project.id, project.title))
+        for project in self.missing_configs:
+            lines.append("Project %s - %s doesn't have repayment config!" % (project.id, project.title))
+        lines.append('Total reinvestment balance: %.2f' % self.balance)
+        for project, cap in self.caps:
+            lines.append('Cap of %.2f for %s - %s' % (cap, project.id, project.title))
+        return lines
+
+    def apply(self, admin):
+        """
+        Enter the planned repayments on behalf of admin and set the planned caps,
+        all in one transaction.
+        """
+        with transaction.atomic():
+            for project, amount in self.repayments:
+                AdminRepayment.objects.create(amount=amount, project=project, admin=admin)
+            Project.objects.set_reinvestment_caps(
+                dict((project.pk, cap) for project, cap in self.caps)
+            )
+
+
+def plan_allocation(strategy='equal', year=None):
+    """
+    Plan this month's reinvestment allocation: a repayment from every completed
+    project which hasn't been paid off yet, by its Solar Seed Fund repayment
+    config for the year, and caps for the active projects which still need
+    funding, which split the resulting balance according to the strategy.
+
+    :return: an AllocationPlan
+    """
+    if strategy not in ALLOCATION_STRATEGIES:
+        raise AllocationPlannerException('Unknown allocation strategy: %s' % strategy)
+    if year is None:
+        year = date.today().year
+
+    opening_balance = RevolvUserProfile.objects.aggregate(total=Sum('reinvest_pool'))['total'] or 0.0
+
+    repaying_projects = list(Project.objects.get_completed_unpaid_off_projects())
+    configs = dict(
+        (config.project_id, config.amount)
+        for config in ProjectMontlyRepaymentConfig.objects.filter(
+            project__in=[project.pk for project in repaying_projects],
+            year=year,
+            repayment_type=ProjectMontlyRepaymentConfig.SOLAR_SEED_FUND
+        )
+    )
+    repayments = [(project, configs[project.pk]) for project in repaying_projects if project.pk in configs]
+    missing_configs = [project for project in repaying_projects if project.pk not in configs]
+
+    plan = AllocationPlan(strategy, repayments, missing_configs, opening_balance, [])
+    recipients = list(Project.objects.needing_funding(Project.objects.get_active()))
+    if recipients and plan.balance > 0.0:
+        caps = ALLOCATION_STRATEGIES[strategy](plan.balance, recipients)
+        plan.caps = [(project, caps[project.pk]) for project in recipients]
+    return plan
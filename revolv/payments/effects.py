@@ -0,0 +1,231 @@
+"""
+The bookkeeping which the handlers in revolv.payments.signals do when
+Payments, RepaymentFragments, AdminRepayments and AdminReinvestments are made
+or revoked: the projects' ProjectFundingTotals, the users' ProjectContributions
+and UserImpactSnapshots, the projects' donors, the reinvestment ledger (and so
+the users' reinvest pools), the projects' monthly_reinvestment_caps, the
+projects' cache versions and the global impact counters.
+
+Normally every handler applies its effects right away, with a few small
+statements per row (ImmediatePaymentEffects). Code which creates or deletes
+many rows at once (imports, seeding, revoking, reinvestment fan-out) can wrap
+itself in deferred_payment_effects() instead:
+
+    with deferred_payment_effects():
+        for row in rows:
+            Payment.objects.create(...)
+
+Inside the block, the handlers only record their effects
+(DeferredPaymentEffects), and when the block exits they are applied with a few
+set-based statements, in the same transaction as the rows themselves. Until
+then the totals, contributions, donors and reinvest pools in the database do
+not include the block's changes (a user instance's reinvest_pool is adjusted in
+memory as the block goes, so checks against the same instance still see them).
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from revolv.base.impact import flush_global_impacts_refresh, schedule_global_impacts_refresh
+from revolv.payments.models import ReinvestLedgerEntry, UserImpactSnapshot
+from revolv.project.models import Project, ProjectContribution, ProjectFundingTotals
+
+_state = threading.local()
+
+
+class ImmediatePaymentEffects(object):
+    """
+    Applies every effect as soon as a handler asks for it.
+    """
+
+    def add_funding(self, project, **deltas):
+        """Add deltas to the project's ProjectFundingTotals."""
+        ProjectFundingTotals.objects.apply_delta(project, **deltas)
+
+    def add_impact(self, user_id, **deltas):
+        """Add deltas to the user's UserImpactSnapshot."""
+        UserImpactSnapshot.objects.apply_delta(user_id, **deltas)
+
+    def add_contribution(self, payment, is_reinvestment, sign=1):
+        """
+        Add (sign=1) or take away (sign=-1) the payment in its user's
+        ProjectContribution, making the user a donor to the project with their
+        first payment and removing them with their last.
+        """
+        payment_count = ProjectContribution.objects.record_payment(payment, is_reinvestment, sign=sign)
+        if sign > 0 and payment_count == 1:
+            payment.project.donors.add(payment.user)
+        elif sign < 0 and payment_count == 0:
+            payment.project.donors.remove(payment.user)
+
+    def change_reinvest_pool(self, user, amount, **sources):
+        """Credit (or, if amount is negative, debit) the user's reinvest_pool."""
+        ReinvestLedgerEntry.objects.credit(user, amount, **sources)
+
+    def release_reinvestment(self, project, amount):
+        """Give amount back to the project's monthly_reinvestment_cap."""
+        project.release_reinvestment(amount)
+
+    def touch_project(self, project_id):
+        """Make the template fragments cached for the project stale."""
+        Project.objects.bump_cache_versions([project_id])
+
+    def refresh_global_impacts(self):
+        """Have the global impact counters refreshed."""
+        schedule_global_impacts_refresh()
+
+
+class DeferredPaymentEffects(object):
+    """
+    Records the effects the handlers ask for, and applies all of them at once
+    in apply().
+    """
+
+    def __init__(self):
+        # field -> Project pk -> delta
+        self.funding = defaultdict(lambda: defaultdict(int))
+        # field -> RevolvUserProfile pk -> delta
+        self.impact = defaultdict(lambda: defaultdict(int))
+        # (Project pk, RevolvUserProfile pk) -> field -> delta
+        self.contributions = defaultdict(lambda: defaultdict(int))
+        self.ledger_entries = []
+        self.cap_releases = defaultdict(float)
+        self.touched_projects = set()
+        self.global_impacts_changed = False
+        # instances whose cached values are refreshed once the effects are in
+        self.projects = []
+        self.users = defaultdict(list)
+
+    def add_funding(self, project, **deltas):
+        if isinstance(project, Project):
+            self.projects.append(project)
+        project_id = getattr(project, 'pk', project)
+        for field, delta in deltas.items():
+            self.funding[field][project_id] += delta
+
+    def add_impact(self, user_id, **deltas):
+        if user_id is None:
+            return
+        for field, delta in deltas.items():
+            self.impact[field][user_id] += delta
+
+    def add_contribution(self, payment, is_reinvestment, sign=1):
+        if payment.user_id is None:
+            return
+        deltas = ProjectContribution.objects.payment_deltas(payment, is_reinvestment, sign)
+        contribution = self.contributions[(payment.project_id, payment.user_id)]
+        for field, delta in deltas.items():
+            contribution[field] += delta
+
+    def change_reinvest_pool(self, user, amount, **sources):
+        self.ledger_entries.append(ReinvestLedgerEntry.for_change(user.pk, amount, **sources))
+        user.set_ledger_balance(user.reinvest_pool + float(amount))
+        self.users[user.pk].append(user)
+
+    def release_reinvestment(self, project, amount):
+        self.cap_releases[project.pk] += float(amount)
+        project.monthly_reinvestment_cap += float(amount)
+
+    def touch_project(self, project_id):
+        self.touched_projects.add(project_id)
+
+    def refresh_global_impacts(self):
+        self.global_impacts_changed = True
+
+    def apply(self):
+        """
+        Apply the recorded effects, with a fixed number of statements per kind
+        of effect however many rows recorded them.
+        """
+        added, removed = ProjectContribution.objects.apply_deltas(self.contributions)
+        self.change_donors(added, removed)
+
+        for field, deltas in self.funding.items():
+            ProjectFundingTotals.objects.apply_deltas(field, deltas)
+        for project in self.projects:
+            project.forget_funding_totals()
+        for field, deltas in self.impact.items():
+            UserImpactSnapshot.objects.apply_deltas(field, deltas)
+
+        balances = ReinvestLedgerEntry.objects.record(self.ledger_entries)
+        for user_id, balance in balances.items():
+            for user in self.users[user_id]:
+                user.set_ledger_balance(balance)
+
+        Project.objects.release_reinvestments(self.cap_releases)
+        Project.objects.bump_cache_versions(self.touched_projects)
+        if self.global_impacts_changed:
+            schedule_global_impacts_refresh()
+
+    def change_donors(self, added, removed):
+        """
+        Add and remove (Project pk, RevolvUserProfile pk) pairs to and from
+        Project.donors directly in its table, with one query for the pairs
+        already there, one bulk INSERT and one DELETE. The m2m_changed handler
+        doesn't run for these, so the donor_count and project_count changes it
+        would have made are recorded alongside the other deltas instead.
+        """
+        if not added and not removed:
+            return
+        field = Project._meta.get_field('donors')
+        through = field.rel.through
+        project_attr = field.m2m_field_name()
+        user_attr = field.m2m_reverse_field_name()
+        pairs = set(added) | set(removed)
+        existing = dict(
+            ((project_id, user_id), pk)
+            for pk, project_id, user_id in through.objects.filter(**{
+                project_attr + '__in': set(project_id for project_id, _ in pairs),
+                user_attr + '__in': set(user_id for _, user_id in pairs),
+            }).values_list('pk', project_attr, user_attr)
+        )
+        added = [pair for pair in added if pair not in existing]
+        removed = [pair for pair in removed if pair in existing]
+        through.objects.bulk_create([
+            through(**{project_attr + '_id': project_id, user_attr + '_id': user_id})
+            for project_id, user_id in added
+        ])
+        if removed:
+            through.objects.filter(pk__in=[existing[pair] for pair in removed]).delete()
+        for pairs, sign in ((added, 1), (removed, -1)):
+            for project_id, user_id in pairs:
+                self.funding['donor_count'][project_id] += sign
+                self.impact['project_count'][user_id] += sign
+
+
+def payment_effects():
+    """
+    :return: where the payment handlers should send their effects: the
+    enclosing deferred_payment_effects() block's DeferredPaymentEffects, or an
+    ImmediatePaymentEffects outside of one.
+    """
+    effects = getattr(_state, 'effects', None)
+    if effects is None:
+        return ImmediatePaymentEffects()
+    return effects
+
+
+@contextmanager
+def deferred_payment_effects():
+    """
+    Defer the effects of the payment handlers for everything saved or deleted
+    in the block, and apply them all at once when it exits, in one transaction
+    with the block. If the block raises, nothing of it is kept. Nested blocks
+    are part of the outermost one.
+    """
+    effects = getattr(_state, 'effects', None)
+    if effects is not None:
+        yield effects
+        return
+    effects = DeferredPaymentEffects()
+    _state.effects = effects
+    try:
+        with transaction.atomic():
+            yield effects
+            _state.effects = None
+            effects.apply()
+    finally:
+        _state.effects = None
+    flush_global_impacts_refresh()
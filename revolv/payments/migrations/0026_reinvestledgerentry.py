@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+def open_ledger(apps, schema_editor):
+    """
+    Give every user with a reinvest_pool an opening ledger entry for it, so
+    that the ledger agrees with the existing pools.
+    """
+    RevolvUserProfile = apps.get_model("base", "RevolvUserProfile")
+    ReinvestLedgerEntry = apps.get_model("payments", "ReinvestLedgerEntry")
+    entries = []
+    for user_id, reinvest_pool in RevolvUserProfile.objects.exclude(reinvest_pool=0.0).values_list('pk', 'reinvest_pool'):
+        entries.append(ReinvestLedgerEntry(
+            user_id=user_id,
+            entry_type='CR' if reinvest_pool >= 0 else 'DR',
+            amount=abs(reinvest_pool),
+            balance=reinvest_pool,
+        ))
+    ReinvestLedgerEntry.objects.bulk_create(entries)
+
+
+def close_ledger(apps, schema_editor):
+    ReinvestLedgerEntry = apps.get_model("payments", "ReinvestLedgerEntry")
+    ReinvestLedgerEntry.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_delete_newsletteruser'),
+        ('payments', '0025_auto_20160210_1552'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReinvestLedgerEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('entry_type', models.CharField(max_length=2, choices=[('CR', 'Credit'), ('DR', 'Debit')])),
+                ('amount', models.FloatField()),
+                ('balance', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, db_constraint=False, blank=True, to='payments.Payment', null=True)),
+                ('repayment_fragment', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, db_constraint=False, blank=True, to='payments.RepaymentFragment', null=True)),
+                ('user', models.ForeignKey(to='base.RevolvUserProfile')),
+            ],
+            options={
+                'verbose_name_plural': 'reinvest ledger entries',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(open_ledger, close_ledger),
+    ]
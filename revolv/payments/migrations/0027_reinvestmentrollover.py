@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0026_reinvestledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReinvestmentRollover',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveIntegerField()),
+                ('total_reinvested', models.FloatField(default=0.0)),
+                ('project_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(null=True, blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reinvestmentrollover',
+            unique_together=set([('year', 'month')]),
+        ),
+        migrations.AddField(
+            model_name='adminreinvestment',
+            name='rollover',
+            field=models.ForeignKey(blank=True, to='payments.ReinvestmentRollover', null=True),
+            preserve_default=True,
+        ),
+    ]
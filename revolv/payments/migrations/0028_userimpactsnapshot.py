@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_delete_newsletteruser'),
+        ('payments', '0027_reinvestmentrollover'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserImpactSnapshot',
+            fields=[
+                ('user', models.OneToOneField(related_name='impact_snapshot', primary_key=True, serialize=False, to='base.RevolvUserProfile')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('impact_kilowatts', models.FloatField(default=0.0)),
+                ('total_donated', models.FloatField(default=0.0)),
+                ('total_repayments', models.FloatField(default=0.0)),
+                ('project_count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
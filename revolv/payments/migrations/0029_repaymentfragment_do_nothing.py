@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0028_userimpactsnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='repaymentfragment',
+            name='admin_repayment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='payments.AdminRepayment'),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='repaymentfragment',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='project.Project'),
+            preserve_default=True,
+        ),
+    ]
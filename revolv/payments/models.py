@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from django.contrib.auth.models import User
 
+from revolv.base.principal import flush_pending_principals
 from revolv.lib.utils import ImportProxy
+from revolv.payments.utils import NotEnoughReinvestPoolException
 
 from datetime import date
 
@@ -54,6 +56,10 @@ class AdminRepayment(models.Model):
         When an AdminRepayment is saved, a RepaymentFragment is generated for
         all donors to a project, each weighted by that donor's proportion of the
         contribution to the project.
+    pre_delete
+        Before an AdminRepayment is deleted (one by one, in bulk or by the
+        deletion of its project), all its RepaymentFragments are revoked and
+        deleted in bulk (see RepaymentFragmentManager.revoke_for_admin_repayment).
     """
     amount = models.FloatField()
     admin = models.ForeignKey('base.RevolvUserProfile')
@@ -68,6 +74,52 @@ class AdminRepayment(models.Model):
         return '%s for %s' % (self.amount, self.project)
 
 
+class ReinvestmentRolloverManager(models.Manager):
+    """
+    Manager for ReinvestmentRollover.
+    """
+
+    def for_month(self, year, month):
+        """
+        :return: the ReinvestmentRollover of the given month, created if there
+        isn't one yet.
+        """
+        rollover, _ = self.get_or_create(year=year, month=month)
+        return rollover
+
+
+class ReinvestmentRollover(models.Model):
+    """
+    The automatic reinvestment of one month (see
+    revolv.tasks.reinvestment_rollover), which ties together the
+    AdminReinvestments made into each eligible project, so that running the
+    rollover again for the same month doesn't reinvest twice.
+
+    completed_at is set, together with the totals, once every project's
+    reinvestment has been made.
+    """
+    year = models.PositiveIntegerField()
+    month = models.PositiveIntegerField()
+
+    total_reinvested = models.FloatField(default=0.0)
+    project_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    objects = ReinvestmentRolloverManager()
+
+    class Meta:
+        unique_together = ('year', 'month')
+
+    @property
+    def is_completed(self):
+        return self.completed_at is not None
+
+    def __unicode__(self):
+        return 'Rollover for %s/%s' % (self.month, self.year)
+
+
 class AdminReinvestmentManager(models.Manager):
     """
     Manager for AdminReinvestment.
@@ -85,6 +137,140 @@ class AdminReinvestmentManager(models.Manager):
             queryset = queryset.filter(project=project).order_by('created_at')
         return queryset
 
+    def plan_contributions(self, project, amount):
+        """
+        Choose the users whose reinvest pools will fund a reinvestment of the
+        given amount into the given project, and how much to take from each.
+
+        Users with a non-zero reinvest_pool are taken in order: first the users
+        who prefer one of the project's categories, then everybody else, each
+        group ordered by last name. Every user's whole pool is used, except for
+        the last one, who only gives what is left to reach the amount.
+
+        The users are chosen with one query, which keeps a running total of the
+        pools with a window function and stops as soon as it covers the amount.
+
+        :return: a list of (RevolvUserProfile pk, amount) tuples, in order
+        """
+        profile_model = self.model._meta.get_field('admin').rel.to
+        user_model = profile_model._meta.get_field('user').rel.to
+        preferences = profile_model._meta.get_field('preferred_categories')
+        category_projects = project._meta.get_field_by_name('category')[0].field
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+
+        sql = """
+            SELECT id, reinvest_pool FROM (
+                SELECT id, reinvest_pool, SUM(reinvest_pool) OVER (
+                    ORDER BY preferred DESC, last_name, id ROWS UNBOUNDED PRECEDING
+                ) AS running_total
+                FROM (
+                    SELECT profile.%(profile_pk)s AS id,
+                        profile.%(pool)s AS reinvest_pool,
+                        account.%(last_name)s AS last_name,
+                        CASE WHEN EXISTS (
+                            SELECT 1 FROM %(preferences)s preference
+                            INNER JOIN %(category_projects)s category_project
+                                ON category_project.%(category_projects_category)s = preference.%(preferences_category)s
+                            WHERE preference.%(preferences_profile)s = profile.%(profile_pk)s
+                                AND category_project.%(category_projects_project)s = %%s
+                        ) THEN 1 ELSE 0 END AS preferred
+                    FROM %(profiles)s profile
+                    INNER JOIN %(users)s account ON account.%(user_pk)s = profile.%(profile_user)s
+                    WHERE profile.%(pool)s > 0
+                ) candidates
+            ) pooled
+            WHERE running_total - reinvest_pool < %%s
+            ORDER BY running_total
+        """ % {
+            'profiles': qn(profile_model._meta.db_table),
+            'profile_pk': qn(profile_model._meta.pk.column),
+            'profile_user': qn(profile_model._meta.get_field('user').column),
+            'pool': qn(profile_model._meta.get_field('reinvest_pool').column),
+            'users': qn(user_model._meta.db_table),
+            'user_pk': qn(user_model._meta.pk.column),
+            'last_name': qn(user_model._meta.get_field('last_name').column),
+            'preferences': qn(preferences.m2m_db_table()),
+            'preferences_profile': qn(preferences.m2m_column_name()),
+            'preferences_category': qn(preferences.m2m_reverse_name()),
+            'category_projects': qn(category_projects.m2m_db_table()),
+            'category_projects_category': qn(category_projects.m2m_column_name()),
+            'category_projects_project': qn(category_projects.m2m_reverse_name()),
+        }
+        cursor = connection.cursor()
+        cursor.execute(sql, [project.pk, amount])
+
+        contributions = []
+        total_left = amount
+        for user_id, reinvest_pool in cursor.fetchall():
+            total_left -= reinvest_pool
+            contributions.append((user_id, reinvest_pool + min(0.0, total_left)))
+            if total_left <= 0.0:
+                break
+        return contributions
+
+    def pool_reinvestors(self, reinvestment):
+        """
+        Fund an AdminReinvestment from users' reinvest pools, as planned by
+        plan_contributions: create a 'reinvestment_fragment' Payment for each
+        contributing user, take the contributions out of their reinvest pools and
+        make them donors to the project.
+
+        All of this runs in a fixed number of queries, however many users
+        contribute. Note that the post_save handlers of Payment do not run for
+        the created Payments, so the caller has to update anything else which
+        depends on the project's payments (its funding totals, say).
+
+        The contributing users' rows are locked before their pools are spent, and
+        the contributions are planned again if another reinvestment (e.g. one
+        pooling in parallel into another project) spent from those pools first.
+
+        :return: the list of created Payments
+        """
+        profile_model = self.model._meta.get_field('admin').rel.to
+        with transaction.atomic():
+            while True:
+                contributions = self.plan_contributions(reinvestment.project, reinvestment.amount)
+                if not contributions:
+                    return []
+                pools = dict(
+                    profile_model.objects.select_for_update().filter(
+                        pk__in=[user_id for user_id, _ in contributions]
+                    ).order_by('pk').values_list('pk', 'reinvest_pool')
+                )
+                if all(pools.get(user_id, 0.0) >= amount for user_id, amount in contributions):
+                    break
+
+            payment_type = PaymentType.objects.get_reinvestment_fragment()
+            payments = [
+                Payment(
+                    user_id=user_id,
+                    project=reinvestment.project,
+                    entrant=reinvestment.admin,
+                    payment_type=payment_type,
+                    admin_reinvestment=reinvestment,
+                    amount=amount
+                )
+                for user_id, amount in contributions
+            ]
+            Payment.objects.bulk_create(payments)
+            payment_ids = dict(
+                Payment.objects.filter(admin_reinvestment=reinvestment).values_list('user', 'pk')
+            )
+            ReinvestLedgerEntry.objects.record([
+                ReinvestLedgerEntry.for_change(user_id, -amount, payment_id=payment_ids[user_id])
+                for user_id, amount in contributions
+            ])
+            ProjectContribution = reinvestment.project.contributions.model
+            new_donors = ProjectContribution.objects.record_reinvestments(reinvestment.project, contributions)
+            if new_donors:
+                reinvestment.project.donors.add(*new_donors)
+            UserImpactSnapshot.objects.apply_deltas('impact_kilowatts', dict(
+                (user_id, UserImpactSnapshot.impact_of(amount, reinvestment.project))
+                for user_id, amount in contributions
+            ))
+        return payments
+
 
 class AdminReinvestment(models.Model):
     """
@@ -119,13 +305,13 @@ class AdminReinvestment(models.Model):
     post_save
         When an AdminReinvestment is saved, we pool as many donors as we need to
         fund the reinvestment, prioritizing users that have a preference for the
-        Category of the project begin invested into. We only consider users that
-        have a non-zero pool of investable money.
-        !!! TODO: actually prioritize by Category
+        Category of the project begin invested into, then by last name. We only
+        consider users that have a non-zero pool of investable money.
     """
     amount = models.FloatField()
     admin = models.ForeignKey('base.RevolvUserProfile')
     project = models.ForeignKey("project.Project")
+    rollover = models.ForeignKey(ReinvestmentRollover, blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -235,6 +421,84 @@ class RepaymentFragmentManager(models.Manager):
             queryset = queryset.filter(admin_repayment=kwargs['admin_repayment']).order_by('created_at')
         return queryset
 
+    def create_for_admin_repayment(self, admin_repayment):
+        """
+        Generate the RepaymentFragments for an AdminRepayment, one for each donor
+        to its project, weighted by that donor's proportion of the organic
+        donations to the project (see Project.proportion_donated), and add each
+        fragment to its user's reinvest_pool.
+
+        This runs a fixed number of queries however many donors the project has:
+        one lookup of the donors' organic totals (see
+        revolv.project.models.ProjectContribution), one bulk INSERT of the
+        fragments, one UPDATE of the reinvest pools and one of the donors'
+        UserImpactSnapshots.
+
+        :return: the list of created RepaymentFragments
+        """
+        project = admin_repayment.project
+        donated = dict(project.contributions.values_list('user', 'organic_total'))
+        donor_ids = list(donated)
+        if not donor_ids:
+            return []
+        total_donated = project.amount_donated_organically
+
+        fragments = []
+        for donor_id in donor_ids:
+            proportion = donated.get(donor_id, 0.0) / total_donated
+            assert 0 <= proportion <= 1, "proportion_donated is incorrect!"
+            fragments.append(self.model(
+                user_id=donor_id,
+                project=project,
+                admin_repayment=admin_repayment,
+                amount=proportion * admin_repayment.amount
+            ))
+        with transaction.atomic():
+            self.bulk_create(fragments)
+            fragment_ids = dict(
+                self.get_queryset().filter(admin_repayment=admin_repayment).values_list('user', 'pk')
+            )
+            ReinvestLedgerEntry.objects.record([
+                ReinvestLedgerEntry.for_change(
+                    fragment.user_id, fragment.amount, repayment_fragment_id=fragment_ids[fragment.user_id]
+                )
+                for fragment in fragments
+            ])
+            UserImpactSnapshot.objects.apply_deltas('total_repayments', dict(
+                (fragment.user_id, fragment.amount) for fragment in fragments
+            ))
+        return fragments
+
+    def revoke_for_admin_repayment(self, admin_repayment):
+        """
+        Delete all the RepaymentFragments of an AdminRepayment, taking each one
+        back out of its user's reinvest_pool, in a fixed number of queries.
+
+        :return: the number of revoked RepaymentFragments
+        """
+        fragments = self.get_queryset().filter(admin_repayment=admin_repayment)
+        with transaction.atomic():
+            rows = list(fragments.values_list('pk', 'user', 'amount'))
+            ReinvestLedgerEntry.objects.record([
+                ReinvestLedgerEntry.for_change(user_id, -amount, repayment_fragment_id=fragment_id)
+                for fragment_id, user_id, amount in rows
+            ])
+            repaid = {}
+            for _, user_id, amount in rows:
+                repaid[user_id] = repaid.get(user_id, 0.0) - amount
+            UserImpactSnapshot.objects.apply_deltas('total_repayments', repaid)
+            # a raw delete, so that pre_delete_repayment_fragment doesn't take
+            # the fragments out of the reinvest pools a second time
+            connection = connections[self.db]
+            connection.cursor().execute(
+                'DELETE FROM %s WHERE %s = %%s' % (
+                    connection.ops.quote_name(self.model._meta.db_table),
+                    connection.ops.quote_name(self.model._meta.get_field('admin_repayment').column),
+                ),
+                [admin_repayment.pk]
+            )
+        return len(rows)
+
 
 class RepaymentFragment(models.Model):
     """
@@ -263,8 +527,10 @@ class RepaymentFragment(models.Model):
         the related user.
     """
     user = models.ForeignKey('base.RevolvUserProfile')
-    project = models.ForeignKey("project.Project")
-    admin_repayment = models.ForeignKey(AdminRepayment)
+    # deleting a project deletes its AdminRepayments, whose pre_delete handler
+    # revokes and deletes their fragments, so neither delete cascades to them
+    project = models.ForeignKey("project.Project", on_delete=models.DO_NOTHING)
+    admin_repayment = models.ForeignKey(AdminRepayment, on_delete=models.DO_NOTHING)
 
     amount = models.FloatField()
 
@@ -476,6 +742,56 @@ class PaymentManager(models.Manager):
         else:
             return total_amount
 
+    def impact_kilowatts(self, users):
+        """
+        Compute how many kilowatts of project output each user's payments
+        account for: the sum over the user's payments of
+
+            (payment amount / project funding_goal) * project impact_power
+
+        for many users at once, with one aggregate query over Payment joined
+        to Project. Every impact statistic is proportional to kilowatts (see
+        revolv.project.stats.KilowattStatsAggregator), so this is all we need
+        to compute any of a user's impact statistics.
+
+        :users: RevolvUserProfiles or their pks
+        :return: a dict mapping each user's pk to their kilowatts (0.0 for users
+            without payments)
+        """
+        user_ids = [getattr(user, 'pk', user) for user in users]
+        if not user_ids:
+            return {}
+        project_model = self.model._meta.get_field('project').rel.to
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+
+        sql = """
+            SELECT payment.%(user)s, SUM(
+                payment.%(amount)s / NULLIF(project.%(funding_goal)s, 0) * project.%(impact_power)s
+            )
+            FROM %(payments)s payment
+            INNER JOIN %(projects)s project ON project.%(project_pk)s = payment.%(project)s
+            WHERE payment.%(user)s IN (%(user_ids)s)
+            GROUP BY payment.%(user)s
+        """ % {
+            'payments': qn(self.model._meta.db_table),
+            'user': qn(self.model._meta.get_field('user').column),
+            'project': qn(self.model._meta.get_field('project').column),
+            'amount': qn(self.model._meta.get_field('amount').column),
+            'projects': qn(project_model._meta.db_table),
+            'project_pk': qn(project_model._meta.pk.column),
+            'funding_goal': qn(project_model._meta.get_field('funding_goal').column),
+            'impact_power': qn(project_model._meta.get_field('impact_power').column),
+            'user_ids': ', '.join(['%s'] * len(user_ids)),
+        }
+        cursor = connection.cursor()
+        cursor.execute(sql, user_ids)
+
+        kilowatts = dict((user_id, 0.0) for user_id in user_ids)
+        for user_id, total in cursor.fetchall():
+            kilowatts[user_id] = float(total or 0.0)
+        return kilowatts
+
 
 class Payment(models.Model):
     """
@@ -551,3 +867,321 @@ class Tip(models.Model):
 
     def __unicode__(self):
         return 'Tip of %s from %s at %s' % (self.amount, self.user, self.timestamp)
+
+
+class ReinvestLedgerEntryManager(models.Manager):
+    """
+    Manager for ReinvestLedgerEntry.
+    """
+    # how far below zero a payment may take a balance, for the rounding of the
+    # proportional repayment fragments
+    OVERDRAFT_TOLERANCE = 0.005
+
+    def record(self, entries):
+        """
+        Append unsaved ReinvestLedgerEntries (see ReinvestLedgerEntry.for_change)
+        to the ledger, and apply them to the users' reinvest_pool.
+
+        Every entry's balance is the running balance of the user's latest entry
+        plus its own amount, so the ledger, not reinvest_pool, is what the
+        balances come from. The users' profile rows are locked (in pk order, so
+        that concurrent writers can't deadlock) for the rest of the
+        transaction, so every entry sees the balance left by the one before it,
+        whichever process or Celery worker wrote it, and no update is lost.
+        Runs a fixed number of queries however many entries there are. If this
+        is the outermost transaction, the users' cached principals are
+        forgotten again once it has committed.
+
+        A payment can't take a user's balance below zero (see
+        NotEnoughReinvestPoolException), but revoking a repayment fragment can,
+        since its money may have been reinvested already.
+
+        :return: a dict mapping each user's pk to their new balance
+        """
+        entries = [entry for entry in entries if entry.amount]
+        if not entries:
+            return {}
+        profile_model = self.model._meta.get_field('user').rel.to
+        user_ids = sorted(set(entry.user_id for entry in entries))
+        with transaction.atomic():
+            balances = self.balances(user_ids, for_update=True)
+            for entry in entries:
+                balances[entry.user_id] += entry.signed_amount
+                entry.balance = balances[entry.user_id]
+                if (entry.payment_id is not None and entry.entry_type == entry.DEBIT and
+                        entry.balance < -self.OVERDRAFT_TOLERANCE):
+                    raise NotEnoughReinvestPoolException(
+                        'Payment %s would take the reinvest pool of user %s to %s' % (
+                            entry.payment_id, entry.user_id, entry.balance
+                        )
+                    )
+            self.bulk_create(entries)
+            profile_model.objects.set_reinvest_pools(balances)
+        flush_pending_principals(using=self.db)
+        return balances
+
+    def credit(self, user, amount, **sources):
+        """
+        Add amount to (or, if it is negative, take it out of) the user's
+        reinvest_pool, recording where it came from or went (a
+        repayment_fragment or payment), and update the user instance too.
+        """
+        balances = self.record([self.model.for_change(user.pk, amount, **sources)])
+        user.set_ledger_balance(balances.get(user.pk, user.reinvest_pool))
+
+    def balances(self, user_ids, for_update=False):
+        """
+        :return: a dict mapping each of the given RevolvUserProfile pks to the
+        user's balance according to the ledger, i.e. the running balance of
+        their latest entry (0.0 if they have none), in one query.
+
+        :for_update: whether to also lock the users' profile rows, in pk order,
+            for the rest of the transaction
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        profile_model = self.model._meta.get_field('user').rel.to
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT profile.{pk}, COALESCE(('
+            '  SELECT entry.{balance} FROM {ledger} entry WHERE entry.{user} = profile.{pk} '
+            '  ORDER BY entry.{id} DESC LIMIT 1'
+            '), 0.0) FROM {profile} profile WHERE profile.{pk} IN ({ids}) ORDER BY profile.{pk}{lock}'.format(
+                pk=qn(profile_model._meta.pk.column),
+                profile=qn(profile_model._meta.db_table),
+                ledger=qn(self.model._meta.db_table),
+                balance=qn(self.model._meta.get_field('balance').column),
+                user=qn(self.model._meta.get_field('user').column),
+                id=qn(self.model._meta.pk.column),
+                ids=', '.join(['%s'] * len(user_ids)),
+                lock=' FOR UPDATE OF profile' if for_update else '',
+            ),
+            user_ids
+        )
+        return dict((user_id, float(balance)) for user_id, balance in cursor.fetchall())
+
+
+class ReinvestLedgerEntry(models.Model):
+    """
+    One credit to or debit from a user's pool of reinvestable money, together
+    with the user's running balance after it.
+
+    The ledger is append-only: money coming back when a RepaymentFragment or a
+    reinvestment Payment is revoked is recorded as a new, opposite entry, and
+    entries outlive their sources (so the source of an old entry may not exist
+    anymore).
+    RevolvUserProfile.reinvest_pool is a projection of the user's latest
+    balance, which is only ever written by ReinvestLedgerEntryManager.record,
+    under a lock on the user's row.
+    """
+    CREDIT = 'CR'
+    DEBIT = 'DR'
+    ENTRY_TYPE_CHOICES = ((CREDIT, 'Credit'), (DEBIT, 'Debit'))
+
+    user = models.ForeignKey('base.RevolvUserProfile')
+    entry_type = models.CharField(max_length=2, choices=ENTRY_TYPE_CHOICES)
+    amount = models.FloatField()
+    balance = models.FloatField()
+
+    repayment_fragment = models.ForeignKey(RepaymentFragment, blank=True, null=True,
+                                           on_delete=models.DO_NOTHING, db_constraint=False)
+    payment = models.ForeignKey(Payment, blank=True, null=True,
+                                on_delete=models.DO_NOTHING, db_constraint=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ReinvestLedgerEntryManager()
+
+    class Meta:
+        verbose_name_plural = 'reinvest ledger entries'
+
+    @classmethod
+    def for_change(cls, user_id, amount, **sources):
+        """
+        :return: an unsaved entry changing the given user's balance by amount
+        (a credit if it is positive, a debit if negative), to be passed to
+        ReinvestLedgerEntry.objects.record.
+        """
+        return cls(
+            user_id=user_id,
+            entry_type=cls.CREDIT if amount >= 0 else cls.DEBIT,
+            amount=abs(float(amount)),
+            **sources
+        )
+
+    @property
+    def signed_amount(self):
+        return self.amount if self.entry_type == self.CREDIT else -self.amount
+
+    def __unicode__(self):
+        return '%s of %s for %s' % (self.get_entry_type_display(), self.amount, self.user)
+
+
+# Bump this whenever what a UserImpactSnapshot holds, or how it is computed,
+# changes: snapshots of an older version are rebuilt the next time they are
+# read (and by `manage.py rebuildimpactsnapshots`).
+USER_IMPACT_SNAPSHOT_VERSION = 1
+
+
+class UserImpactSnapshotManager(models.Manager):
+    """
+    Manager for UserImpactSnapshot.
+    """
+
+    def get_for_user(self, user):
+        """
+        :return: the UserImpactSnapshot for user. If the user does not have a
+        snapshot yet, or it is of an older USER_IMPACT_SNAPSHOT_VERSION, it is
+        rebuilt from the payment tables and saved.
+        """
+        try:
+            snapshot = self.get_queryset().get(user_id=user.pk)
+        except UserImpactSnapshot.DoesNotExist:
+            snapshot = None
+        if snapshot is None or snapshot.version < USER_IMPACT_SNAPSHOT_VERSION:
+            snapshot = self.rebuild([user.pk])[0]
+        return snapshot
+
+    def apply_delta(self, user, **deltas):
+        """
+        Atomically add deltas (a mapping of field name to amount) to the
+        snapshot of the given user (a RevolvUserProfile or its pk) with a single
+        UPDATE using F expressions.
+
+        If the user has no snapshot yet we do nothing: it will be built from
+        scratch, including this change, the next time it is read.
+
+        :return: the number of rows updated (0 or 1)
+        """
+        deltas = dict((field, delta) for field, delta in deltas.items() if delta)
+        user_id = getattr(user, 'pk', user)
+        if user_id is None or not deltas:
+            return 0
+        return self.get_queryset().filter(user_id=user_id).update(
+            **dict((field, models.F(field) + delta) for field, delta in deltas.items())
+        )
+
+    def apply_deltas(self, field, deltas, batch_size=500):
+        """
+        Atomically add a different amount to the given field of many users'
+        snapshots, using one UPDATE per batch of users.
+
+        :deltas: A dict mapping RevolvUserProfile pks to the amount to add
+        :return: the number of rows updated
+        """
+        deltas = dict((user_id, delta) for user_id, delta in deltas.items() if user_id is not None and delta)
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        column = qn(self.model._meta.get_field(field).column)
+        user_ids = sorted(deltas)
+        cursor = connection.cursor()
+        updated = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            params = []
+            for user_id in batch:
+                params.extend([user_id, deltas[user_id]])
+            params.extend(batch)
+            cursor.execute(
+                'UPDATE %(table)s SET %(column)s = %(column)s + CASE %(fk)s %(cases)s END '
+                'WHERE %(fk)s IN (%(ids)s)' % {
+                    'table': qn(self.model._meta.db_table),
+                    'column': column,
+                    'fk': qn(self.model._meta.get_field('user').column),
+                    'cases': ' '.join(['WHEN %s THEN %s'] * len(batch)),
+                    'ids': ', '.join(['%s'] * len(batch)),
+                },
+                params
+            )
+            updated += cursor.rowcount
+        return updated
+
+    def rebuild(self, user_ids):
+        """
+        Recompute the snapshots of the given users (RevolvUserProfile pks) from
+        the Payment, RepaymentFragment and donor tables, with one GROUP BY query
+        per figure, and replace the stored snapshots with them.
+
+        :return: the list of rebuilt UserImpactSnapshots
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        profile_model = self.model._meta.get_field('user').rel.to
+
+        def sums_by_user(queryset):
+            rows = queryset.filter(user__in=user_ids).values('user').annotate(
+                total=models.Sum('amount')
+            ).order_by()
+            return dict((row['user'], row['total'] or 0.0) for row in rows)
+
+        kilowatts = Payment.objects.impact_kilowatts(user_ids)
+        donated = sums_by_user(Payment.objects.filter(entrant__pk=models.F('user__pk')))
+        repaid = sums_by_user(RepaymentFragment.objects.all())
+        project_rows = profile_model.project_set.through.objects.filter(
+            revolvuserprofile__in=user_ids
+        ).values('revolvuserprofile').annotate(total=models.Count('project')).order_by()
+        projects = dict((row['revolvuserprofile'], row['total']) for row in project_rows)
+
+        snapshots = [
+            UserImpactSnapshot(
+                user_id=user_id,
+                version=USER_IMPACT_SNAPSHOT_VERSION,
+                impact_kilowatts=kilowatts.get(user_id, 0.0),
+                total_donated=donated.get(user_id, 0.0),
+                total_repayments=repaid.get(user_id, 0.0),
+                project_count=projects.get(user_id, 0),
+            )
+            for user_id in user_ids
+        ]
+        try:
+            with transaction.atomic():
+                self.get_queryset().filter(user__in=user_ids).delete()
+                self.bulk_create(snapshots)
+        except IntegrityError:
+            # somebody else built the snapshot of one of these users while we
+            # were aggregating; theirs is just as fresh as ours.
+            pass
+        return snapshots
+
+
+class UserImpactSnapshot(models.Model):
+    """
+    Denormalized dashboard figures for a single user: the kilowatts of project
+    output their payments account for (see PaymentManager.impact_kilowatts),
+    how much they donated organically, how much has been repaid to them and
+    how many projects they are a donor to.
+
+    The handlers in revolv.payments.signals (and the bulk repayment and
+    reinvestment methods in this module) adjust the snapshot as Payments,
+    RepaymentFragments and donors are added and removed, so that the dashboard
+    reads one row however much history the user has.
+
+    A snapshot is built lazily from the payment tables the first time it is
+    read, and rebuilt when USER_IMPACT_SNAPSHOT_VERSION is bumped.
+    """
+    user = models.OneToOneField('base.RevolvUserProfile', primary_key=True, related_name='impact_snapshot')
+    version = models.PositiveIntegerField(default=USER_IMPACT_SNAPSHOT_VERSION)
+
+    impact_kilowatts = models.FloatField(default=0.0)
+    total_donated = models.FloatField(default=0.0)
+    total_repayments = models.FloatField(default=0.0)
+    project_count = models.IntegerField(default=0)
+
+    objects = UserImpactSnapshotManager()
+
+    def __unicode__(self):
+        return 'Impact snapshot for %s' % self.user_id
+
+    @classmethod
+    def impact_of(cls, amount, project):
+        """
+        :return: the kilowatts a payment of amount to project accounts for,
+        i.e. (amount / funding_goal) * impact_power.
+        """
+        if not project.funding_goal:
+            return 0.0
+        return float(amount) / float(project.funding_goal) * project.impact_power
@@ -1,13 +1,47 @@
 from django.db.models import signals, Sum
 from django.dispatch import receiver
 
-from revolv.base.models import RevolvUserProfile
 from revolv.base.utils import is_user_reinvestment_period
-from revolv.payments.models import (AdminReinvestment, AdminRepayment, Payment,
-                                    PaymentType, RepaymentFragment, UserReinvestment)
+from revolv.payments.effects import payment_effects
+from revolv.payments.models import (AdminReinvestment, AdminRepayment, Payment, PaymentType,
+                                    RepaymentFragment, UserImpactSnapshot, UserReinvestment)
 from revolv.payments.utils import (NotEnoughFundingException, NotInUserReinvestmentPeriodException,
                                    ProjectNotCompleteException, NotInAdminReinvestmentPeriodException,
                                    ProjectNotEligibleException)
+from revolv.project.models import Project, ProjectFundingTotals
+
+# how many donors' impact snapshots are rebuilt at a time when a project's
+# funding_goal or impact_power changes
+IMPACT_REBUILD_BATCH_SIZE = 500
+
+
+def payment_funding_deltas(payment, is_reinvestment, sign=1):
+    """
+    :return: the changes that creating (sign=1) or deleting (sign=-1) the
+        given Payment makes to its project's ProjectFundingTotals, as a dict
+        suitable for ProjectFundingTotals.objects.apply_delta.
+    """
+    amount = sign * float(payment.amount)
+    is_organic = payment.user_id is not None and payment.user_id == payment.entrant_id
+    return {
+        'amount_donated': amount,
+        'amount_donated_organically': amount if is_organic else 0.0,
+        'amount_reinvested': amount if is_reinvestment else 0.0,
+    }
+
+
+def payment_impact_deltas(payment, sign=1):
+    """
+    :return: the changes that creating (sign=1) or deleting (sign=-1) the
+        given Payment makes to its user's UserImpactSnapshot, as a dict
+        suitable for UserImpactSnapshot.objects.apply_delta.
+    """
+    amount = sign * float(payment.amount)
+    is_organic = payment.user_id is not None and payment.user_id == payment.entrant_id
+    return {
+        'impact_kilowatts': UserImpactSnapshot.impact_of(amount, payment.project),
+        'total_donated': amount if is_organic else 0.0,
+    }
 
 
 @receiver(signals.pre_init, sender=AdminRepayment)
@@ -31,20 +65,39 @@ def post_save_admin_repayment(**kwargs):
     """
     When an AdminRepayment is saved, a RepaymentFragment is generated for all
     donors to a project, each weighed by that donor's proportion of the
-    contribution to the project.
+    contribution to the project. The fragments are created, and the donors'
+    reinvest pools incremented, in bulk.
     """
     if not kwargs.get('created'):
         return
     instance = kwargs.get('instance')
-    for donor in instance.project.donors.all():
-        amount = instance.project.proportion_donated(donor) * instance.amount
-        repayment = RepaymentFragment(user=donor,
-                                      project=instance.project,
-                                      admin_repayment=instance,
-                                      amount=amount
-                                      )
-        # user's reinvest_pool will be incremented on save
-        repayment.save()
+    effects = payment_effects()
+    effects.add_funding(instance.project, amount_repaid=float(instance.amount))
+    RepaymentFragment.objects.create_for_admin_repayment(instance)
+    effects.touch_project(instance.project_id)
+
+
+@receiver(signals.pre_delete, sender=AdminRepayment)
+def pre_delete_admin_repayment(**kwargs):
+    """
+    Before an AdminRepayment is deleted, revoke and delete all its
+    RepaymentFragments in bulk, taking them back out of the donors' reinvest
+    pools. This runs for queryset and admin deletes too, unlike an override of
+    AdminRepayment.delete.
+    """
+    RepaymentFragment.objects.revoke_for_admin_repayment(kwargs.get('instance'))
+
+
+@receiver(signals.post_delete, sender=AdminRepayment)
+def post_delete_admin_repayment(**kwargs):
+    """
+    After an AdminRepayment is deleted, take it out of the project's repaid
+    total.
+    """
+    instance = kwargs.get('instance')
+    effects = payment_effects()
+    effects.add_funding(instance.project_id, amount_repaid=-float(instance.amount))
+    effects.touch_project(instance.project_id)
 
 
 @receiver(signals.pre_init, sender=AdminReinvestment)
@@ -84,114 +137,196 @@ def post_save_admin_reinvestment(**kwargs):
     Category of the project begin invested into and the by order them by thier
     last name. We only consider users that have a non-zero pool of investable money.
 
+    The reinvestment fragment Payments are created in bulk (see
+    AdminReinvestmentManager.pool_reinvestors), so we do the bookkeeping that
+    post_save_payment would have done for them here, all at once.
     """
     if not kwargs.get('created'):
         return
     instance = kwargs.get('instance')
-    total_left = instance.amount
-    pending_reinvestors = []
-
-    project = instance.project
-    # the list of users with at least one preferred category that matches any of the
-    # categories that the project is tagged with
-    users_with_preferences = RevolvUserProfile.objects.filter(preferred_categories__in=project.category_set.all()).filter(reinvest_pool__gt=0.0)
-    # iterates through users with preferred categories first
-    for user in users_with_preferences:
-        total_left -= user.reinvest_pool
-        reinvest_amount = user.reinvest_pool + min(0.0, total_left)
-        pending_reinvestors.append((user, reinvest_amount))
-        if total_left <= 0.0:
-            break
-
-    # if we still have money we want to reinvest, loop through users without preferences
-    if total_left > 0.0:
-        users_without_preferences = RevolvUserProfile.objects.filter(reinvest_pool__gt=0.0)\
-            .exclude(pk__in=users_with_preferences).order_by('user__last_name')
-        for user in users_without_preferences:
-            total_left -= user.reinvest_pool
-            reinvest_amount = user.reinvest_pool + min(0.0, total_left)
-            pending_reinvestors.append((user, reinvest_amount))
-            if total_left <= 0.0:
-                break
-    for (user, amount) in pending_reinvestors:
-        reinvestment = Payment(user=user,
-                               project=instance.project,
-                               entrant=instance.admin,
-                               payment_type=PaymentType.objects.get_reinvestment_fragment(),
-                               admin_reinvestment=instance,
-                               amount=amount
-                               )
-        # user's reinvest_pool will be decremented on this Payment's save
-        reinvestment.save()
+    payments = AdminReinvestment.objects.pool_reinvestors(instance)
+    deltas = {}
+    for payment in payments:
+        for field, delta in payment_funding_deltas(payment, True).items():
+            deltas[field] = deltas.get(field, 0.0) + delta
+    effects = payment_effects()
+    effects.add_funding(instance.project, **deltas)
+    effects.touch_project(instance.project_id)
 
 
 @receiver(signals.post_save, sender=RepaymentFragment)
 def post_save_repayment_fragment(**kwargs):
     """
     When a RepaymentFragment is saved, we increment the reinvest_pool in the
-    related user.
+    related user, by crediting it in the reinvestment ledger, and the user's
+    repaid total.
     """
     if not kwargs.get('created'):
         return
     instance = kwargs.get('instance')
-    instance.user.reinvest_pool += float(instance.amount)
-    instance.user.save()
+    effects = payment_effects()
+    effects.change_reinvest_pool(instance.user, float(instance.amount), repayment_fragment=instance)
+    effects.add_impact(instance.user_id, total_repayments=float(instance.amount))
 
 
 @receiver(signals.pre_delete, sender=RepaymentFragment)
 def pre_delete_repayment_fragment(**kwargs):
     """
     Before a RepaymentFragment is deleted, we decrement the reinvest_pool in the
-    related user.
+    related user, by debiting it in the reinvestment ledger, and the user's
+    repaid total.
     """
     instance = kwargs.get('instance')
-    instance.user.reinvest_pool -= float(instance.amount)
-    instance.user.save()
+    effects = payment_effects()
+    effects.change_reinvest_pool(instance.user, -float(instance.amount), repayment_fragment=instance)
+    effects.add_impact(instance.user_id, total_repayments=-float(instance.amount))
 
 
 @receiver(signals.post_save, sender=Payment)
 def post_save_payment(**kwargs):
     """
-    If the payment is organic, we add this payment's user as a donor to the
-    related project. If the payment is a reinvestment, we decrement the
-    reinvest_pool in the related user.
+    We add the payment to its user's ProjectContribution to the related
+    project, and if it is the user's first payment to the project we add them
+    as a donor. If the payment is a reinvestment, we decrement the
+    reinvest_pool in the related user. Either way, the payment is added to the
+    user's UserImpactSnapshot, and the project's cached fragments are made
+    stale.
     """
     if not kwargs.get('created'):
         return
     instance = kwargs.get('instance')
-    #if instance.is_organic:
-    instance.project.donors.add(instance.user)
-    if instance.payment_type == PaymentType.objects.get_reinvestment_fragment():
-        instance.user.reinvest_pool -= float(instance.amount)
-        instance.project.monthly_reinvestment_cap -= float(instance.amount)
-        instance.user.save()
+    is_reinvestment = instance.payment_type == PaymentType.objects.get_reinvestment_fragment()
+    effects = payment_effects()
+    effects.add_funding(instance.project, **payment_funding_deltas(instance, is_reinvestment))
+    effects.add_impact(instance.user_id, **payment_impact_deltas(instance))
+    effects.refresh_global_impacts()
+    effects.add_contribution(instance, is_reinvestment)
+    if is_reinvestment:
+        effects.change_reinvest_pool(instance.user, -float(instance.amount), payment=instance)
+    effects.touch_project(instance.project_id)
 
 
 @receiver(signals.pre_delete, sender=Payment)
 def pre_delete_payment(**kwargs):
     """
-    Before a Payment is deleted, if it is a reinvestment, we increment the
+    Before a Payment is deleted, we take it out of its user's
+    ProjectContribution, removing the user from the project's donors if it was
+    their last payment to it. If it is a reinvestment, we increment the
     reinvest_pool in the related user.
     """
     instance = kwargs.get('instance')
-    # if instance.is_organic:
-    donation_count = instance.project.payment_set.filter(
-                user=instance.user).count()
-    if donation_count == 1:
-        instance.project.donors.remove(instance.user)
-    if instance.payment_type == PaymentType.objects.get_reinvestment_fragment():
-        instance.user.reinvest_pool += float(instance.amount)
-        instance.project.monthly_reinvestment_cap += float(instance.amount)
-        instance.user.save()
+    is_reinvestment = instance.payment_type == PaymentType.objects.get_reinvestment_fragment()
+    effects = payment_effects()
+    effects.add_funding(instance.project, **payment_funding_deltas(instance, is_reinvestment, sign=-1))
+    effects.add_impact(instance.user_id, **payment_impact_deltas(instance, sign=-1))
+    effects.refresh_global_impacts()
+    effects.add_contribution(instance, is_reinvestment, sign=-1)
+    if is_reinvestment:
+        effects.change_reinvest_pool(instance.user, float(instance.amount), payment=instance)
+        if instance.user_reinvestment_id is not None:
+            # give the user's reservation back to this month's cap
+            effects.release_reinvestment(instance.project, instance.amount)
+
+
+@receiver(signals.pre_save, sender=Project)
+def pre_save_project(**kwargs):
+    """
+    Note whether the save changes the project's funding_goal or impact_power,
+    which its donors' impact (see UserImpactSnapshot.impact_of) depends on, and
+    whether it changes any of the fields the global impact counters (see
+    revolv.base.impact) depend on.
+    """
+    instance = kwargs.get('instance')
+    if kwargs.get('raw') or instance.pk is None:
+        return
+    stored = Project.objects.filter(pk=instance.pk).values_list(
+        'funding_goal', 'impact_power', 'project_status', 'people_affected'
+    ).first()
+    if stored is None:
+        # an insert with an explicit pk, which post_save_project handles as such
+        return
+    funding_goal, impact_power, project_status, people_affected = stored
+    instance._impact_changed = (
+        float(funding_goal) != float(instance.funding_goal) or float(impact_power) != float(instance.impact_power)
+    )
+    instance._global_impacts_changed = instance._impact_changed or (
+        project_status != instance.project_status or people_affected != instance.people_affected
+    )
+
+
+@receiver(signals.post_save, sender=Project)
+def post_save_project(**kwargs):
+    """
+    When a Project is created, give it empty ProjectFundingTotals for the
+    payment handlers to maintain. A new project, or a change to its status,
+    people_affected, funding_goal or impact_power, may change the global impact
+    counters, so have them refreshed too, and a change to its funding_goal or
+    impact_power changes the impact of all its donors, so rebuild their
+    UserImpactSnapshots.
+    """
+    if kwargs.get('raw'):
+        return
+    instance = kwargs.get('instance')
+    if kwargs.get('created') or getattr(instance, '_global_impacts_changed', False):
+        instance._global_impacts_changed = False
+        payment_effects().refresh_global_impacts()
+    if getattr(instance, '_impact_changed', False):
+        instance._impact_changed = False
+        donor_ids = list(instance.donors.values_list('pk', flat=True))
+        for start in range(0, len(donor_ids), IMPACT_REBUILD_BATCH_SIZE):
+            UserImpactSnapshot.objects.rebuild(donor_ids[start:start + IMPACT_REBUILD_BATCH_SIZE])
+    if not kwargs.get('created'):
+        return
+    ProjectFundingTotals.objects.get_or_create(project=instance)
+
+
+@receiver(signals.m2m_changed, sender=Project.donors.through)
+def m2m_changed_project_donors(**kwargs):
+    """
+    Keep the donor_count in each project's ProjectFundingTotals, and the
+    project_count in each donor's UserImpactSnapshot, in step with the
+    project's donors, whichever side of the relation is changed.
+    """
+    action = kwargs.get('action')
+    instance = kwargs.get('instance')
+    pk_set = [pk for pk in kwargs.get('pk_set') or [] if pk is not None]
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    sign = 1 if action == 'post_add' else -1
+
+    if kwargs.get('reverse'):
+        # instance is a RevolvUserProfile, pk_set holds project pks
+        if action == 'pre_clear':
+            pk_set = list(instance.project_set.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            return
+        for project_id in pk_set:
+            ProjectFundingTotals.objects.apply_delta(project_id, donor_count=sign)
+        UserImpactSnapshot.objects.apply_delta(instance, project_count=sign * len(pk_set))
+    else:
+        # instance is a Project, pk_set holds RevolvUserProfile pks
+        if action == 'pre_clear':
+            UserImpactSnapshot.objects.apply_deltas('project_count', dict(
+                (user_id, -1) for user_id in instance.donors.values_list('pk', flat=True)
+            ))
+            return
+        if action == 'post_clear':
+            instance.forget_funding_totals()
+            ProjectFundingTotals.objects.filter(project=instance).update(donor_count=0)
+            return
+        ProjectFundingTotals.objects.apply_delta(instance, donor_count=sign * len(pk_set))
+        UserImpactSnapshot.objects.apply_deltas('project_count', dict((user_id, sign) for user_id in pk_set))
 
 
 @receiver(signals.post_delete, sender=Payment)
 def post_delete_payment(**kwargs):
     """
     We need to cleanup here. If this related to UserReinvestment then just delete it.
-    For AdminReinvestment we need some checking
+    For AdminReinvestment we need some checking. Either way, the project's
+    cached fragments are made stale.
     """
     instance = kwargs.get('instance')
+    payment_effects().touch_project(instance.project_id)
     if instance.user_reinvestment:
         instance.user_reinvestment.delete()
     if instance.admin_reinvestment:
@@ -224,16 +359,22 @@ def pre_save_user_reinvestment(**kwargs):
     """
     We cap the amount here by monthly allocation and funding goal itself
     We'll pick the minimum. Any balance we'll keep for the next cycle
+
+    The amount is reserved from the project's monthly_reinvestment_cap (see
+    Project.reserve_reinvestment), so that simultaneous reinvestments can't
+    overrun the cap.
     """
     instance = kwargs.get('instance')
+    if instance.pk is not None:
+        return
     project = instance.project
 
-    total_left = project.reinvest_amount_left
-    if total_left <= 0.0:
+    granted = project.reserve_reinvestment(instance.amount)
+    if granted <= 0.0:
         raise ProjectNotEligibleException()
-    if total_left < float(instance.amount):
-        instance.amount = total_left
+    instance.amount = granted
     if instance.user.reinvest_pool < float(instance.amount):
+        project.release_reinvestment(granted)
         raise NotEnoughFundingException()
 
 
@@ -0,0 +1,49 @@
+from django.test import TestCase
+from revolv.base.models import RevolvUserProfile
+from revolv.payments.allocation import (AllocationPlannerException, equal_split,
+                                        plan_allocation, proportional_to_amount_left)
+from revolv.payments.models import ReinvestLedgerEntry
+from revolv.project.models import Project
+
+
+class AllocationPlannerTest(TestCase):
+
+    def test_unknown_strategy(self):
+        """
+        Verify that planning with a strategy we don't know about fails.
+        """
+        with self.assertRaises(AllocationPlannerException):
+            plan_allocation('lottery')
+
+    def test_strategies_split_whole_balance(self):
+        """
+        Verify that the built-in strategies split exactly the given balance.
+        """
+        Project.factories.active.create_batch(2)
+        Project.factories.active.create(funding_goal=150.0)
+        recipients = list(Project.objects.get_active())
+
+        caps = equal_split(90.0, recipients)
+        self.assertEqual(set(caps.values()), set([30.0]))
+
+        caps = proportional_to_amount_left(100.0, recipients)
+        self.assertAlmostEqual(sum(caps.values()), 100.0)
+        self.assertAlmostEqual(max(caps.values()), 60.0)
+
+    def test_apply_sets_caps(self):
+        """
+        Verify that applying a plan sets the planned cap of every recipient,
+        and that a plan which is only described leaves the caps untouched.
+        """
+        admin = RevolvUserProfile.factories.base.create()
+        ReinvestLedgerEntry.objects.credit(admin, 40.0)
+        first, second = Project.factories.active.create_batch(2)
+
+        plan = plan_allocation('equal')
+        self.assertEqual(plan.balance, 40.0)
+        self.assertTrue(plan.describe())
+        self.assertEqual(Project.objects.get(pk=first.pk).monthly_reinvestment_cap, 0.0)
+
+        plan.apply(admin)
+        self.assertEqual(Project.objects.get(pk=first.pk).monthly_reinvestment_cap, 20.0)
+        self.assertEqual(Project.objects.get(pk=second.pk).monthly_reinvestment_cap, 20.0)
@@ -1,12 +1,18 @@
 import factory
+import mock
 from django.db.models import signals, Sum
 from django.test import TestCase
 from revolv.base.models import RevolvUserProfile
+from revolv.payments.effects import deferred_payment_effects
 from revolv.payments.models import (AdminReinvestment, AdminRepayment, Payment,
-                                    PaymentType, RepaymentFragment)
-from revolv.payments.utils import (NotEnoughFundingException,
+                                    PaymentType, ReinvestLedgerEntry, ReinvestmentRollover,
+                                    RepaymentFragment, UserImpactSnapshot)
+from revolv.payments.utils import (NotEnoughFundingException, NotEnoughReinvestPoolException,
                                    ProjectNotCompleteException)
-from revolv.project.models import Category, Project
+from revolv.project.models import Category, Project, ProjectContribution, ProjectFundingTotals
+from revolv.project.stats import KilowattStatsAggregator
+from revolv.project.utils import aggregate_stats
+from revolv.tasks.reinvestment_rollover import finish_reinvestment_rollover, MissingAdminError, reinvest_into_project
 
 
 class PaymentTest(TestCase):
@@ -355,6 +361,229 @@ class PaymentTest(TestCase):
         self.assertEquals(user1.reinvest_pool, 150.00)
         self.assertEquals(user2.reinvest_pool, 50.00)
 
+    def test_repayment_is_set_based(self):
+        """
+        Test that repayments and their revocation run a fixed number of queries
+        however many donors a project has, and match the per-donor proportions.
+        """
+        donors = RevolvUserProfile.factories.base.create_batch(5)
+        admin = RevolvUserProfile.factories.admin.create()
+        project = Project.factories.base.create()
+        for i, donor in enumerate(donors):
+            self._create_payment(donor, amount=10.00 * (i + 1), project=project).save()
+        # a non-organic donation makes its user a donor without a share of repayments
+        self._create_payment(donors[0], amount=50.00, project=project, entrant=admin).save()
+        project.complete_project()
+        expected = dict(
+            (donor.pk, project.proportion_donated(donor) * 75.00) for donor in donors
+        )
+
+        repayment = self._create_admin_repayment(admin, amount=75.00, project=project)
+        with self.assertNumQueries(14):
+            repayment.save()
+        for donor in donors:
+            donor = RevolvUserProfile.objects.get(pk=donor.pk)
+            self.assertEqual(donor.reinvest_pool, expected[donor.pk])
+            self.assertEqual(donor.repaymentfragment_set.get().amount, expected[donor.pk])
+
+        with self.assertNumQueries(12):
+            repayment.delete()
+        self.assertFalse(RepaymentFragment.objects.filter(project=project).exists())
+        for donor in donors:
+            self.assertEqual(RevolvUserProfile.objects.get(pk=donor.pk).reinvest_pool, 0.0)
+
+        # bulk deletes (e.g. the admin's delete action) revoke the fragments too
+        self._create_admin_repayment(admin, amount=75.00, project=project).save()
+        AdminRepayment.objects.filter(project=project).delete()
+        self.assertFalse(RepaymentFragment.objects.filter(project=project).exists())
+        for donor in donors:
+            self.assertEqual(RevolvUserProfile.objects.get(pk=donor.pk).reinvest_pool, 0.0)
+            self.assertEqual(ReinvestLedgerEntry.objects.filter(user=donor).count(), 4)
+
+    @mock.patch('revolv.payments.signals.is_user_reinvestment_period', return_value=False)
+    def test_user_impact_snapshot(self, mock_period):
+        """
+        Test that the payment handlers keep users' impact snapshots equal to
+        what rebuilding them from the payment tables gives.
+        """
+        donor1, donor2 = RevolvUserProfile.factories.base.create_batch(2)
+        admin = RevolvUserProfile.factories.admin.create()
+        project1 = Project.factories.base.create(funding_goal=100.0, impact_power=10.0)
+        project2 = Project.factories.base.create(funding_goal=50.0, impact_power=40.0)
+        for user in (donor1, donor2, admin):
+            UserImpactSnapshot.objects.get_for_user(user)
+
+        self._create_payment(donor1, amount=60.00, project=project1).save()
+        self._create_payment(donor2, amount=40.00, project=project1).save()
+        project1.complete_project()
+        self._create_admin_repayment(admin, amount=50.00, project=project1).save()
+        self._create_admin_reinvestment(admin, 25.00, project=project2).save()
+        payment = self._create_payment(donor2, amount=10.00, project=project2)
+        payment.save()
+        payment.delete()
+
+        fields = ('impact_kilowatts', 'total_donated', 'total_repayments', 'project_count')
+        maintained = dict(
+            (snapshot.user_id, [getattr(snapshot, field) for field in fields])
+            for snapshot in UserImpactSnapshot.objects.all()
+        )
+        rebuilt = dict(
+            (snapshot.user_id, [getattr(snapshot, field) for field in fields])
+            for snapshot in UserImpactSnapshot.objects.rebuild([donor1.pk, donor2.pk, admin.pk])
+        )
+        for user_id in rebuilt:
+            for value, expected in zip(maintained[user_id], rebuilt[user_id]):
+                self.assertAlmostEqual(value, expected)
+        self.assertEqual(maintained[donor1.pk][1:], [60.00, 30.00, 2])
+
+    def test_user_impact_follows_project_edits(self):
+        """
+        Test that editing a project's funding goal or impact power updates its
+        donors' impact, and that other edits leave the snapshots alone.
+        """
+        donor = RevolvUserProfile.factories.base.create()
+        project = Project.factories.base.create(funding_goal=100.0, impact_power=10.0)
+        self._create_payment(donor, amount=50.00, project=project).save()
+        self.assertAlmostEqual(UserImpactSnapshot.objects.get_for_user(donor).impact_kilowatts, 5.0)
+
+        project = Project.objects.get(pk=project.pk)
+        project.funding_goal = 200.0
+        project.impact_power = 40.0
+        project.save()
+        snapshot = UserImpactSnapshot.objects.get_for_user(donor)
+        self.assertAlmostEqual(snapshot.impact_kilowatts, 10.0)
+        self.assertEqual(
+            aggregate_stats(donor)['kwh'], KilowattStatsAggregator(snapshot.impact_kilowatts).kilowatt_hours_per_month
+        )
+
+        project.title = 'Renamed'
+        with mock.patch.object(UserImpactSnapshot.objects, 'rebuild') as rebuild:
+            project.save()
+        self.assertFalse(rebuild.called)
+
+    def test_reinvest_ledger(self):
+        """
+        Test that every change to a reinvest pool is appended to the ledger, and
+        that reinvest_pool stays a projection of the ledger's running balance.
+        """
+        user = RevolvUserProfile.factories.base.create()
+        admin = RevolvUserProfile.factories.admin.create()
+        project = Project.factories.base.create()
+        donation = self._create_payment(user, amount=10.00, project=project)
+        donation.save()
+        project.complete_project()
+
+        stale_user = RevolvUserProfile.objects.get(pk=user.pk)
+        repayment1 = self._create_admin_repayment(admin, amount=40.00, project=project)
+        repayment1.save()
+        self._create_admin_repayment(admin, amount=60.00, project=project).save()
+        reinvestment = self._create_payment(user, amount=30.00, payment_type=self.reinvestment)
+        reinvestment.save()
+        self.assertEqual(user.reinvest_pool, 70.00)
+        repayment1.delete()
+        reinvestment.delete()
+
+        entries = ReinvestLedgerEntry.objects.filter(user=user).order_by('pk')
+        self.assertEqual(
+            [(entry.signed_amount, entry.balance) for entry in entries],
+            [(40.00, 40.00), (60.00, 100.00), (-30.00, 70.00), (-40.00, 30.00), (30.00, 60.00)]
+        )
+        self.assertEqual(ReinvestLedgerEntry.objects.balances([user.pk]), {user.pk: 60.00})
+
+        # saving a profile loaded before all of this doesn't overwrite the pool
+        stale_user.subscribed_to_updates = False
+        stale_user.save()
+        self.assertEqual(RevolvUserProfile.objects.get(pk=user.pk).reinvest_pool, 60.00)
+
+        # but a reinvest_pool changed by hand isn't silently dropped
+        stale_user.reinvest_pool = 1000.00
+        with self.assertRaises(ValueError):
+            stale_user.save()
+
+        # the balances come from the ledger, not from reinvest_pool
+        RevolvUserProfile.objects.filter(pk=user.pk).update(reinvest_pool=1000.00)
+        ReinvestLedgerEntry.objects.credit(user, 5.00)
+        self.assertEqual(RevolvUserProfile.objects.get(pk=user.pk).reinvest_pool, 65.00)
+
+        # and a payment can't spend more than the balance
+        with self.assertRaises(NotEnoughReinvestPoolException):
+            ReinvestLedgerEntry.objects.record([
+                ReinvestLedgerEntry.for_change(user.pk, -70.00, payment_id=donation.pk)
+            ])
+        self.assertEqual(ReinvestLedgerEntry.objects.balances([user.pk]), {user.pk: 65.00})
+
+    def test_deferred_payment_effects(self):
+        """
+        Test that deferring the payment handlers' effects to the end of a block
+        gives the same totals, contributions, donors, snapshots and reinvest
+        pools as applying them payment by payment.
+        """
+        donors = RevolvUserProfile.factories.base.create_batch(3)
+        admin = RevolvUserProfile.factories.admin.create()
+        project = Project.factories.base.create(funding_goal=1000.0)
+        other_project = Project.factories.base.create()
+        for user in donors:
+            UserImpactSnapshot.objects.get_for_user(user)
+        self._create_payment(donors[0], amount=10.00, project=project).save()
+        self._create_payment(donors[1], amount=10.00, project=other_project).save()
+        other_project.complete_project()
+        self._create_admin_repayment(admin, amount=30.00, project=other_project).save()
+        reinvestor = RevolvUserProfile.objects.get(pk=donors[1].pk)
+
+        with deferred_payment_effects():
+            for i, donor in enumerate(donors):
+                self._create_payment(donor, amount=20.00 * (i + 1), project=project).save()
+            self._create_payment(reinvestor, amount=10.00, project=project,
+                                 payment_type=self.reinvestment).save()
+            Payment.objects.get(project=project, user=donors[2]).delete()
+            self.assertEqual(reinvestor.reinvest_pool, 20.00)
+            # nothing is applied until the block exits
+            self.assertEqual(ProjectFundingTotals.objects.get(project=project).amount_donated, 10.00)
+            self.assertEqual(list(project.donors.all()), [donors[0]])
+
+        self.assertEqual(set(project.donors.all()), set(donors[:2]))
+        self.assertEqual(RevolvUserProfile.objects.get(pk=reinvestor.pk).reinvest_pool, 20.00)
+        self.assertEqual(reinvestor.reinvest_pool, 20.00)
+        self.assertEqual(project.amount_donated, 80.00)
+
+        totals_fields = ('amount_donated', 'amount_donated_organically', 'amount_reinvested', 'donor_count')
+        maintained = ProjectFundingTotals.objects.get(project=project)
+        contributions = sorted(project.contributions.values_list(
+            'user', 'organic_total', 'reinvested_total', 'payment_count'
+        ))
+        snapshot_fields = ('impact_kilowatts', 'total_donated', 'project_count')
+        snapshots = dict(
+            (snapshot.user_id, [getattr(snapshot, field) for field in snapshot_fields])
+            for snapshot in UserImpactSnapshot.objects.filter(user__in=donors)
+        )
+
+        rebuilt = ProjectFundingTotals.objects.rebuild(Project.objects.filter(pk=project.pk))[0]
+        for field in totals_fields:
+            self.assertEqual(getattr(maintained, field), getattr(rebuilt, field))
+        ProjectContribution.objects.rebuild(Project.objects.filter(pk=project.pk))
+        self.assertEqual(contributions, sorted(project.contributions.values_list(
+            'user', 'organic_total', 'reinvested_total', 'payment_count'
+        )))
+        for snapshot in UserImpactSnapshot.objects.rebuild([donor.pk for donor in donors]):
+            for value, expected in zip(snapshots[snapshot.user_id],
+                                       [getattr(snapshot, field) for field in snapshot_fields]):
+                self.assertAlmostEqual(value, expected)
+
+    def test_deferred_payment_effects_rolled_back(self):
+        """
+        Test that nothing done in a deferred_payment_effects() block is kept if
+        the block raises.
+        """
+        user = RevolvUserProfile.factories.base.create()
+        project = Project.factories.base.create()
+        with self.assertRaises(ValueError):
+            with deferred_payment_effects():
+                self._create_payment(user, amount=10.00, project=project).save()
+                raise ValueError()
+        self.assertFalse(Payment.objects.filter(project=project).exists())
+        self.assertFalse(project.donors.exists())
+        self.assertEqual(project.amount_donated, 0.0)
+
     def test_user_reinvestment(self):
         """
         Test reinvestment on single Payment level.
@@ -411,6 +640,127 @@ class PaymentTest(TestCase):
         self.assertEquals(user1.reinvest_pool, 50.00)
         self.assertEquals(user2.reinvest_pool, 150.00)
 
+    def test_plan_admin_reinvestment_contributions(self):
+        """
+        Test that contributors to an AdminReinvestment are chosen in one query,
+        users preferring one of the project's categories first, then by last name.
+        """
+        category1, category2 = Category.factories.base.create_batch(2)
+        project = Project.factories.base.create()
+        project.category_set.add(category1)
+        pools = [('Young', 30.00, category1), ('Abbott', 50.00, None), ('Baker', 20.00, category2),
+                 ('Nolan', 40.00, category1), ('Carter', 0.00, category1)]
+        users = {}
+        for last_name, pool, category in pools:
+            user = RevolvUserProfile.factories.base.create(user__last_name=last_name)
+            ReinvestLedgerEntry.objects.credit(user, pool)
+            if category:
+                user.preferred_categories.add(category)
+            users[last_name] = user.pk
+
+        with self.assertNumQueries(1):
+            contributions = AdminReinvestment.objects.plan_contributions(project, 100.00)
+        self.assertEqual(contributions, [
+            (users['Nolan'], 40.00), (users['Young'], 30.00), (users['Abbott'], 30.00)
+        ])
+        self.assertEqual(len(AdminReinvestment.objects.plan_contributions(project, 1000.00)), 4)
+
+    @mock.patch('revolv.payments.signals.is_user_reinvestment_period', return_value=False)
+    def test_admin_reinvestment_is_set_based(self, mock_period):
+        """
+        Test that an AdminReinvestment runs a fixed number of queries however
+        many users it pools money from.
+        """
+        donors = RevolvUserProfile.factories.base.create_batch(6)
+        admin = RevolvUserProfile.factories.admin.create()
+        project1, project2 = Project.factories.base.create_batch(2)
+        for donor in donors:
+            self._create_payment(donor, amount=10.00, project=project1).save()
+        project1.complete_project()
+        self._create_admin_repayment(admin, amount=60.00, project=project1).save()
+
+        reinvestment = self._create_admin_reinvestment(admin, 45.00, project=project2)
+        with self.assertNumQueries(20):
+            reinvestment.save()
+        self.assertEqual(Payment.objects.reinvestment_fragments(project=project2).count(), 5)
+        self.assertEqual(project2.amount_donated, 45.00)
+        self.assertEqual(project2.donor_count, 5)
+        self.assertEqual(RevolvUserProfile.objects.aggregate(Sum('reinvest_pool'))['reinvest_pool__sum'], 15.00)
+
+    @mock.patch('revolv.payments.signals.is_user_reinvestment_period', return_value=False)
+    def test_reinvestment_rollover_is_idempotent(self, mock_period):
+        """
+        Test that a project only gets one reinvestment per monthly rollover,
+        however many times its worker runs, and that finishing the rollover
+        records its totals and resets the caps.
+        """
+        donor = RevolvUserProfile.factories.base.create()
+        admin = RevolvUserProfile.factories.admin.create()
+        project1, project2 = Project.factories.base.create_batch(2)
+        self._create_payment(donor, amount=50.00, project=project1).save()
+        project1.complete_project()
+        self._create_admin_repayment(admin, amount=30.00, project=project1).save()
+        Project.objects.filter(pk=project2.pk).update(monthly_reinvestment_cap=20.00)
+        rollover = ReinvestmentRollover.objects.for_month(2016, 3)
+
+        with mock.patch('revolv.tasks.reinvestment_rollover.get_admin', return_value=admin):
+            self.assertEqual(reinvest_into_project(rollover.pk, project2.pk, 20.00), 20.00)
+            self.assertEqual(reinvest_into_project(rollover.pk, project2.pk, 20.00), 20.00)
+        self.assertEqual(AdminReinvestment.objects.filter(rollover=rollover).count(), 1)
+        self.assertEqual(RevolvUserProfile.objects.get(pk=donor.pk).reinvest_pool, 10.00)
+
+        finish_reinvestment_rollover([20.00], rollover.pk, [project2.pk])
+        rollover = ReinvestmentRollover.objects.get(pk=rollover.pk)
+        self.assertTrue(rollover.is_completed)
+        self.assertEqual(rollover.total_reinvested, 20.00)
+        self.assertEqual(rollover.project_count, 1)
+        self.assertEqual(Project.objects.get(pk=project2.pk).monthly_reinvestment_cap, 0.0)
+
+    @mock.patch('revolv.payments.signals.is_user_reinvestment_period', return_value=False)
+    def test_reinvestment_rollover_survives_failed_project(self, mock_period):
+        """
+        Test that a project whose reinvestment fails keeps its cap and leaves
+        the rollover unfinished, while the other projects get theirs, and that
+        running the rollover's projects again finishes it.
+        """
+        donor = RevolvUserProfile.factories.base.create()
+        admin = RevolvUserProfile.factories.admin.create()
+        project1, project2, project3 = Project.factories.base.create_batch(3)
+        self._create_payment(donor, amount=50.00, project=project1).save()
+        project1.complete_project()
+        self._create_admin_repayment(admin, amount=30.00, project=project1).save()
+        Project.objects.filter(pk__in=[project2.pk, project3.pk]).update(monthly_reinvestment_cap=10.00)
+        rollover = ReinvestmentRollover.objects.for_month(2016, 3)
+
+        with mock.patch('revolv.tasks.reinvestment_rollover.get_admin', return_value=admin):
+            with mock.patch.object(Project, 'reserve_reinvestment', side_effect=[RuntimeError('failed'), 10.00]):
+                amounts = [
+                    reinvest_into_project(rollover.pk, project3.pk, 10.00),
+                    reinvest_into_project(rollover.pk, project2.pk, 10.00),
+                ]
+        self.assertEqual(amounts, [None, 10.00])
+        with mock.patch('revolv.tasks.reinvestment_rollover.get_admin', side_effect=MissingAdminError):
+            self.assertIsNone(reinvest_into_project(rollover.pk, project3.pk, 10.00))
+
+        finish_reinvestment_rollover(amounts, rollover.pk, [project2.pk, project3.pk])
+        rollover = ReinvestmentRollover.objects.get(pk=rollover.pk)
+        self.assertFalse(rollover.is_completed)
+        self.assertEqual(rollover.total_reinvested, 10.00)
+        self.assertEqual(rollover.project_count, 1)
+        self.assertEqual(
+            list(Project.objects.filter(monthly_reinvestment_cap__gt=0.0).values_list('pk', flat=True)),
+            [project3.pk]
+        )
+
+        with mock.patch('revolv.tasks.reinvestment_rollover.get_admin', return_value=admin):
+            with mock.patch.object(Project, 'reserve_reinvestment', return_value=10.00):
+                amounts = [reinvest_into_project(rollover.pk, project3.pk, 10.00)]
+        finish_reinvestment_rollover(amounts, rollover.pk, [project3.pk])
+        rollover = ReinvestmentRollover.objects.get(pk=rollover.pk)
+        self.assertTrue(rollover.is_completed)
+        self.assertEqual(rollover.project_count, 2)
+        self.assertEqual(Project.objects.filter(monthly_reinvestment_cap__gt=0.0).count(), 0)
+
     def test_admin_reinvestment_category_preference(self):
         """
         Test reinvestment on AdminReinvestment level. Lots of moving parts,
@@ -20,4 +20,8 @@ class NotInAdminReinvestmentPeriodException(Exception):
 
 
 class ProjectNotEligibleException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class NotEnoughReinvestPoolException(Exception):
+    pass
@@ -0,0 +1 @@
+default_app_config = 'revolv.project.apps.RevolvProjectConfig'
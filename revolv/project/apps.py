@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class RevolvProjectConfig(AppConfig):
+    name = 'revolv.project'
+    verbose_name = 'Revolv Project'
+
+    def ready(self):
+        import revolv.project.signals
+        revolv.project.signals  # quiet the pep8 flaker
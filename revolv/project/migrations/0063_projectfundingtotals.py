@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count, F, Sum
+
+
+def build_funding_totals(apps, schema_editor):
+    """
+    Build the funding totals of every existing project from its payments,
+    repayments and donors, so that the queries which read the totals in SQL
+    see the projects' real funding from the start.
+    """
+    Project = apps.get_model("project", "Project")
+    ProjectFundingTotals = apps.get_model("project", "ProjectFundingTotals")
+    Payment = apps.get_model("payments", "Payment")
+    AdminRepayment = apps.get_model("payments", "AdminRepayment")
+
+    def sums_by_project(queryset):
+        rows = queryset.values('project').annotate(total=Sum('amount')).order_by()
+        return dict((row['project'], row['total'] or 0.0) for row in rows)
+
+    donated = sums_by_project(Payment.objects.all())
+    organic = sums_by_project(Payment.objects.exclude(user__isnull=True).filter(entrant__pk=F('user__pk')))
+    reinvested = sums_by_project(Payment.objects.filter(payment_type__name='reinvestment_fragment'))
+    repaid = sums_by_project(AdminRepayment.objects.all())
+    donor_rows = Project.donors.through.objects.values('project').annotate(
+        total=Count('revolvuserprofile')
+    ).order_by()
+    donors = dict((row['project'], row['total']) for row in donor_rows)
+
+    ProjectFundingTotals.objects.bulk_create([
+        ProjectFundingTotals(
+            project_id=project_id,
+            amount_donated=donated.get(project_id, 0.0),
+            amount_donated_organically=organic.get(project_id, 0.0),
+            amount_reinvested=reinvested.get(project_id, 0.0),
+            amount_repaid=repaid.get(project_id, 0.0),
+            donor_count=donors.get(project_id, 0),
+        )
+        for project_id in Project.objects.values_list('pk', flat=True)
+    ])
+
+
+def delete_funding_totals(apps, schema_editor):
+    ProjectFundingTotals = apps.get_model("project", "ProjectFundingTotals")
+    ProjectFundingTotals.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0025_auto_20160210_1552'),
+        ('project', '0062_auto_20160212_1635'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectFundingTotals',
+            fields=[
+                ('project', models.OneToOneField(related_name='funding_totals', primary_key=True, serialize=False, to='project.Project')),
+                ('amount_donated', models.FloatField(default=0.0)),
+                ('amount_donated_organically', models.FloatField(default=0.0)),
+                ('amount_repaid', models.FloatField(default=0.0)),
+                ('amount_reinvested', models.FloatField(default=0.0)),
+                ('donor_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(build_funding_totals, delete_funding_totals),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count, F, Sum
+
+
+def build_contributions(apps, schema_editor):
+    """
+    Build every user's contribution to every project from their payments, so
+    that the contributions agree with the existing payments.
+    """
+    Payment = apps.get_model("payments", "Payment")
+    ProjectContribution = apps.get_model("project", "ProjectContribution")
+
+    def by_contributor(payments, aggregate):
+        rows = payments.filter(user__isnull=False).values('project', 'user').annotate(
+            total=aggregate
+        ).order_by()
+        return dict(((row['project'], row['user']), row['total'] or 0) for row in rows)
+
+    counts = by_contributor(Payment.objects.all(), Count('pk'))
+    organic = by_contributor(Payment.objects.filter(entrant__pk=F('user__pk')), Sum('amount'))
+    reinvested = by_contributor(
+        Payment.objects.filter(payment_type__name='reinvestment_fragment'), Sum('amount')
+    )
+    ProjectContribution.objects.bulk_create([
+        ProjectContribution(
+            project_id=project_id,
+            user_id=user_id,
+            organic_total=organic.get((project_id, user_id), 0.0),
+            reinvested_total=reinvested.get((project_id, user_id), 0.0),
+            payment_count=payment_count,
+        )
+        for (project_id, user_id), payment_count in counts.items()
+    ])
+
+
+def delete_contributions(apps, schema_editor):
+    ProjectContribution = apps.get_model("project", "ProjectContribution")
+    ProjectContribution.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_delete_newsletteruser'),
+        ('payments', '0028_userimpactsnapshot'),
+        ('project', '0063_projectfundingtotals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectContribution',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('organic_total', models.FloatField(default=0.0)),
+                ('reinvested_total', models.FloatField(default=0.0)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('project', models.ForeignKey(related_name='contributions', to='project.Project')),
+                ('user', models.ForeignKey(related_name='contributions', to='base.RevolvUserProfile')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='projectcontribution',
+            unique_together=set([('project', 'user')]),
+        ),
+        migrations.RunPython(build_contributions, delete_contributions),
+    ]
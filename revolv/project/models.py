@@ -1,23 +1,93 @@
 import datetime
+import time
 from itertools import chain
 
 from ckeditor.fields import RichTextField
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Q, Sum
+from django.db import IntegrityError, connection, connections, models, transaction
+from django.db.models import Count, Q, Sum
+from django.utils.functional import cached_property
 from imagekit.models import ImageSpecField, ProcessedImageField
 from imagekit.processors import ResizeToFill
 from revolv.base.models import RevolvUserProfile
+from revolv.base.page_cache import PAGE_TAG_VERSION_KEY, invalidate_page_tags
 from revolv.lib.utils import ImportProxy
-from revolv.payments.models import Payment, PaymentType
+from revolv.payments.models import AdminRepayment, Payment, PaymentType
 from revolv.project.stats import KilowattStatsAggregator
 
+# Every project has a cache version, which is part of the keys of the cached
+# template fragments showing it (see Project.fragment_cache_key), and which is
+# bumped whenever anything those fragments show changes.
+PROJECT_CACHE_VERSION_KEY = 'revolv:project:%s:version'
+
 
 class ProjectManager(models.Manager):
     """
     Manager for running custom operations on the Projects.
     """
 
+    def with_funding_stats(self, queryset=None, min_amount_left=None):
+        """ Annotate the queryset with the funding figures listing pages show,
+        so that a page of N projects costs O(1) queries instead of O(N).
+
+        The ProjectFundingTotals row is select_related (so amount_donated,
+        donor_count, percent_complete etc. need no extra query), and the
+        following extra columns are computed from that same join, and can be
+        used in order_by():
+
+            funding_amount_donated, funding_amount_left,
+            funding_donor_count, funding_percent_complete
+
+        Projects whose totals have not been built yet count as having no
+        donations.
+
+        :queryset: The queryset to annotate
+        :min_amount_left: If given, only keep projects that still need more
+            than this amount to reach their goal (see needing_funding)
+        :return: The annotated queryset
+        """
+        if queryset is None:
+            queryset = super(ProjectManager, self).get_queryset()
+        donated = ProjectFundingTotals.column_sql('amount_donated')
+        goal = '%s.%s' % (
+            connection.ops.quote_name(Project._meta.db_table),
+            connection.ops.quote_name(Project._meta.get_field('funding_goal').column)
+        )
+        amount_left = 'CASE WHEN %(donated)s < %(goal)s THEN %(goal)s - %(donated)s ELSE 0 END' % {
+            'donated': donated,
+            'goal': goal,
+        }
+        percent_complete = 'CASE WHEN %(donated)s >= %(goal)s THEN 100.0 ELSE 100.0 * %(donated)s / %(goal)s END' % {
+            'donated': donated,
+            'goal': goal,
+        }
+        if min_amount_left is not None:
+            queryset = self.needing_funding(queryset, min_amount_left)
+        return queryset.select_related('funding_totals').extra(select={
+            'funding_amount_donated': donated,
+            'funding_amount_left': amount_left,
+            'funding_donor_count': ProjectFundingTotals.column_sql('donor_count'),
+            'funding_percent_complete': percent_complete,
+        })
+
+    def needing_funding(self, queryset=None, min_amount_left=0.0):
+        """ Only keep the projects of the queryset that still need more than
+        min_amount_left to reach their goal. This is a plain filter(), so it
+        can be applied to querysets which already have their funding stats
+        (e.g. get_active()'s) without annotating them again.
+
+        :queryset: The queryset to filter
+        :min_amount_left: The amount projects must still need
+        :return: The filtered queryset
+        """
+        if queryset is None:
+            queryset = super(ProjectManager, self).get_queryset()
+        return queryset.filter(
+            Q(funding_totals__isnull=True, funding_goal__gt=min_amount_left) |
+            Q(funding_totals__amount_donated__lt=models.F('funding_goal') - min_amount_left)
+        )
+
     def get_featured(self, num_projects, queryset=None):
         """ Get num_projects amount of active projects. If we don't have
         enough active projects, then we retrieve completed projects. This
@@ -27,8 +97,7 @@ class ProjectManager(models.Manager):
         :queryset: The queryset in which to search for projects
         :return: A list of featured project objects
         """
-        if queryset is None:
-            queryset = super(ProjectManager, self).get_queryset()
+        queryset = self.with_funding_stats(queryset)
         featured_projects = queryset.filter(
             project_status=Project.ACTIVE).order_by(
             'end_date')[:num_projects]
@@ -47,8 +116,7 @@ class ProjectManager(models.Manager):
         :queryset: The queryset in which to search for projects
         :return: A list of completed project objects
         """
-        if queryset is None:
-            queryset = super(ProjectManager, self).get_queryset()
+        queryset = self.with_funding_stats(queryset)
         completed_projects = queryset.filter(
             project_status=Project.COMPLETED
         ).order_by('end_date')
@@ -60,8 +128,7 @@ class ProjectManager(models.Manager):
         :queryset: The queryset in which to search for projects
         :return: A list of active project objects
         """
-        if queryset is None:
-            queryset = super(ProjectManager, self).get_queryset()
+        queryset = self.with_funding_stats(queryset)
         active_projects = queryset.filter(
             project_status=Project.ACTIVE
         ).order_by('end_date')
@@ -73,8 +140,7 @@ class ProjectManager(models.Manager):
         :queryset: The queryset in which to search for projects
         :return: A list of in review project objects
         """
-        if queryset is None:
-            queryset = super(ProjectManager, self).get_queryset()
+        queryset = self.with_funding_stats(queryset)
         proposed_projects = queryset.filter(
             project_status=Project.PROPOSED
         ).order_by('updated_at')
@@ -86,8 +152,7 @@ class ProjectManager(models.Manager):
         :queryset: The queryset in which to search for projects
         :return: A list of in review project objects
         """
-        if queryset is None:
-            queryset = super(ProjectManager, self).get_queryset()
+        queryset = self.with_funding_stats(queryset)
         drafted_projects = queryset.filter(
             project_status=Project.DRAFTED
         ).order_by('updated_at')
@@ -99,8 +164,7 @@ class ProjectManager(models.Manager):
         :queryset: The queryset in which to search for projects
         :return: A list of in review project objects
         """
-        if queryset is None:
-            queryset = super(ProjectManager, self).get_queryset()
+        queryset = self.with_funding_stats(queryset)
         staged_projects = queryset.filter(
             project_status=Project.STAGED
         ).order_by('updated_at')
@@ -131,7 +195,7 @@ class ProjectManager(models.Manager):
         """
         :return: Projects to which this RevolvUserProfile has donated
         """
-        return user_profile.project_set.all()
+        return self.with_funding_stats(user_profile.project_set.all())
 
     def create_from_form(self, form, creator):
         """ Creates project from form and sets created_by_user to a RevolvUserProfile.
@@ -151,6 +215,131 @@ class ProjectManager(models.Manager):
         """
         return self.get_active(queryset).filter(monthly_reinvestment_cap__gt=0.0)
 
+    def get_reinvestment_recipients(self, queryset=None):
+        """
+        :return: eligible projects for reinvestment which still need funding,
+        i.e. with an amount_left greater than zero.
+        """
+        return self.needing_funding(self.get_eligible_projects_for_reinvestment(queryset))
+
+    def set_reinvestment_caps(self, caps, batch_size=500):
+        """ Set the monthly_reinvestment_cap of many projects at once, using one
+        UPDATE per batch of projects instead of saving every project.
+
+        :caps: A dict mapping Project pks to their new monthly_reinvestment_cap
+        :batch_size: The maximum number of projects to update per statement
+        """
+        qn = connection.ops.quote_name
+        project_ids = sorted(caps)
+        cursor = connection.cursor()
+        for start in range(0, len(project_ids), batch_size):
+            batch = project_ids[start:start + batch_size]
+            params = []
+            for project_id in batch:
+                params.extend([project_id, float(caps[project_id])])
+            params.extend(batch)
+            cursor.execute(
+                'UPDATE %(table)s SET %(cap)s = CASE %(pk)s %(cases)s END '
+                'WHERE %(pk)s IN (%(ids)s)' % {
+                    'table': qn(Project._meta.db_table),
+                    'cap': qn(Project._meta.get_field('monthly_reinvestment_cap').column),
+                    'pk': qn(Project._meta.pk.column),
+                    'cases': ' '.join(['WHEN %s THEN %s'] * len(batch)),
+                    'ids': ', '.join(['%s'] * len(batch)),
+                },
+                params
+            )
+
+    def release_reinvestments(self, amounts, batch_size=500):
+        """ Give amounts back to the monthly_reinvestment_cap of many projects at
+        once (see Project.release_reinvestment), using one UPDATE per batch of
+        projects.
+
+        :amounts: A dict mapping Project pks to the amount to give back
+        :batch_size: The maximum number of projects to update per statement
+        """
+        amounts = dict((project_id, amount) for project_id, amount in amounts.items() if amount)
+        qn = connection.ops.quote_name
+        column = qn(Project._meta.get_field('monthly_reinvestment_cap').column)
+        project_ids = sorted(amounts)
+        cursor = connection.cursor()
+        for start in range(0, len(project_ids), batch_size):
+            batch = project_ids[start:start + batch_size]
+            params = []
+            for project_id in batch:
+                params.extend([project_id, float(amounts[project_id])])
+            params.extend(batch)
+            cursor.execute(
+                'UPDATE %(table)s SET %(cap)s = %(cap)s + CASE %(pk)s %(cases)s END '
+                'WHERE %(pk)s IN (%(ids)s)' % {
+                    'table': qn(Project._meta.db_table),
+                    'cap': column,
+                    'pk': qn(Project._meta.pk.column),
+                    'cases': ' '.join(['WHEN %s THEN %s'] * len(batch)),
+                    'ids': ', '.join(['%s'] * len(batch)),
+                },
+                params
+            )
+
+    def cache_versions(self, project_ids):
+        """ Get the cache versions of many projects with one cache lookup.
+
+        A project's cache version combines its own version with the version of
+        the 'cms' page tag (see revolv.base.page_cache), since its fragments
+        also show text from the CMS settings, so editing those makes every
+        project's fragments stale too.
+
+        A project without a version yet (or whose version was evicted) gets
+        one based on the current time, so that it never repeats a version its
+        old fragments may still be cached under.
+
+        :project_ids: The pks of the projects
+        :return: A dict mapping each pk to its project's cache version
+        """
+        cms_key = PAGE_TAG_VERSION_KEY % 'cms'
+        keys = dict((PROJECT_CACHE_VERSION_KEY % project_id, project_id) for project_id in project_ids)
+        versions = cache.get_many(keys.keys() + [cms_key])
+        missing = [key for key in keys.keys() + [cms_key] if key not in versions]
+        if missing:
+            initial = int(time.time() * 1000)
+            for key in missing:
+                cache.add(key, initial, None)
+            versions.update(cache.get_many(missing))
+        cms_version = versions.get(cms_key, 0)
+        return dict(
+            (project_id, '%s-%s' % (versions.get(key, 0), cms_version)) for key, project_id in keys.items()
+        )
+
+    def bump_cache_versions(self, project_ids):
+        """ Bump the cache versions of the given projects, so that none of the
+        fragments cached for them before are used again, and invalidate the
+        cached pages showing them (see revolv.base.page_cache).
+
+        :project_ids: The pks of the projects
+        """
+        project_ids = set(project_id for project_id in project_ids if project_id is not None)
+        if not project_ids:
+            return
+        for project_id in project_ids:
+            key = PROJECT_CACHE_VERSION_KEY % project_id
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, int(time.time() * 1000), None)
+        invalidate_page_tags(['projects'] + ['project:%s' % project_id for project_id in project_ids])
+
+    def prime_cache_versions(self, projects):
+        """ Load the cache versions of all the given projects at once, so that
+        rendering their fragments doesn't look them up one at a time.
+
+        :projects: A list of Projects
+        :return: The same list
+        """
+        versions = self.cache_versions([project.pk for project in projects])
+        for project in projects:
+            project.__dict__['cache_version'] = versions[project.pk]
+        return projects
+
     def get_completed_unpaid_off_projects(self, queryset=None):
         """
         :return list(queryset) of completes project which do monthly repayment.
@@ -418,26 +607,65 @@ class Project(models.Model):
             The proportion that this user has organically donated to this
             project as a float in the range [0, 1] (inclusive)
         """
-        user_donation = Payment.objects.donations(
-            project=self,
-            user=user,
-            organic=True
-        ).aggregate(
-            models.Sum('amount')
-        )['amount__sum'] or 0.0
+        user_donation = ProjectContribution.objects.filter(project=self, user=user).values_list(
+            'organic_total', flat=True
+        ).first() or 0.0
         prop = user_donation / self.amount_donated_organically
         assert 0 <= prop <= 1, "proportion_donated is incorrect!"
         return prop
 
+    def get_funding_totals(self):
+        """
+        :return: the ProjectFundingTotals for this project. If the totals were
+        loaded alongside the project (e.g. with select_related('funding_totals'))
+        we use those, otherwise we do a fresh single-row lookup, so that reads
+        always reflect payments made since this instance was fetched.
+        """
+        totals = getattr(self, Project.funding_totals.cache_name, None)
+        if totals is None:
+            totals = ProjectFundingTotals.objects.get_for_project(self)
+        return totals
+
+    @cached_property
+    def cache_version(self):
+        """
+        :return: the current cache version of this project (see
+        ProjectManager.cache_versions).
+        """
+        return Project.objects.cache_versions([self.pk])[self.pk]
+
+    @property
+    def fragment_cache_key(self):
+        """
+        :return: a key identifying what the cached template fragments showing
+        this project show, for use as the vary_on argument of {% cache %}. It
+        changes whenever the project's cache version is bumped or the CMS
+        settings change (see ProjectManager.cache_versions), and every day
+        (for the days left and so far).
+        """
+        return '%s.%s.%s' % (self.pk, self.cache_version, datetime.date.today().isoformat())
+
+    def bump_cache_version(self):
+        """
+        Make the fragments cached for this project stale.
+        """
+        Project.objects.bump_cache_versions([self.pk])
+        self.__dict__.pop('cache_version', None)
+
+    def forget_funding_totals(self):
+        """
+        Drop any ProjectFundingTotals cached on this instance, so that the next
+        read of amount_donated etc. goes back to the database.
+        """
+        self.__dict__.pop(Project.funding_totals.cache_name, None)
+
     @property
     def amount_donated_organically(self):
         """
         :return: the current total amount that has been organically donated to
         this project, as a float.
         """
-        return self.get_organic_donations().aggregate(
-            models.Sum('amount')
-        )["amount__sum"] or 0.0
+        return self.get_funding_totals().amount_donated_organically
 
     @property
     def location_street(self):
@@ -472,9 +700,7 @@ class Project(models.Model):
         :return: the current total amount that has been donated to this project,
             as a float.
         """
-        return self.payment_set.aggregate(
-            models.Sum('amount')
-        )["amount__sum"] or 0.0
+        return self.get_funding_totals().amount_donated
 
     @property
     def amount_left(self):
@@ -492,7 +718,22 @@ class Project(models.Model):
         """
         :return: the current amount of money repaid by the project to RE-volv.
         """
-        return self.adminrepayment_set.aggregate(models.Sum('amount'))["amount__sum"] or 0.0
+        return self.get_funding_totals().amount_repaid
+
+    @property
+    def amount_reinvested(self):
+        """
+        :return: the current amount of money reinvested into this project from
+        the pools of RE-volv donors.
+        """
+        return self.get_funding_totals().amount_reinvested
+
+    @property
+    def donor_count(self):
+        """
+        :return: the number of donors to this project.
+        """
+        return self.get_funding_totals().donor_count
 
     @property
     def total_amount_to_be_repaid(self):
@@ -663,12 +904,14 @@ class Project(models.Model):
         """
         return self.donationlevel_set.all()
 
-    @property
+    @cached_property
     def statistics(self):
         """
         Return a revolv.project.stats.KilowattStatsAggregator for this project.
         Having this as a property is usefule in templates where we need to display
-        statistics about the project (e.g. lbs carbon saved, $ saved, etc).
+        statistics about the project (e.g. lbs carbon saved, $ saved, etc). The
+        aggregator is kept for the life of the instance, so templates accessing
+        several statistics share one aggregator.
         """
         return KilowattStatsAggregator.from_project(self)
 
@@ -683,6 +926,41 @@ class Project(models.Model):
         """
         return min(self.amount_left, self.monthly_reinvestment_cap)
 
+    def reserve_reinvestment(self, amount):
+        """
+        Claim up to amount of this project's monthly_reinvestment_cap for a
+        reinvestment, never more than the project still needs to reach its goal.
+
+        The project's row is locked while the cap is read and decremented, so
+        concurrent reservations can't both claim the same part of the cap. Call
+        this inside the transaction that creates the reinvestment, so that the
+        lock is held until the reinvestment is committed too.
+
+        :return: the amount actually reserved, 0.0 if nothing could be
+        """
+        with transaction.atomic():
+            cap = Project.objects.select_for_update().filter(pk=self.pk).values_list(
+                'monthly_reinvestment_cap', flat=True
+            )[0]
+            self.forget_funding_totals()
+            granted = max(0.0, min(float(amount), cap, self.amount_left))
+            if granted > 0.0:
+                Project.objects.filter(pk=self.pk).update(
+                    monthly_reinvestment_cap=models.F('monthly_reinvestment_cap') - granted
+                )
+            self.monthly_reinvestment_cap = cap - granted
+        return granted
+
+    def release_reinvestment(self, amount):
+        """
+        Give amount back to this project's monthly_reinvestment_cap, e.g. when a
+        reserved reinvestment is not made after all, or is revoked.
+        """
+        Project.objects.filter(pk=self.pk).update(
+            monthly_reinvestment_cap=models.F('monthly_reinvestment_cap') + float(amount)
+        )
+        self.monthly_reinvestment_cap += float(amount)
+
     def paid_off(self):
         """Set the project PAID_OFF flag
         """
@@ -693,6 +971,454 @@ class Project(models.Model):
         return self.title
 
 
+class ProjectFundingTotalsManager(models.Manager):
+    """
+    Manager for ProjectFundingTotals.
+    """
+    # how many times rebuild tries to replace a whole batch of totals before
+    # replacing them one project at a time
+    REBUILD_ATTEMPTS = 3
+
+    def get_for_project(self, project):
+        """
+        :return: the ProjectFundingTotals for project. If the project does not
+        have totals yet, they are built from the Payment and AdminRepayment
+        tables and saved.
+        """
+        if project.pk is None:
+            return ProjectFundingTotals(project=project)
+        try:
+            return self.get_queryset().get(project_id=project.pk)
+        except ProjectFundingTotals.DoesNotExist:
+            return self.rebuild(Project.objects.filter(pk=project.pk))[0]
+
+    def apply_delta(self, project, **deltas):
+        """
+        Atomically add deltas (a mapping of field name to amount) to the totals
+        of the given project with a single UPDATE using F expressions, so that
+        concurrent payments to the same project can't lose updates.
+
+        If the project has no totals yet we do nothing: they will be built from
+        scratch, including this change, the next time they are read.
+
+        :return: the number of rows updated (0 or 1)
+        """
+        deltas = dict((field, delta) for field, delta in deltas.items() if delta)
+        if isinstance(project, Project):
+            project.forget_funding_totals()
+            project_id = project.pk
+        else:
+            project_id = project
+        if not deltas:
+            return 0
+        return self.get_queryset().filter(project_id=project_id).update(
+            **dict((field, models.F(field) + delta) for field, delta in deltas.items())
+        )
+
+    def apply_deltas(self, field, deltas, batch_size=500):
+        """
+        Atomically add a different amount to the given field of many projects'
+        totals, using one UPDATE per batch of projects.
+
+        :deltas: A dict mapping Project pks to the amount to add
+        :return: the number of rows updated
+        """
+        deltas = dict((project_id, delta) for project_id, delta in deltas.items() if delta)
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        column = qn(self.model._meta.get_field(field).column)
+        project_ids = sorted(deltas)
+        cursor = connection.cursor()
+        updated = 0
+        for start in range(0, len(project_ids), batch_size):
+            batch = project_ids[start:start + batch_size]
+            params = []
+            for project_id in batch:
+                params.extend([project_id, deltas[project_id]])
+            params.extend(batch)
+            cursor.execute(
+                'UPDATE %(table)s SET %(column)s = %(column)s + CASE %(fk)s %(cases)s END '
+                'WHERE %(fk)s IN (%(ids)s)' % {
+                    'table': qn(self.model._meta.db_table),
+                    'column': column,
+                    'fk': qn(self.model._meta.get_field('project').column),
+                    'cases': ' '.join(['WHEN %s THEN %s'] * len(batch)),
+                    'ids': ', '.join(['%s'] * len(batch)),
+                },
+                params
+            )
+            updated += cursor.rowcount
+        return updated
+
+    def rebuild(self, queryset=None):
+        """
+        Recompute the totals of every project in queryset (all projects by
+        default) from the Payment, AdminRepayment and donor tables, with one
+        GROUP BY query per total, and replace the stored totals with them.
+
+        :return: the list of the projects' stored ProjectFundingTotals, the
+        rebuilt ones unless another process stored a project's totals while
+        they were being replaced
+        """
+        if queryset is None:
+            queryset = Project.objects.all()
+        project_ids = list(queryset.values_list('pk', flat=True))
+        if not project_ids:
+            return []
+
+        def sums_by_project(payments_queryset, field='amount'):
+            rows = payments_queryset.filter(project__in=project_ids).values('project').annotate(
+                total=Sum(field)
+            ).order_by()
+            return dict((row['project'], row['total'] or 0.0) for row in rows)
+
+        donated = sums_by_project(Payment.objects.all())
+        organic = sums_by_project(Payment.objects.exclude(user__isnull=True).filter(
+            entrant__pk=models.F('user__pk')
+        ))
+        reinvested = sums_by_project(Payment.objects.reinvestment_fragments())
+        repaid = sums_by_project(AdminRepayment.objects.all())
+        donor_rows = Project.donors.through.objects.filter(project__in=project_ids).values('project').annotate(
+            total=Count('revolvuserprofile')
+        ).order_by()
+        donors = dict((row['project'], row['total']) for row in donor_rows)
+
+        totals = [
+            ProjectFundingTotals(
+                project_id=project_id,
+                amount_donated=donated.get(project_id, 0.0),
+                amount_donated_organically=organic.get(project_id, 0.0),
+                amount_reinvested=reinvested.get(project_id, 0.0),
+                amount_repaid=repaid.get(project_id, 0.0),
+                donor_count=donors.get(project_id, 0),
+            )
+            for project_id in project_ids
+        ]
+        for attempt in range(self.REBUILD_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    self.get_queryset().filter(project__in=project_ids).delete()
+                    self.bulk_create(totals)
+                return totals
+            except IntegrityError:
+                # somebody else built the totals for one of these projects after
+                # we deleted them: the batch was rolled back, so try it again,
+                # which deletes theirs too
+                continue
+        # still conflicting, so replace the totals one project at a time, and
+        # keep whichever totals of a project are stored in the end
+        saved = []
+        for project_totals in totals:
+            try:
+                with transaction.atomic():
+                    self.get_queryset().filter(project_id=project_totals.project_id).delete()
+                    project_totals.save(force_insert=True)
+                saved.append(project_totals)
+            except IntegrityError:
+                # the other builder committed its totals for this project after
+                # we deleted them, and they include everything ours do
+                saved.append(self.get_queryset().get(project_id=project_totals.project_id))
+        return saved
+
+
+class ProjectFundingTotals(models.Model):
+    """
+    Denormalized funding totals for a single Project: how much has been donated
+    (in total and organically), repaid and reinvested, and how many donors the
+    project has.
+
+    Reading these from a Project used to mean running a SUM aggregate over the
+    whole payment history of the project for every property access. Instead,
+    the handlers in revolv.payments.signals keep this row up to date atomically
+    as Payments, AdminRepayments and donors are added and removed, and the
+    Project properties (amount_donated, amount_left, percent_complete, ...) read
+    from it.
+
+    A project's totals are built lazily from the payment tables the first time
+    they are read, and `manage.py rebuildfundingtotals` rebuilds all of them.
+    """
+    project = models.OneToOneField(Project, primary_key=True, related_name='funding_totals')
+
+    amount_donated = models.FloatField(default=0.0)
+    amount_donated_organically = models.FloatField(default=0.0)
+    amount_repaid = models.FloatField(default=0.0)
+    amount_reinvested = models.FloatField(default=0.0)
+    donor_count = models.PositiveIntegerField(default=0)
+
+    objects = ProjectFundingTotalsManager()
+
+    def __unicode__(self):
+        return 'Funding totals for %s' % self.project_id
+
+    @classmethod
+    def column_sql(cls, field_name):
+        """
+        :return: SQL selecting the given column of the totals joined to a
+        Project queryset by select_related('funding_totals'), or 0 if the
+        project has no totals, for use in the queryset's extra() (see
+        ProjectManager.with_funding_stats).
+        """
+        qn = connection.ops.quote_name
+        return 'COALESCE(%(totals)s.%(column)s, 0)' % {
+            'column': qn(cls._meta.get_field(field_name).column),
+            'totals': qn(cls._meta.db_table),
+        }
+
+
+class ProjectContributionManager(models.Manager):
+    """
+    Manager for ProjectContribution.
+    """
+
+    def payment_deltas(self, payment, is_reinvestment, sign=1):
+        """
+        :return: the changes that adding (sign=1) or taking away (sign=-1) the
+            given Payment makes to its user's contribution to its project, as a
+            dict of field name to amount.
+        """
+        amount = sign * float(payment.amount)
+        is_organic = payment.user_id == payment.entrant_id
+        return {
+            'organic_total': amount if is_organic else 0.0,
+            'reinvested_total': amount if is_reinvestment else 0.0,
+            'payment_count': sign,
+        }
+
+    def record_payment(self, payment, is_reinvestment, sign=1):
+        """
+        Add (sign=1) or take away (sign=-1) a Payment in its user's contribution
+        to its project, with a single UPDATE using F expressions (creating the
+        contribution if this is the user's first payment to the project, and
+        deleting it once the user has no payments to the project left).
+
+        :return: the user's number of payments to the project afterwards, or
+            None if the payment has no user
+        """
+        if payment.user_id is None:
+            return None
+        deltas = self.payment_deltas(payment, is_reinvestment, sign)
+        contribution = self.get_queryset().filter(project_id=payment.project_id, user_id=payment.user_id)
+
+        def apply_deltas():
+            return contribution.update(
+                **dict((field, models.F(field) + delta) for field, delta in deltas.items())
+            )
+
+        with transaction.atomic():
+            if not apply_deltas():
+                if sign < 0:
+                    return 0
+                try:
+                    with transaction.atomic():
+                        self.create(
+                            project_id=payment.project_id,
+                            user_id=payment.user_id,
+                            organic_total=deltas['organic_total'],
+                            reinvested_total=deltas['reinvested_total'],
+                            payment_count=1
+                        )
+                    return 1
+                except IntegrityError:
+                    # the user's first payment to the project was recorded
+                    # concurrently; add to theirs.
+                    apply_deltas()
+            payment_count = contribution.values_list('payment_count', flat=True)[0]
+            if payment_count <= 0:
+                contribution.delete()
+            return max(payment_count, 0)
+
+    def record_reinvestments(self, project, contributions):
+        """
+        Add the reinvestment fragment Payments of an AdminReinvestment, given as
+        a list of (RevolvUserProfile pk, amount) tuples, to the users'
+        contributions to project, with one query to find the existing
+        contributions, one bulk INSERT and one UPDATE. Call this inside the
+        transaction that creates the Payments.
+
+        :return: the pks of the users who weren't contributing to the project
+            before
+        """
+        amounts = dict(contributions)
+        if not amounts:
+            return []
+        existing = set(self.get_queryset().filter(project=project, user__in=amounts.keys()).values_list(
+            'user', flat=True
+        ))
+        new = [user_id for user_id in amounts if user_id not in existing]
+        self.bulk_create([
+            ProjectContribution(project=project, user_id=user_id, reinvested_total=amounts[user_id], payment_count=1)
+            for user_id in new
+        ])
+        if existing:
+            connection = connections[self.db]
+            qn = connection.ops.quote_name
+            user_ids = sorted(existing)
+            params = []
+            for user_id in user_ids:
+                params.extend([user_id, float(amounts[user_id])])
+            params.append(project.pk)
+            params.extend(user_ids)
+            connection.cursor().execute(
+                'UPDATE %(table)s SET %(reinvested)s = %(reinvested)s + CASE %(user)s %(cases)s END, '
+                '%(count)s = %(count)s + 1 WHERE %(project)s = %%s AND %(user)s IN (%(ids)s)' % {
+                    'table': qn(self.model._meta.db_table),
+                    'reinvested': qn(self.model._meta.get_field('reinvested_total').column),
+                    'count': qn(self.model._meta.get_field('payment_count').column),
+                    'user': qn(self.model._meta.get_field('user').column),
+                    'project': qn(self.model._meta.get_field('project').column),
+                    'cases': ' '.join(['WHEN %s THEN %s'] * len(user_ids)),
+                    'ids': ', '.join(['%s'] * len(user_ids)),
+                },
+                params
+            )
+        return new
+
+    def apply_deltas(self, deltas):
+        """
+        Add many changes to users' contributions at once: one query to find the
+        existing contributions, one bulk INSERT of the new ones, one UPDATE per
+        field of the existing ones and one DELETE of those left without
+        payments.
+
+        :deltas: A dict mapping (Project pk, RevolvUserProfile pk) tuples to
+            dicts of the changes to organic_total, reinvested_total and
+            payment_count, as made by record_payment
+        :return: a tuple of the lists of (Project pk, RevolvUserProfile pk)
+            tuples whose contribution was created and deleted, i.e. the donors
+            to add to and remove from the projects
+        """
+        deltas = dict((key, delta) for key, delta in deltas.items() if any(delta.values()))
+        if not deltas:
+            return [], []
+        project_ids = set(project_id for project_id, _ in deltas)
+        user_ids = set(user_id for _, user_id in deltas)
+        existing = dict(
+            ((project_id, user_id), (pk, payment_count))
+            for pk, project_id, user_id, payment_count in self.get_queryset().filter(
+                project__in=project_ids, user__in=user_ids
+            ).values_list('pk', 'project', 'user', 'payment_count')
+        )
+
+        created = []
+        for key, delta in sorted(deltas.items()):
+            if key not in existing and delta.get('payment_count', 0) > 0:
+                project_id, user_id = key
+                created.append(ProjectContribution(
+                    project_id=project_id,
+                    user_id=user_id,
+                    organic_total=delta.get('organic_total', 0.0),
+                    reinvested_total=delta.get('reinvested_total', 0.0),
+                    payment_count=int(delta['payment_count']),
+                ))
+        self.bulk_create(created)
+
+        deleted = [
+            key for key, (pk, payment_count) in existing.items()
+            if key in deltas and payment_count + deltas[key].get('payment_count', 0) <= 0
+        ]
+        updated = dict((existing[key][0], delta) for key, delta in deltas.items()
+                       if key in existing and key not in deleted)
+        if updated:
+            connection = connections[self.db]
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            for field in ('organic_total', 'reinvested_total', 'payment_count'):
+                cast = int if field == 'payment_count' else float
+                changes = dict((pk, cast(delta[field])) for pk, delta in updated.items() if delta.get(field))
+                if not changes:
+                    continue
+                pks = sorted(changes)
+                params = []
+                for pk in pks:
+                    params.extend([pk, changes[pk]])
+                params.extend(pks)
+                cursor.execute(
+                    'UPDATE %(table)s SET %(column)s = %(column)s + CASE %(pk)s %(cases)s END '
+                    'WHERE %(pk)s IN (%(ids)s)' % {
+                        'table': qn(self.model._meta.db_table),
+                        'column': qn(self.model._meta.get_field(field).column),
+                        'pk': qn(self.model._meta.pk.column),
+                        'cases': ' '.join(['WHEN %s THEN %s'] * len(pks)),
+                        'ids': ', '.join(['%s'] * len(pks)),
+                    },
+                    params
+                )
+        if deleted:
+            self.get_queryset().filter(pk__in=[existing[key][0] for key in deleted]).delete()
+        return [(c.project_id, c.user_id) for c in created], sorted(deleted)
+
+    def rebuild(self, queryset=None):
+        """
+        Recompute the contributions to every project in queryset (all projects
+        by default) from the Payment table, with one GROUP BY query per total,
+        and replace the stored contributions with them.
+
+        :return: the list of rebuilt ProjectContributions
+        """
+        if queryset is None:
+            queryset = Project.objects.all()
+        project_ids = list(queryset.values_list('pk', flat=True))
+        if not project_ids:
+            return []
+
+        def by_contributor(payments_queryset, aggregate):
+            rows = payments_queryset.filter(project__in=project_ids, user__isnull=False).values(
+                'project', 'user'
+            ).annotate(total=aggregate).order_by()
+            return dict(((row['project'], row['user']), row['total'] or 0) for row in rows)
+
+        counts = by_contributor(Payment.objects.all(), Count('pk'))
+        organic = by_contributor(Payment.objects.filter(entrant__pk=models.F('user__pk')), Sum('amount'))
+        reinvested = by_contributor(Payment.objects.reinvestment_fragments(), Sum('amount'))
+
+        contributions = [
+            ProjectContribution(
+                project_id=project_id,
+                user_id=user_id,
+                organic_total=organic.get((project_id, user_id), 0.0),
+                reinvested_total=reinvested.get((project_id, user_id), 0.0),
+                payment_count=payment_count,
+            )
+            for (project_id, user_id), payment_count in counts.items()
+        ]
+        with transaction.atomic():
+            self.get_queryset().filter(project__in=project_ids).delete()
+            self.bulk_create(contributions)
+        return contributions
+
+
+class ProjectContribution(models.Model):
+    """
+    Denormalized totals of one user's payments to one project: how much they
+    donated organically, how much of their reinvest pool was reinvested into
+    it, and how many payments they made to it.
+
+    The payment handlers in revolv.payments.signals (and the bulk reinvestment
+    pooling) keep these rows up to date in the same transaction as the
+    payments, and a project's donors are exactly the users with a contribution
+    to it: a user is added to Project.donors with their first payment and
+    removed with their last. Proportional repayments, donor removal and
+    proportion_donated are then indexed lookups rather than aggregates over the
+    project's whole payment history.
+
+    `manage.py rebuildfundingtotals` rebuilds the contributions too.
+    """
+    project = models.ForeignKey(Project, related_name='contributions')
+    user = models.ForeignKey(RevolvUserProfile, related_name='contributions')
+
+    organic_total = models.FloatField(default=0.0)
+    reinvested_total = models.FloatField(default=0.0)
+    payment_count = models.PositiveIntegerField(default=0)
+
+    objects = ProjectContributionManager()
+
+    class Meta:
+        unique_together = ('project', 'user')
+
+    def __unicode__(self):
+        return 'Contribution of %s to %s' % (self.user_id, self.project_id)
+
+
 class ProjectUpdate(models.Model):
     factories = ImportProxy("revolv.project.factories", "ProjectUpdateFactories")
     update_text = RichTextField(
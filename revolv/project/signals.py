@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.db.models import signals
+from django.dispatch import receiver
+
+from revolv.project.models import Category, DonationLevel, Project, ProjectUpdate
+
+# Payments, repayments and reinvestments make their projects' cached fragments
+# stale in revolv.payments.signals, together with the rest of their bookkeeping.
+
+
+@receiver(signals.post_save, sender=Project)
+def post_save_project_cache_version(**kwargs):
+    """
+    When a Project is saved, make its cached fragments stale.
+    """
+    if kwargs.get('raw'):
+        return
+    kwargs.get('instance').bump_cache_version()
+
+
+@receiver(signals.post_save, sender=ProjectUpdate)
+@receiver(signals.post_delete, sender=ProjectUpdate)
+@receiver(signals.post_save, sender=DonationLevel)
+@receiver(signals.post_delete, sender=DonationLevel)
+def project_detail_changed(**kwargs):
+    """
+    When a ProjectUpdate or DonationLevel is saved or deleted, make its
+    project's cached fragments stale.
+    """
+    if kwargs.get('raw'):
+        return
+    Project.objects.bump_cache_versions([kwargs.get('instance').project_id])
+
+
+@receiver(signals.post_save, sender=Category)
+def post_save_category(**kwargs):
+    """
+    When a Category is saved (e.g. renamed), make the cached fragments of all
+    its projects stale.
+    """
+    if kwargs.get('raw') or kwargs.get('created'):
+        return
+    Project.objects.bump_cache_versions(kwargs.get('instance').projects.values_list('pk', flat=True))
+
+
+@receiver(signals.post_save, sender=User)
+def post_save_user(**kwargs):
+    """
+    When a User's name may have changed, make the cached fragments of the
+    projects they donated to stale, since those list their donors' names.
+    Saves that can't change the name (e.g. updating last_login) are ignored.
+    """
+    if kwargs.get('raw') or kwargs.get('created'):
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not set(update_fields) & set(['first_name', 'last_name', 'username']):
+        return
+    Project.objects.bump_cache_versions(
+        Project.objects.filter(donors__user=kwargs.get('instance')).values_list('pk', flat=True)
+    )
+
+
+@receiver(signals.m2m_changed, sender=Category.projects.through)
+@receiver(signals.m2m_changed, sender=Project.donors.through)
+def project_relation_changed(**kwargs):
+    """
+    When projects are added to or removed from a Category, or donors to or
+    from a Project, make the cached fragments of the projects involved stale,
+    from whichever side the relation is changed.
+    """
+    action = kwargs.get('action')
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    instance = kwargs.get('instance')
+    if isinstance(instance, Project):
+        instance.bump_cache_version()
+        return
+    # instance is a Category or a RevolvUserProfile, pk_set holds Project pks
+    if action == 'pre_clear':
+        if isinstance(instance, Category):
+            related = Project.objects.filter(category=instance)
+        else:
+            related = Project.objects.filter(donors=instance)
+        project_ids = related.values_list('pk', flat=True)
+    else:
+        project_ids = kwargs.get('pk_set') or []
+    Project.objects.bump_cache_versions(project_ids)
@@ -3,6 +3,8 @@ Module for encapsulating functions related to project statistics (aka
 computing the effects of projects based on their stated kilowatt output).
 """
 from django.db.models import Sum
+from django.db.models.query import QuerySet
+
 
 class KilowattStatsAggregatorException(Exception):
     """Exception for something that went wrong with the KilowattStatsAggregator."""
@@ -88,7 +90,61 @@ class KilowattStatsAggregator(object):
         if total_kilowatts is None:
             raise KilowattStatsAggregatorException("Could not determine total kilowatt output of Project queryset.")
 
-        return cls(queryset.aggregate(Sum("impact_power"))["impact_power__sum"])
+        return cls(total_kilowatts)
+
+    @classmethod
+    def per_kilowatt(cls):
+        """
+        Return all statistics for one kilowatt, as a dict. Every statistic is
+        proportional to the kilowatts, so multiplying these by a project's
+        kilowatts gives that project's statistics.
+        """
+        return cls(1).as_dict()
+
+    @classmethod
+    def _scale(cls, kilowatts):
+        """
+        Return a dict mapping the name of every statistic to a dict of its values,
+        with the same keys as the given dict of kilowatts.
+        """
+        return dict(
+            (statistic, dict((key, float(kw or 0.0) * factor) for key, kw in kilowatts.items()))
+            for statistic, factor in cls.per_kilowatt().items()
+        )
+
+    @classmethod
+    def for_projects(cls, projects):
+        """
+        Compute every statistic for many projects at once, instead of creating an
+        aggregator per project.
+
+        :projects: A queryset of Projects (only their kilowatts are fetched, in
+            one query) or a list of Projects (no query)
+        :return: A dict mapping the name of every statistic (see as_dict) to a
+            dict mapping each project's pk to its value, e.g.
+            stats["dollars_saved_per_month"][project.pk]
+        """
+        if isinstance(projects, QuerySet):
+            kilowatts = dict(projects.order_by().values_list("pk", "impact_power"))
+        else:
+            kilowatts = dict((project.pk, project.impact_power) for project in projects)
+        return cls._scale(kilowatts)
+
+    @classmethod
+    def for_project_groups(cls, queryset, group_by):
+        """
+        Compute every statistic for groups of projects, with one GROUP BY.
+
+        :queryset: A queryset of Projects
+        :group_by: The Project field to group by, e.g. "project_status", or
+            "category" to group by the pk of the projects' categories (a project
+            counts towards each of its categories, and towards None if it has no
+            category)
+        :return: A dict mapping the name of every statistic (see as_dict) to a
+            dict mapping each group's value of group_by to the group's total
+        """
+        rows = queryset.order_by().values_list(group_by).annotate(kilowatts=Sum("impact_power"))
+        return cls._scale(dict(rows))
 
     def __init__(self, kilowatts):
         """
@@ -2,11 +2,16 @@ import datetime
 from collections import namedtuple
 from operator import add, sub
 
+import mock
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.test import TestCase
 from revolv.base.models import RevolvUserProfile
+from revolv.base.page_cache import invalidate_page_tags
 from revolv.payments.models import (AdminReinvestment, AdminRepayment, Payment,
                                     PaymentType)
-from revolv.project.models import Category, Project, ProjectUpdate
+from revolv.project.models import (Category, DonationLevel, Project, ProjectContribution,
+                                   ProjectFundingTotals, ProjectUpdate)
 from revolv.project.tasks import scrape
 
 
@@ -241,6 +246,205 @@ class ProjectTests(TestCase):
         project = Project.factories.base.create(impact_power=10.0)
         self.assertEqual(project.statistics.kilowatts, 10.0)
 
+    def test_reserve_reinvestment(self):
+        """Test that reservations never claim more than the cap or the amount left."""
+        user = RevolvUserProfile.factories.base.create()
+        project = Project.factories.base.create(funding_goal=100.0, monthly_reinvestment_cap=50.0)
+        stale_project = Project.objects.get(pk=project.pk)
+        Payment.factories.donation.create(project=project, user=user, amount=80.0)
+
+        self.assertEqual(project.reserve_reinvestment(15.0), 15.0)
+        # only 20.0 is left to reach the goal
+        self.assertEqual(stale_project.reserve_reinvestment(30.0), 20.0)
+        self.assertEqual(Project.objects.get(pk=project.pk).monthly_reinvestment_cap, 15.0)
+        # only 15.0 is left of the cap
+        self.assertEqual(project.reserve_reinvestment(20.0), 15.0)
+        self.assertEqual(project.reserve_reinvestment(20.0), 0.0)
+
+        project.release_reinvestment(20.0)
+        Payment.factories.donation.create(project=project, user=user, amount=20.0)
+        self.assertEqual(project.reserve_reinvestment(10.0), 0.0)
+        self.assertEqual(Project.objects.get(pk=project.pk).monthly_reinvestment_cap, 20.0)
+
+
+class ProjectFundingTotalsTests(TestCase):
+    """Tests that the denormalized funding totals of a project stay correct."""
+
+    def assert_totals_equal(self, project, **expected):
+        totals = ProjectFundingTotals.objects.get(project=project)
+        for field, value in expected.items():
+            self.assertEqual(getattr(totals, field), value)
+
+    def test_totals_follow_payments(self):
+        """Test that creating and deleting payments and repayments updates the totals."""
+        user1, user2 = RevolvUserProfile.factories.base.create_batch(2)
+        admin = RevolvUserProfile.factories.admin.create()
+        project = Project.factories.base.create(funding_goal=200.0)
+
+        payment = Payment.factories.donation.create(project=project, user=user1, amount=50.0)
+        Payment.factories.donation.create(project=project, user=user2, amount=30.0)
+        Payment.factories.base.create(
+            project=project, user=user2, entrant=admin, amount=20.0,
+            payment_type=PaymentType.objects.get_check()
+        )
+        self.assert_totals_equal(
+            project, amount_donated=100.0, amount_donated_organically=80.0, donor_count=2
+        )
+        self.assertEqual(project.amount_left, 100.0)
+        self.assertEqual(project.percent_complete, 50)
+
+        payment.delete()
+        self.assert_totals_equal(
+            project, amount_donated=50.0, amount_donated_organically=30.0, donor_count=1
+        )
+
+        project.complete_project()
+        repayment = AdminRepayment.factories.base.create(project=project, amount=40.0)
+        self.assert_totals_equal(project, amount_repaid=40.0)
+        repayment.delete()
+        self.assert_totals_equal(project, amount_repaid=0.0)
+
+    def test_rebuild(self):
+        """Test that rebuilding the totals from scratch matches the incremental totals."""
+        user1, user2 = RevolvUserProfile.factories.base.create_batch(2)
+        project = Project.factories.base.create(funding_goal=200.0)
+        Payment.factories.donation.create(project=project, user=user1, amount=12.5)
+        Payment.factories.donation.create(project=project, user=user2, amount=30.0)
+        project.complete_project()
+        AdminRepayment.factories.base.create(project=project, amount=10.0)
+        incremental = ProjectFundingTotals.objects.get(project=project)
+
+        ProjectFundingTotals.objects.all().delete()
+        call_command("rebuildfundingtotals", quiet=True)
+        rebuilt = ProjectFundingTotals.objects.get(project=project)
+        for field in ("amount_donated", "amount_donated_organically", "amount_repaid",
+                      "amount_reinvested", "donor_count"):
+            self.assertEqual(getattr(incremental, field), getattr(rebuilt, field))
+
+    def test_rebuild_conflicts(self):
+        """
+        Test that a rebuild whose batch keeps conflicting with another process
+        replaces the totals one project at a time, and returns what is stored.
+        """
+        first, second = Project.factories.base.create_batch(2)
+        Payment.factories.donation.create(project=first, amount=15.0)
+        projects = Project.objects.filter(pk__in=[first.pk, second.pk]).order_by('pk')
+        with mock.patch.object(ProjectFundingTotals.objects, 'bulk_create', side_effect=IntegrityError):
+            rebuilt = ProjectFundingTotals.objects.rebuild(projects)
+        self.assertEqual([totals.project_id for totals in rebuilt], [first.pk, second.pk])
+        for totals in rebuilt:
+            stored = ProjectFundingTotals.objects.get(project_id=totals.project_id)
+            self.assertEqual(stored.amount_donated, totals.amount_donated)
+        self.assertEqual(rebuilt[0].amount_donated, 15.0)
+
+    def test_totals_built_lazily(self):
+        """Test that a project without stored totals builds them when they are read."""
+        project = Project.factories.base.create()
+        Payment.factories.donation.create(project=project, amount=15.0)
+        ProjectFundingTotals.objects.filter(project=project).delete()
+        self.assertEqual(project.amount_donated, 15.0)
+        self.assertEqual(project.donor_count, 1)
+
+
+class ProjectContributionTests(TestCase):
+    """Tests that the denormalized contributions of each donor stay correct."""
+
+    def test_contributions_follow_payments(self):
+        """Test that payments update the contribution and the project's donors."""
+        user = RevolvUserProfile.factories.base.create()
+        admin = RevolvUserProfile.factories.admin.create()
+        project = Project.factories.base.create(funding_goal=200.0)
+
+        first = Payment.factories.donation.create(project=project, user=user, amount=50.0)
+        self.assertEqual(list(project.donors.all()), [user])
+        second = Payment.factories.base.create(
+            project=project, user=user, entrant=admin, amount=20.0,
+            payment_type=PaymentType.objects.get_check()
+        )
+        contribution = ProjectContribution.objects.get(project=project, user=user)
+        self.assertEqual(contribution.organic_total, 50.0)
+        self.assertEqual(contribution.reinvested_total, 0.0)
+        self.assertEqual(contribution.payment_count, 2)
+        self.assertEqual(project.proportion_donated(user), 1.0)
+
+        first.delete()
+        contribution = ProjectContribution.objects.get(project=project, user=user)
+        self.assertEqual(contribution.organic_total, 0.0)
+        self.assertEqual(contribution.payment_count, 1)
+        self.assertEqual(list(project.donors.all()), [user])
+
+        second.delete()
+        self.assertFalse(ProjectContribution.objects.filter(project=project, user=user).exists())
+        self.assertFalse(project.donors.exists())
+
+    def test_rebuild(self):
+        """Test that rebuilding the contributions from scratch matches the incremental ones."""
+        user1, user2 = RevolvUserProfile.factories.base.create_batch(2)
+        project = Project.factories.base.create(funding_goal=200.0)
+        Payment.factories.donation.create(project=project, user=user1, amount=12.5)
+        Payment.factories.donation.create(project=project, user=user1, amount=7.5)
+        Payment.factories.donation.create(project=project, user=user2, amount=30.0)
+        incremental = sorted(
+            ProjectContribution.objects.filter(project=project).values_list(
+                'user', 'organic_total', 'reinvested_total', 'payment_count'
+            )
+        )
+
+        ProjectContribution.objects.all().delete()
+        call_command("rebuildfundingtotals", quiet=True)
+        rebuilt = sorted(
+            ProjectContribution.objects.filter(project=project).values_list(
+                'user', 'organic_total', 'reinvested_total', 'payment_count'
+            )
+        )
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(rebuilt, [(user1.pk, 20.0, 0.0, 2), (user2.pk, 30.0, 0.0, 1)])
+
+
+class ProjectCacheVersionTests(TestCase):
+    """Tests that a project's cache version changes with anything its fragments show."""
+
+    def assert_bumps(self, project, change):
+        before = Project.objects.cache_versions([project.pk])[project.pk]
+        change()
+        self.assertNotEqual(Project.objects.cache_versions([project.pk])[project.pk], before)
+
+    def test_versions_are_bumped(self):
+        project = Project.factories.base.create()
+        category = Category.objects.create(title='Cache Test')
+        self.assert_bumps(project, lambda: Payment.factories.donation.create(project=project, amount=10.0))
+        self.assert_bumps(project, lambda: Payment.objects.filter(project=project).get().delete())
+        self.assert_bumps(project, lambda: project.add_update('Panels are up'))
+        self.assert_bumps(project, lambda: DonationLevel.objects.create(
+            project=project, description='A thank you card', amount=20
+        ))
+        self.assert_bumps(project, lambda: category.projects.add(project))
+        self.assert_bumps(project, lambda: project.save())
+
+    def test_donor_rename_bumps(self):
+        project = Project.factories.base.create()
+        user = RevolvUserProfile.factories.base.create()
+        Payment.factories.donation.create(project=project, user=user, amount=10.0)
+        user.user.first_name = 'Renamed'
+        self.assert_bumps(project, lambda: user.user.save())
+
+        before = Project.objects.cache_versions([project.pk])[project.pk]
+        user.user.save(update_fields=['last_login'])
+        self.assertEqual(Project.objects.cache_versions([project.pk])[project.pk], before)
+
+    def test_fragment_cache_key(self):
+        project = Project.factories.base.create()
+        Project.objects.prime_cache_versions([project])
+        key = project.fragment_cache_key
+        self.assertEqual(project.fragment_cache_key, key)
+        project.bump_cache_version()
+        self.assertNotEqual(project.fragment_cache_key, key)
+
+        key = project.fragment_cache_key
+        invalidate_page_tags(['cms'])
+        Project.objects.prime_cache_versions([project])
+        self.assertNotEqual(project.fragment_cache_key, key)
+
 
 class ProjectManagerTests(TestCase):
     """Tests for the Project manager"""
@@ -304,6 +508,35 @@ class ProjectManagerTests(TestCase):
         )
         self.assertEqual(aggregator.kilowatts, 40.0)
 
+    def test_with_funding_stats(self):
+        """Test that with_funding_stats annotates, filters and orders in one query."""
+        user = RevolvUserProfile.factories.base.create()
+        funded = Project.factories.base.create(funding_goal=100.0)
+        half_funded = Project.factories.base.create(funding_goal=100.0)
+        Payment.factories.donation.create(project=funded, user=user, amount=120.0)
+        Payment.factories.donation.create(project=half_funded, user=user, amount=50.0)
+        queryset = Project.objects.filter(pk__in=[funded.pk, half_funded.pk])
+
+        with self.assertNumQueries(1):
+            projects = list(Project.objects.with_funding_stats(queryset).order_by('-funding_percent_complete'))
+            self.assertEqual(projects, [funded, half_funded])
+            self.assertEqual([p.funding_amount_left for p in projects], [0.0, 50.0])
+            self.assertEqual([p.amount_donated for p in projects], [120.0, 50.0])
+            self.assertEqual([p.percent_complete for p in projects], [100, 50])
+            self.assertEqual([p.donor_count for p in projects], [1, 1])
+
+        needing_funds = Project.objects.with_funding_stats(queryset, min_amount_left=0.0)
+        self.assertEqual(list(needing_funds), [half_funded])
+        self.assertEqual(needing_funds.count(), 1)
+
+        # filtering an annotated queryset doesn't annotate it again
+        unbuilt = Project.factories.base.create(funding_goal=100.0)
+        ProjectFundingTotals.objects.filter(project=unbuilt).delete()
+        annotated = Project.objects.with_funding_stats(queryset | Project.objects.filter(pk=unbuilt.pk))
+        needing_funds = Project.objects.needing_funding(annotated, min_amount_left=10.0)
+        self.assertEqual(sorted(p.pk for p in needing_funds), sorted([half_funded.pk, unbuilt.pk]))
+        self.assertEqual(str(needing_funds.query).count('COALESCE'), str(annotated.query).count('COALESCE'))
+
 
 class CategoryTest(TestCase):
     """Tests that category selection and updating work with projects."""
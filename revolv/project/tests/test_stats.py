@@ -25,3 +25,20 @@ class StatsAggregatorTestCase(TestCase):
         project1, project2 = Project.factories.base.create_batch(2, impact_power=20.0)
         aggregator = KilowattStatsAggregator.from_project_queryset(Project.objects.filter(id__in=[project1.pk, project2.pk]))
         self.assertEqual(aggregator.kilowatts, 40.0)
+
+    def test_batch_statistics(self):
+        """Test that we can compute the statistics of many projects at once."""
+        project1 = Project.factories.base.create(impact_power=12.0)
+        project2 = Project.factories.base.create(impact_power=20.0, project_status=Project.ACTIVE)
+        queryset = Project.objects.filter(id__in=[project1.pk, project2.pk])
+
+        with self.assertNumQueries(1):
+            stats = KilowattStatsAggregator.for_projects(queryset)
+        self.assertEqual(stats, KilowattStatsAggregator.for_projects([project1, project2]))
+        for project in (project1, project2):
+            for statistic, value in KilowattStatsAggregator.from_project(project).as_dict().items():
+                self.assertAlmostEqual(stats[statistic][project.pk], value)
+
+        with self.assertNumQueries(1):
+            stats = KilowattStatsAggregator.for_project_groups(queryset, "project_status")
+        self.assertEqual(stats["kilowatts"], {project1.project_status: 12.0, Project.ACTIVE: 20.0})
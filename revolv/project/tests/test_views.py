@@ -1,5 +1,6 @@
 from django.test import TestCase
 from revolv.base.models import RevolvUserProfile
+from revolv.payments.models import Payment
 from revolv.project.models import Project
 from revolv.lib.testing import TestUserMixin, UserTestingMixin
 
@@ -19,6 +20,16 @@ class RequestTest(TestCase):
             project.save()
             self._assert_project_page_works(project)
 
+    def test_project_page_fragments_follow_payments(self):
+        """Test that the cached fragments of the project page are never stale."""
+        project = Project.factories.base.create(project_status=Project.ACTIVE, funding_goal=10000.0)
+        resp = self.client.get(project.get_absolute_url())
+        self.assertContains(resp, '$0</span> Donated')
+
+        Payment.factories.donation.create(project=project, amount=4321.0)
+        resp = self.client.get(project.get_absolute_url())
+        self.assertContains(resp, '$4,321</span> Donated')
+
     def test_drafted_projects_404(self):
         """Test that the response is 404 when trying to request the page of a drafted project."""
         project = Project.factories.base.create(project_status=Project.DRAFTED)
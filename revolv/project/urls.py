@@ -1,4 +1,5 @@
 from django.conf.urls import patterns, url
+from revolv.base.page_cache import cache_anonymous_page
 from revolv.base.users import is_ambassador, is_logged_in
 from revolv.project.views import (CreateProjectView, EditProjectUpdateView,
                                   PostProjectUpdateView, ProjectView,
@@ -11,7 +12,9 @@ urlpatterns = patterns(
     url(r'^create$', is_ambassador(CreateProjectView.as_view()), name='new'),
     url(r'^(?P<pk>\d+)/stripe/$', stripe_payment, name='stripe_payment'),
     url(r'^(?P<pk>\d+)/edit$', is_ambassador(UpdateProjectView.as_view()), name='edit'),
-    url(r'^(?P<pk>\d+)/$', ProjectView.as_view(), name='view'),
+    url(r'^(?P<pk>\d+)/$', cache_anonymous_page(
+        lambda request, pk: ['project:%s' % pk, 'cms']
+    )(ProjectView.as_view()), name='view'),
     url(r'^(?P<pk>\d+)/reinvest/$', 'revolv.project.views.reinvest', name='reinvest'),
     url(r'^(?P<pk>\d+)/review$', is_ambassador(ReviewProjectView.as_view()), name='review'),
     url(r'reinvest_list/$', is_logged_in(ProjectListReinvestmentView.as_view()), name='reinvest_list'),
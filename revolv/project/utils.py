@@ -1,6 +1,5 @@
-from django.db.models import Sum
-from revolv.payments.models import Payment
-from revolv.project.models import Project
+from revolv.payments.models import Payment, UserImpactSnapshot
+from revolv.project.stats import KilowattStatsAggregator
 
 def get_solar_csv_url(csv_id, mode):
     """Gets request url to export csv for project with that id.
@@ -11,14 +10,34 @@ def get_solar_csv_url(csv_id, mode):
     url += csv_id + "&mode=" + str(mode) + "&offset=0&flag=32&ex=csv"
     return url
 
+
+def user_impact_stats(user_profiles):
+    """Computes every impact statistic (see KilowattStatsAggregator.as_dict) of many
+    Re-volv users at once, with one aggregate query over their payments. A user's share
+    of a project's impact is the fraction of the project's funding goal they paid.
+
+    Returns a dictionary mapping each user's pk to a dictionary of their statistics.
+    """
+    kilowatts = Payment.objects.impact_kilowatts(user_profiles)
+    return dict(
+        (user_id, KilowattStatsAggregator(kw).as_dict()) for user_id, kw in kilowatts.items()
+    )
+
+
 def aggregate_stats(user_profile):
     """Aggregates statistics about a Re-volv user's impact and returns a dictionary with 
     these values. These values are later presented on the user's dashboard.
+
+    The figures are read from the user's UserImpactSnapshot, a single row which the payment
+    signal handlers keep up to date, so this costs the same however many payments the user has.
     """
+    snapshot = UserImpactSnapshot.objects.get_for_user(user_profile)
+    impact = KilowattStatsAggregator(snapshot.impact_kilowatts)
     stat_dict = {}
-    stat_dict['project_count'] = Project.objects.donated_projects(user_profile).count()
-    stat_dict['repayments'] = Payment.objects.repayment_fragments(user=user_profile).aggregate(Sum('amount'))['amount__sum'] or 0
-    stat_dict['trees'] = user_profile.get_statistic_for_user("acres_of_trees_saved_per_year")
-    stat_dict['kwh'] = user_profile.get_statistic_for_user("kilowatt_hours_per_month")
-    stat_dict['carbon_dioxide'] = user_profile.get_statistic_for_user("pounds_carbon_saved_per_month")
+    stat_dict['project_count'] = snapshot.project_count
+    stat_dict['repayments'] = snapshot.total_repayments
+    stat_dict['total_donated'] = snapshot.total_donated
+    stat_dict['trees'] = impact.acres_of_trees_saved_per_year
+    stat_dict['kwh'] = impact.kilowatt_hours_per_month
+    stat_dict['carbon_dioxide'] = impact.pounds_carbon_saved_per_month
     return stat_dict
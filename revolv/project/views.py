@@ -5,6 +5,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.http import JsonResponse
 from django.http.response import HttpResponseBadRequest
 from django.shortcuts import redirect, render, get_object_or_404
@@ -157,11 +158,11 @@ class UpdateProjectView(DonationLevelFormSetMixin, UpdateView):
         """
         Initializes the already selected categories for a given project.
         """
-        return {'categories_select': self.get_object().categories}
+        return {'categories_select': self.object.categories}
 
     def get_success_url(self):
         messages.success(self.request, 'Project details updated')
-        return reverse('project:view', kwargs={'pk': self.get_object().id})
+        return reverse('project:view', kwargs={'pk': self.object.id})
 
     def form_valid(self, form):
         """
@@ -170,7 +171,7 @@ class UpdateProjectView(DonationLevelFormSetMixin, UpdateView):
         formset = self.get_donation_level_formset()
 
         if formset.is_valid():
-            project = self.get_object()
+            project = self.object
             project.update_categories(form.cleaned_data['categories_select'])
             formset.instance = project
             formset.save()
@@ -200,9 +201,9 @@ class ReviewProjectView(UserDataMixin, UpdateView):
 
     def get_success_url(self):
         if self.is_administrator:
-            return "%s?active_project=%d" % (reverse('administrator:dashboard'), self.get_object().id)
+            return "%s?active_project=%d" % (reverse('administrator:dashboard'), self.object.id)
         else:
-            return reverse('project:view', kwargs={'pk': self.get_object().id})
+            return reverse('project:view', kwargs={'pk': self.object.id})
 
     # Checks the post request and updates the project_status
     def form_valid(self, form):
@@ -287,22 +288,24 @@ class ProjectView(UserDataMixin, DetailView):
     model = Project
     template_name = 'project/project.html'
 
-    # pass in Project Categories and Maps API key
+    # pass in Project Categories and Maps API key. The updates and donation
+    # levels are left lazy, since they are only read when the project's cached
+    # fragments are stale (see Project.fragment_cache_key).
     def get_context_data(self, **kwargs):
         context = super(ProjectView, self).get_context_data(**kwargs)
+        project = self.object
         context['stripe_publishable_key'] = settings.STRIPE_PUBLISHABLE
         context['GOOGLEMAPS_API_KEY'] = settings.GOOGLEMAPS_API_KEY
-        context['updates'] = self.get_object().updates.order_by('date').reverse()
-        context['donor_count'] = self.get_object().donors.count()
-        context['project_donation_levels'] = self.get_object().donation_levels.order_by('amount')
-        context["is_draft_mode"] = self.get_object().project_status == self.get_object().DRAFTED
-        if self.user_profile and self.user_profile.reinvest_pool > 0.0 \
-                and self.get_object().monthly_reinvestment_cap > 0.0 \
-                and self.get_object().amount_left > 0.0:
+        context['updates'] = project.updates.order_by('date').reverse()
+        context['project_donation_levels'] = project.donation_levels.order_by('amount')
+        context["is_draft_mode"] = project.project_status == project.DRAFTED
+        if self.principal and self.principal.reinvest_pool > 0.0 \
+                and project.monthly_reinvestment_cap > 0.0 \
+                and project.amount_left > 0.0:
             context["is_reinvestment"] = True
-            context["reinvestment_amount"] = min(self.get_object().reinvest_amount_left,
-                                                 self.user_profile.reinvest_pool)
-            context["reinvestment_url"] = reverse('project:reinvest', kwargs={'pk': self.get_object().id})
+            context["reinvestment_amount"] = min(project.reinvest_amount_left,
+                                                 self.principal.reinvest_pool)
+            context["reinvestment_url"] = reverse('project:reinvest', kwargs={'pk': project.id})
         else:
             context["is_reinvestment"] = False
             context["reinvestment_amount"] = 0.0
@@ -312,7 +315,7 @@ class ProjectView(UserDataMixin, DetailView):
     def dispatch(self, request, *args, **kwargs):
         # always populate self.user, etc
         super_response = super(ProjectView, self).dispatch(request, *args, **kwargs)
-        project = self.get_object()
+        project = getattr(self, 'object', None) or self.get_object()
         if (project.is_active or project.is_completed or
                 (self.user.is_authenticated() and (project.has_owner(self.user_profile) or self.is_administrator or self.is_ambassador))):
             return super_response
@@ -364,19 +367,18 @@ class ProjectListReinvestmentView(UserDataMixin, TemplateView):
         context = super(ProjectListReinvestmentView, self).get_context_data(**kwargs)
         context["is_reinvestment"] = True
         if not is_user_reinvestment_period():
-            if self.user_profile.reinvest_pool > 0.0:
+            if self.principal.reinvest_pool > 0.0:
                     context["error_msg"] = "You have ${0} to reinvest, " \
                                            "but the reinvestment period has ended for this month. " \
                                            "Please come back next month!" \
-                        .format(self.user_profile.reinvest_pool)
+                        .format(self.principal.reinvest_pool)
             else:
                 context["error_msg"] = "The reinvestment period has ended for this month. " \
                                        "Please come back next month!"
         else:
-            active = Project.objects.get_eligible_projects_for_reinvestment()
-            context["active_projects"] = filter(lambda p: p.amount_left > 0.0, active)
-            if self.user_profile.reinvest_pool > 0.0:
-                context["reinvestment_amount"] = self.user_profile.reinvest_pool
+            context["active_projects"] = Project.objects.get_reinvestment_recipients()
+            if self.principal.reinvest_pool > 0.0:
+                context["reinvestment_amount"] = self.principal.reinvest_pool
             else:
                 context["error_msg"] = "You don't have funds to reinvest."
         return context
@@ -395,10 +397,13 @@ def reinvest(request, pk):
     except (Project.DoesNotExist, Project.MultipleObjectsReturned):
         return HttpResponseBadRequest()
 
-    UserReinvestment.objects.create(user=request.user.revolvuserprofile,
+    # the reservation of the project's monthly reinvestment cap and the
+    # reinvestment itself are committed together
+    with transaction.atomic():
+        UserReinvestment.objects.create(user=request.user.revolvuserprofile,
                                         amount=amount,
                                         project=project)
     res = {'amount_donated': project.amount_donated,
            'partial_completeness': project.partial_completeness_as_js(),
-           'num_donors': project.donors.count()}
+           'num_donors': project.donor_count}
     return JsonResponse({'success': True, 'project': res})
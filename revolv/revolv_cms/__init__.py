@@ -0,0 +1 @@
+default_app_config = 'revolv.revolv_cms.apps.RevolvCmsConfig'
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class RevolvCmsConfig(AppConfig):
+    name = 'revolv.revolv_cms'
+    verbose_name = 'Revolv CMS'
+
+    def ready(self):
+        import revolv.revolv_cms.signals
+        revolv.revolv_cms.signals  # quiet the pep8 flaker
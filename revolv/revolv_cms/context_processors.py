@@ -0,0 +1,12 @@
+from revolv.revolv_cms.site_settings import SiteSettings
+
+
+def settings(request):
+    """
+    Make the Wagtail settings of the request's site available in templates,
+    like wagtailsettings.context_processors.settings does, but from the
+    cached bundle of revolv.revolv_cms.site_settings.
+
+        {{ settings.revolv_cms.FooterSettings.contact_email }}
+    """
+    return {'settings': SiteSettings(request)}
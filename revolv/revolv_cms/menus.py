@@ -0,0 +1,99 @@
+"""
+The two-level menu of Wagtail pages shown in the nav bar and the footer.
+
+The menu of a site (the live, show_in_menus children of its root page and
+their live, show_in_menus children, with their hrefs resolved) is built with
+one query and cached per site, under the version of the 'cms' page cache tag
+(see revolv.base.page_cache), which is bumped whenever a page is published,
+unpublished, saved (which includes being moved) or deleted, or a site is
+saved (see revolv.revolv_cms.signals). The menu is also kept on the request,
+so rendering it several times in a page only looks it up once.
+"""
+from django.core.cache import cache
+from wagtail.wagtailcore.models import Page
+
+from revolv.base.page_cache import get_page_cache_timeout, page_tag_versions
+from revolv.revolv_cms.models import RevolvLinkPage
+
+MENU_CACHE_KEY = 'revolv:cms_menu:%s:%s'
+
+
+class MenuItem(object):
+    """
+    A page in a menu: its title, the href it links to and the menu items of
+    its own children.
+    """
+
+    def __init__(self, pk, title, href, children=None):
+        self.pk = pk
+        self.title = title
+        self.href = href
+        self.children = children or []
+
+    @property
+    def has_menu_children(self):
+        return bool(self.children)
+
+    def __repr__(self):
+        return '<MenuItem: %s>' % self.title
+
+
+def page_href(page, site):
+    """
+    :return: the url that this page links to: the link_href of a
+    RevolvLinkPage, and the page's regular url for any other page.
+
+    The page should have its revolvlinkpage selected with it (as in
+    build_menu), or this will take another query.
+    """
+    try:
+        return page.revolvlinkpage.link_href
+    except RevolvLinkPage.DoesNotExist:
+        # see https://github.com/torchbox/wagtail/blob/master/wagtail/wagtailcore/templatetags/wagtailcore_tags.py#L12
+        return page.relative_url(site)
+
+
+def build_menu(parent_page, site):
+    """
+    :return: the menu items of the live, show_in_menus children of the given
+    Page, each with the menu items of its own live, show_in_menus children,
+    from one query.
+    """
+    pages = Page.objects.filter(
+        path__startswith=parent_page.path,
+        depth__in=[parent_page.depth + 1, parent_page.depth + 2],
+        live=True,
+        show_in_menus=True,
+    ).select_related('revolvlinkpage').order_by('path')
+
+    menu = []
+    items_by_path = {}
+    for page in pages:
+        item = MenuItem(page.pk, page.title, page_href(page, site))
+        if page.depth == parent_page.depth + 1:
+            menu.append(item)
+            items_by_path[page.path] = item
+        else:
+            parent_item = items_by_path.get(page.path[:-Page.steplen])
+            # the children of pages which aren't in the menu aren't either
+            if parent_item is not None:
+                parent_item.children.append(item)
+    return menu
+
+
+def get_site_menu(request):
+    """
+    :return: the (cached) menu items of the children of the root page of the
+    request's site.
+    """
+    menu = getattr(request, '_revolv_cms_menu', None)
+    if menu is not None:
+        return menu
+    site = request.site
+    key = MENU_CACHE_KEY % (site.pk, page_tag_versions(['cms'])['cms'])
+    menu = cache.get(key)
+    if menu is None:
+        menu = build_menu(site.root_page, site)
+        cache.set(key, menu, get_page_cache_timeout())
+    request._revolv_cms_menu = menu
+    return menu
@@ -7,6 +7,9 @@ from wagtail.wagtailcore import blocks
 from wagtail.wagtailimages.blocks import ImageChooserBlock
 from wagtailsettings import BaseSetting, register_setting
 
+from revolv.base.page_cache import serve_from_page_cache
+
+
 class ImageBlock(blocks.StructBlock):
     """
     A block for images whose layout properties and size can be set to one of
@@ -93,6 +96,15 @@ class RevolvCustomPage(Page):
         StreamFieldPanel('body'),
     ]
 
+    def serve(self, request, *args, **kwargs):
+        """
+        Serve the page from the page cache to anonymous visitors (see
+        revolv.base.page_cache).
+        """
+        return serve_from_page_cache(
+            request, ['cms'], super(RevolvCustomPage, self).serve, *args, **kwargs
+        )
+
 
 class RevolvLinkPage(Page):
     """
@@ -0,0 +1,31 @@
+from django.db.models import signals
+from django.dispatch import receiver
+from wagtail.wagtailcore.models import Page, Site
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+from wagtailsettings import BaseSetting
+
+from revolv.base.page_cache import invalidate_page_tags
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def page_publication_changed(**kwargs):
+    """
+    When a Wagtail page is published or unpublished, invalidate the cached
+    pages and menus, since all of the pages show the menus.
+    """
+    invalidate_page_tags(['cms'])
+
+
+@receiver(signals.post_save)
+@receiver(signals.post_delete)
+def cms_content_changed(sender, **kwargs):
+    """
+    When a Wagtail page (e.g. when it is moved or renamed), a site or a
+    setting is saved or deleted, invalidate the cached pages, menus and
+    settings.
+    """
+    if kwargs.get('raw'):
+        return
+    if issubclass(sender, (Page, Site, BaseSetting)):
+        invalidate_page_tags(['cms'])
@@ -0,0 +1,75 @@
+"""
+The Wagtail settings (see revolv.revolv_cms.models) of a site, as one bundle.
+
+Every template shows a few settings, and looking each of them up with
+for_site costs a query per setting per request. Instead, all the registered
+settings of a site are loaded together into a bundle:
+
+    {'revolv_cms': {'FooterSettings': <FooterSettings>, ...}}
+
+which is cached in the shared cache and in the process, under the version of
+the 'cms' page cache tag (see revolv.base.page_cache). That version is bumped
+whenever a setting is saved (see revolv.revolv_cms.signals), so the processes
+reload the bundle from the shared cache, or the database, with the next
+request that needs it.
+"""
+from django.core.cache import cache
+from wagtailsettings.registry import registry
+
+from revolv.base.page_cache import get_page_cache_timeout, page_tag_versions
+
+SETTINGS_CACHE_KEY = 'revolv:cms_settings:%s:%s'
+
+# Site pk -> (version, bundle)
+_bundles = {}
+
+
+def load_site_settings(site):
+    """
+    :return: the bundle of all the registered settings of the site, from the
+    database. Settings without an instance for the site get one with their
+    defaults, as with BaseSetting.for_site.
+    """
+    bundle = {}
+    for model in registry.models:
+        instance, created = model.objects.get_or_create(site=site)
+        bundle.setdefault(model._meta.app_label, {})[model._meta.object_name] = instance
+    return bundle
+
+
+def get_site_settings(site):
+    """
+    :return: the (cached) bundle of all the registered settings of the site.
+    """
+    version = page_tag_versions(['cms'])['cms']
+    cached = _bundles.get(site.pk)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    key = SETTINGS_CACHE_KEY % (site.pk, version)
+    bundle = cache.get(key)
+    if bundle is None:
+        bundle = load_site_settings(site)
+        cache.set(key, bundle, get_page_cache_timeout())
+    _bundles[site.pk] = (version, bundle)
+    return bundle
+
+
+class SiteSettings(dict):
+    """
+    The settings of the request's site, by app label and model name, e.g.
+    settings['revolv_cms']['FooterSettings'] (settings.revolv_cms.FooterSettings
+    in templates). The bundle is only looked up the first time a setting is.
+    """
+
+    def __init__(self, request):
+        super(SiteSettings, self).__init__()
+        self.request = request
+        self.loaded = False
+
+    def __missing__(self, app_label):
+        site = getattr(self.request, 'site', None)
+        if self.loaded or site is None:
+            raise KeyError(app_label)
+        self.loaded = True
+        self.update(get_site_settings(site))
+        return self[app_label]
@@ -1,4 +1,5 @@
 from django import template
+from revolv.revolv_cms.menus import MenuItem, build_menu, get_site_menu
 from revolv.revolv_cms.models import RevolvLinkPage
 
 register = template.Library()
@@ -13,30 +14,41 @@ def get_cms_root_page(context):
     return context['request'].site.root_page
 
 
+def is_site_root(context, parent_page):
+    """
+    Return whether the given page is the root page of the request's site,
+    whose menu is cached (see revolv.revolv_cms.menus).
+    """
+    return getattr(parent_page, 'pk', None) == context['request'].site.root_page_id
+
+
 def has_menu_children(parent_page):
     """
-    Return whether the given wagtail Page has children that are showable in a menu.
+    Return whether the given wagtail Page (or MenuItem) has children that are
+    showable in a menu.
     """
+    if isinstance(parent_page, MenuItem):
+        return parent_page.has_menu_children
     return parent_page.get_children().filter(live=True, show_in_menus=True).exists()
 
 
-def get_menu_children_with_template_data(parent_page):
+def get_menu_children_with_template_data(context, parent_page):
     """
-    Return the children of the given wagtail Page that are live and
-    showable in menus, with extra data on each page about whether they
-    have children or not. This is useful for rendering menus, particularly
-    when you want to check if a top level menu item has children and as such
-    should be rendered with a dropdown second level menu.
+    Return the children of the given wagtail Page (or MenuItem) that are live
+    and showable in menus, as MenuItems with their hrefs and their own
+    children. This is useful for rendering menus, particularly when you want
+    to check if a top level menu item has children and as such should be
+    rendered with a dropdown second level menu.
 
-    Setting an attribute on the pages is kind of hacky, but otherwise
-    we would have to do a whole other variable in the templace, which is
-    even grosser. Also, this is what wagtail does in their demo app: see
-    https://github.com/torchbox/wagtaildemo/blob/a772fd74c2602d193afc725499a14c4b0fd2da65/demo/templatetags/demo_tags.py#L33
+    The menu of the site's root page comes from the cache, and the children of
+    one of its items from the item itself, so neither takes any queries. The
+    menus of other pages are built with one query.
     """
-    children = parent_page.get_children().filter(live=True, show_in_menus=True)
-    for child in children:
-        child.has_menu_children = has_menu_children(child)
-    return children
+    if isinstance(parent_page, MenuItem):
+        return parent_page.children
+    if is_site_root(context, parent_page):
+        return get_site_menu(context['request'])
+    return build_menu(parent_page, context['request'].site)
 
 
 def partial_menu_context(context, parent_page):
@@ -44,15 +56,15 @@ def partial_menu_context(context, parent_page):
     Render a context to pass to a two-level menu of wagtail pages.
     This is used both by partial_nav_menu and partial_footer_menu.
     """
-    child_pages = get_menu_children_with_template_data(parent_page)
+    child_pages = get_menu_children_with_template_data(context, parent_page)
     return {
         "menu_pages": child_pages,
         "request": context["request"]  # we must pass this along for other tags that need it
     }
 
 
-@register.assignment_tag()
-def num_menu_pages(parent_page):
+@register.assignment_tag(takes_context=True)
+def num_menu_pages(context, parent_page):
     """
     Return the number of top level pages for the nav and footer menus.
 
@@ -60,7 +72,7 @@ def num_menu_pages(parent_page):
         {% num_menu_pages request.site.root_page as menu_pages_count %}
         ... do something with menu_pages count ...
     """
-    return get_menu_children_with_template_data(parent_page).count()
+    return len(get_menu_children_with_template_data(context, parent_page))
 
 
 @register.inclusion_tag("revolv_cms/tags/partial_nav_menu.html", takes_context=True)
@@ -98,26 +110,28 @@ def partial_footer_menu(context, parent_page):
     return partial_menu_context(context, parent_page)
 
 
-@register.assignment_tag()
-def get_menu_children(parent_page):
+@register.assignment_tag(takes_context=True)
+def get_menu_children(context, parent_page):
     """
-    Template tag for getting the children of a given page. Useful when
-    rendering menus.
+    Template tag for getting the children of a given page (or MenuItem).
+    Useful when rendering menus.
     """
-    return get_menu_children_with_template_data(parent_page)
+    return get_menu_children_with_template_data(context, parent_page)
 
 
 @register.assignment_tag(takes_context=True)
 def link_href(context, page):
     """
-    Return the url that this page defines. If it is a RevolvCustomPage,
-    this will return the page's url as defined by its link_href. If not,
-    it will simply return the page's regular url.
+    Return the url that this page (or MenuItem) defines. If it is a
+    RevolvLinkPage, this will return the page's url as defined by its
+    link_href. If not, it will simply return the page's regular url.
     """
+    if isinstance(page, MenuItem):
+        return page.href
     # specific_class gives us the page as the most specific subclass (in this case,
     # either RevolvCustomPage or RevolvLinkPage)
     if page.specific_class is RevolvLinkPage:
-        return RevolvLinkPage.objects.get(pk=page.id).link_href
+        return page.specific.link_href
     else:
         # see https://github.com/torchbox/wagtail/blob/master/wagtail/wagtailcore/templatetags/wagtailcore_tags.py#L12
         return page.relative_url(context['request'].site)
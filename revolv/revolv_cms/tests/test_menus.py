@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from wagtail.wagtailcore.models import Site
+from revolv.revolv_cms.menus import get_site_menu
+from revolv.revolv_cms.models import RevolvCustomPage, RevolvLinkPage
+
+
+class MenuTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.site = Site.objects.get(is_default_site=True)
+        self.root = self.site.root_page
+        self.about = self.add_page(self.root, RevolvCustomPage(title="About", slug="about", body=[]))
+        self.team = self.add_page(self.about, RevolvCustomPage(title="Team", slug="team", body=[]))
+        self.add_page(self.about, RevolvLinkPage(title="Donate", slug="donate", link_href="/projects/"))
+        self.add_page(self.root, RevolvCustomPage(title="Hidden", slug="hidden", body=[]), show_in_menus=False)
+
+    def add_page(self, parent, page, show_in_menus=True):
+        page.show_in_menus = show_in_menus
+        page.live = True
+        parent.add_child(instance=page)
+        return page
+
+    def get_menu(self):
+        request = RequestFactory().get('/')
+        request.site = self.site
+        return get_site_menu(request)
+
+    def test_site_menu(self):
+        """Test that the menu has both levels of menu pages, with their hrefs."""
+        menu = self.get_menu()
+        self.assertEqual([item.title for item in menu], ["About"])
+        self.assertTrue(menu[0].has_menu_children)
+        self.assertEqual(
+            [(item.title, item.href) for item in menu[0].children],
+            [("Team", self.team.relative_url(self.site)), ("Donate", "/projects/")]
+        )
+
+    def test_site_menu_is_cached(self):
+        """Test that the menu is cached until a page is unpublished."""
+        self.get_menu()
+        with self.assertNumQueries(0):
+            self.get_menu()
+
+        self.team.unpublish()
+        self.assertEqual([item.title for item in self.get_menu()[0].children], ["Donate"])
@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from wagtail.wagtailcore.models import Site
+from revolv.revolv_cms.context_processors import settings
+from revolv.revolv_cms.models import FooterSettings
+
+
+class SiteSettingsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.request.site = Site.objects.get(is_default_site=True)
+
+    def get_footer_settings(self):
+        return settings(self.request)['settings']['revolv_cms']['FooterSettings']
+
+    def test_settings_are_cached(self):
+        """Test that the settings are loaded once, until one of them is saved."""
+        self.assertEqual(self.get_footer_settings().contact_heading, "Contact")
+        with self.assertNumQueries(0):
+            self.get_footer_settings()
+
+        footer_settings = FooterSettings.objects.get(site=self.request.site)
+        footer_settings.contact_heading = "Get in touch"
+        footer_settings.save()
+        self.assertEqual(self.get_footer_settings().contact_heading, "Get in touch")
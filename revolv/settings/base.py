@@ -69,6 +69,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'revolv.base.sql_profile.SQLProfileMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,7 @@ MIDDLEWARE_CLASSES = [
     'wagtail.wagtailredirects.middleware.RedirectMiddleware',
     'sesame.middleware.AuthenticationMiddleware',
     'revolv.base.users.RevolvSocialAuthExceptionMiddleware',
+    'revolv.base.request_profiler.RequestProfilerMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -108,7 +110,7 @@ TEMPLATE_CONTEXT_PROCESSORS = [
     'social.apps.django_app.context_processors.backends',
     'social.apps.django_app.context_processors.login_redirect',
     'sekizai.context_processors.sekizai',
-    'wagtailsettings.context_processors.settings',
+    'revolv.revolv_cms.context_processors.settings',
 ]
 
 WSGI_APPLICATION = 'revolv.wsgi.application'
@@ -313,6 +315,28 @@ ADMIN_PAYMENT_USERNAME = 'administrator'
 USER_REINVESTMENT_DATE = {'day': 1, 'hour': 00, 'minute': 00}
 #date of the month when automatic reinvest execute
 ADMIN_REINVESTMENT_DATE = {'day': 15, 'hour': 00, 'minute': 00}
+#how the monthly reinvestment balance is split between active projects,
+#one of revolv.payments.allocation.ALLOCATION_STRATEGIES
+REINVESTMENT_ALLOCATION_STRATEGY = 'equal'
+#seconds the public pages are cached for anonymous visitors (see revolv.base.page_cache);
+#they are invalidated as soon as what they show changes, this only bounds memory use
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 60 * 60
+#per-request SQL profiles (see revolv.base.sql_profile): whether they are taken (only in
+#development and tests by default), how many of the slowest statements they list, how many
+#runs of the same statement make an N+1, how many profiles are kept for the
+#administrator:sql_profile endpoint, and whether an N+1 raises (for tests)
+SQL_PROFILE_ENABLED = False
+SQL_PROFILE_SLOWEST = 5
+SQL_PROFILE_REPEAT_THRESHOLD = 5
+SQL_PROFILE_BUFFER_SIZE = 200
+SQL_PROFILE_STRICT = False
+#requests profiled on demand by administrators (see revolv.base.request_profiler): where the
+#captures are stored, how many are kept, how many functions their stats list and how long
+#a profile token is valid for
+REQUEST_PROFILE_ROOT = os.path.join(PROJECT_ROOT, 'profiles')
+REQUEST_PROFILE_KEEP = 50
+REQUEST_PROFILE_TOP_N = 50
+REQUEST_PROFILE_TOKEN_MAX_AGE = 60 * 60
 
 now = datetime.now()
 #Datetime object when automatic reinvest run, we need to increase a little to prevent overlap with user reinvestment
@@ -322,7 +346,8 @@ ADMIN_REINVESTMENT_DATE_DT = datetime(now.year, now.month, **ADMIN_REINVESTMENT_
 # using RabbitMQ as a broker, this sends results back as AMQP messages
 CELERY_RESULT_BACKEND = "amqp"
 
-CELERY_IMPORTS = ('revolv.tasks.reinvestment_allocation', 'revolv.tasks.reinvestment_rollover',)
+CELERY_IMPORTS = ('revolv.tasks.reinvestment_allocation', 'revolv.tasks.reinvestment_rollover',
+                  'revolv.tasks.monthly_reminders', 'revolv.tasks.global_impacts',)
 # The default Django db scheduler
 CELERYBEAT_SCHEDULER = "djcelery.schedulers.DatabaseScheduler"
 CELERYBEAT_SCHEDULE = {
@@ -342,6 +367,11 @@ CELERYBEAT_SCHEDULE = {
         "task": "revolv.tasks.reinvestment_rollover.distribute_reinvestment_fund",
         "schedule": crontab(hour=ADMIN_REINVESTMENT_DATE['hour'], minute=ADMIN_REINVESTMENT_DATE['minute'],
                             day_of_month=ADMIN_REINVESTMENT_DATE['day']),
+    },
+    "global_impacts": {
+        "task": "revolv.tasks.global_impacts.refresh_global_impacts",
+        # Every 10 minutes
+        "schedule": crontab(minute='*/10'),
     }
 }
 
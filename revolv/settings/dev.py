@@ -19,6 +19,8 @@ CELERY_ALWAYS_EAGER = True
 
 CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
 
+SQL_PROFILE_ENABLED = True
+
 SECRET_KEY = os.environ.get('SECRET_KEY', 'uypx8s@%0u6in(7a=7v2m_w%*y^yo+a)_=45x*gib-e_vl^zm_')
 
 # Special test settings
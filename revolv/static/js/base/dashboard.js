@@ -88,6 +88,9 @@ $(document).ready(function () {
      * must also define data-section="x" - this will cause the element with .dashboard-data-section-x
      * to be shown and any other element with dashboard-data-section-* to be hidden.
      *
+     * The handler is delegated, so that it also works for the projects loaded into the sidebar
+     * later (see below).
+     *
      * This function will also add an "active" class to whichever dashboard data link was
      * clicked on, and remove the "active" class from all other dashboard data links. This
      * works very well for selecting projects via the dashboard sidebar.
@@ -98,7 +101,7 @@ $(document).ready(function () {
      * is clicked.
      */
     var TABLET_PORTRAIT_BREAKPOINT = 800; // pixels width
-    $(".dashboard-data-link").click(function() {
+    $(document).on("click", ".dashboard-data-link", function() {
         $(".dashboard-data-link.active").removeClass("active");
         $(this).addClass("active");
         // deletes repayment and funding progress for the current project
@@ -161,4 +164,52 @@ $(document).ready(function () {
             $(".dashboard-sidebar").removeAttr("style");
         }
     });
+
+    /**
+     * This function defines what happens when the "Show more" link under a section of the dashboard
+     * sidebar is clicked. The sidebar only comes with the first page of the projects of every section:
+     * the next page is fetched from the section's JSON endpoint (revolv.base.views.DashboardProjectsView)
+     * and appended to the section, and the link is removed once the last page is in.
+     */
+    $(".dashboard-sidebar-more").click(function() {
+        var $more = $(this);
+        if ($more.data("loading")) {
+            return;
+        }
+        $more.data("loading", true);
+        var sectionKey = $more.data("section-key");
+        $.ajax({
+            url: $more.data("url"),
+            data: {page: $more.data("next-page")},
+            dataType: "json",
+            success: function (data) {
+                var $section = $(".dashboard-sidebar-section[data-section-key='" + sectionKey + "']");
+                $.each(data.projects, function (i, project) {
+                    var $container = $("<div>")
+                        .addClass("dashboard-sidebar-project-container dashboard-data-link")
+                        .addClass("dashboard-sidebar-project-container-" + project.pk)
+                        .attr("data-section", "project-" + project.pk);
+                    $("<div>").addClass("dashboard-sidebar-bullet-point " + sectionKey).appendTo($container);
+                    $("<div>")
+                        .addClass("dashboard-sidebar-project dashboard-data-link " + sectionKey)
+                        .addClass("project-" + project.pk)
+                        .addClass("project-status-" + project.pk + "-" + project.project_status)
+                        .text(project.title)
+                        .appendTo($container);
+                    $section.append($container);
+                });
+                if (data.next_page) {
+                    $more.data("next-page", data.next_page);
+                } else {
+                    $more.remove();
+                }
+            },
+            error: function () {
+                alert("Please try again.");
+            },
+            complete: function () {
+                $more.data("loading", false);
+            }
+        });
+    });
 });
@@ -0,0 +1,17 @@
+from revolv.base import impact
+
+from celery.task import task
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def refresh_global_impacts():
+    """
+    Recompute the RE-volv wide impact counters shown on the home page and store
+    them in the cache (see revolv.base.impact).
+    """
+    impacts = impact.refresh_global_impacts()
+    logger.info('Refreshed global impacts: %s' % impacts)
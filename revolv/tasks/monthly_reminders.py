@@ -1,17 +1,20 @@
 from revolv.base.models import RevolvUserProfile
 from revolv.lib.mailer import send_revolv_email
 
+from celery.task import task
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from sesame import utils
 
 
+@task
 def user_reinvestment_reminder():
     """
     Mail worker
 
     Send email update to user that eligible for reinvestment.
-    This should execute after month_allocation
+    This is queued by calculate_montly_reinvesment_allocation once the month's
+    allocation is committed
 
     This how the script do:
     1. Read user profile with reinvest_pool >0 and subscribed_to_updates = True
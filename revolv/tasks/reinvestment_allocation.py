@@ -1,29 +1,27 @@
-from revolv.project.models import Project
-from revolv.payments.models import ProjectMontlyRepaymentConfig, AdminRepayment
+from revolv.payments.allocation import plan_allocation
 from revolv.base.models import RevolvUserProfile
 from revolv.tasks.monthly_reminders import user_reinvestment_reminder
 from django.conf import settings
-from django.db.models import Sum
 from celery.task import task
-from datetime import date
 
 import logging
 import sys
-import time
 
 logger = logging.getLogger(__name__)
 
 
 @task
-def calculate_montly_reinvesment_allocation():
+def calculate_montly_reinvesment_allocation(strategy=None):
     """
     This task to handle month reinvestment calculation
 
     This is how it do:
-    1. Calculate money in out hand: balance + sum of incomming installment
-    2. Calculate max money to re-allocate to each active project
-    3. Set project monthly_reinvestment_cap with above value
-    4. Send email alert to user
+    1. Plan the month (see revolv.payments.allocation): the incoming installments,
+       the money in our hand (balance + installments), and how much of it each
+       active project may receive, split by the given allocation strategy
+       (settings.REINVESTMENT_ALLOCATION_STRATEGY by default)
+    2. Enter the installments and set every project monthly_reinvestment_cap, in one transaction
+    3. Queue the email alert to user as a follow-up task
     """
     ADMIN_PAYMENT_USERNAME = settings.ADMIN_PAYMENT_USERNAME
     logger.info('Calculate monthly allocation')
@@ -33,37 +31,14 @@ def calculate_montly_reinvesment_allocation():
         logger.error("Can't find admin user: {0}. System exiting!".format(ADMIN_PAYMENT_USERNAME))
         sys.exit()
 
-    reinvest_balance = RevolvUserProfile.objects.all().aggregate(total=Sum('reinvest_pool'))['total']
-    logger.info('Current reinvestment balance: %s' % reinvest_balance)
-    for project in Project.objects.get_completed_unpaid_off_projects():
-        try:
-            repayment_config = project.projectmontlyrepaymentconfig_set\
-                .get(year=date.today().year, repayment_type=ProjectMontlyRepaymentConfig.SOLAR_SEED_FUND)
-        except ProjectMontlyRepaymentConfig.DoesNotExist:
-            logger.error("Project %s - %s doesn't have repayment config!", project.id, project.title)
-            continue
+    plan = plan_allocation(strategy or settings.REINVESTMENT_ALLOCATION_STRATEGY)
+    for line in plan.describe():
+        logger.info(line)
 
-        AdminRepayment.objects.create(amount=repayment_config.amount,
-                                      project=project,
-                                      admin=admin)
-        reinvest_balance += repayment_config.amount
-
-    if reinvest_balance < 0.0:
+    if plan.balance < 0.0:
         logger.info("We don't have any balance. Exiting")
         sys.exit()
 
-    logger.info('Total reinvestment balance: %s' % reinvest_balance)
-
-    recipient = filter(lambda p: p.amount_left > 0.0, Project.objects.get_active())
-
-    logger.info('Total project active: %s' % len(recipient))
-
-    fund_per_recipient = reinvest_balance / len(recipient)
-    logger.info('Fund allocated to each project: %s' % fund_per_recipient)
-    for project in recipient:
-        project.monthly_reinvestment_cap = fund_per_recipient
-        project.save()
-    #wait for 30s and the send mail
-    time.sleep(30)
+    plan.apply(admin)
 
-    user_reinvestment_reminder()
+    user_reinvestment_reminder.delay()
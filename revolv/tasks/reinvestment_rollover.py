@@ -1,48 +1,180 @@
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
 
+from revolv.base.utils import is_user_reinvestment_period
 from revolv.project.models import Project
-from revolv.payments.models import ProjectMontlyRepaymentConfig, AdminReinvestment
+from revolv.payments.models import AdminReinvestment, ReinvestmentRollover
 from revolv.base.models import RevolvUserProfile
 
+from celery import chord
 from celery.task import task
 
-import sys
-import time
+from datetime import date
 import logging
 
 logger = logging.getLogger("revolv")
 
+# how long to wait before trying again if the rollover starts before the user
+# reinvestment period is over
+ROLLOVER_RETRY_DELAY = 60
+
+
+class MissingAdminError(Exception):
+    """
+    Raised when there is no user named settings.ADMIN_PAYMENT_USERNAME to make
+    the AdminReinvestments.
+    """
+    pass
+
+
+def get_admin():
+    ADMIN_PAYMENT_USERNAME = settings.ADMIN_PAYMENT_USERNAME
+    try:
+        return RevolvUserProfile.objects.get(user__username=ADMIN_PAYMENT_USERNAME)
+    except RevolvUserProfile.DoesNotExist:
+        logger.error("Can't find admin user: {0}.".format(ADMIN_PAYMENT_USERNAME))
+        raise MissingAdminError("Can't find admin user: {0}".format(ADMIN_PAYMENT_USERNAME))
+
 
 @task
-def distribute_reinvestment_fund():
+def distribute_reinvestment_fund(year=None, month=None):
     """
     This task is for Automatic reinvestment
 
     This is how tis script do:
     1. Get all project that is eligible for reinvestment:
         (project with monthly_reinvestment_cap >0 and not fully funded)
-    2. For each project determine how we'll reinvest ( min(monthly_reinvestment_cap, amount_left)
-    3. Add AdminReinvestment object with above value
-    4. Set monthly_reinvestment_cap to 0.0
+    2. Lock them and take a snapshot of what we'll reinvest in each of them
+       ( min(monthly_reinvestment_cap, amount_left) ), scaled down if the users'
+       reinvest pools can't cover all of it
+    3. Run reinvest_into_project for every project in parallel, as the header
+       of a chord
+    4. finish_reinvestment_rollover then records the totals and sets every
+       monthly_reinvestment_cap to 0.0, unless the reinvestment into some of
+       the projects failed
+
+    The rollover is recorded per month in a ReinvestmentRollover, which is only
+    completed once every project got its reinvestment, so running the task
+    again (e.g. when a worker or a project failed) only reinvests into the
+    projects which didn't get their reinvestment yet.
     """
+    if is_user_reinvestment_period():
+        logger.info('User reinvestment period is not over yet, retrying in %s seconds', ROLLOVER_RETRY_DELAY)
+        distribute_reinvestment_fund.apply_async((year, month), countdown=ROLLOVER_RETRY_DELAY)
+        return
 
-    time.sleep(60)
-    ADMIN_PAYMENT_USERNAME = settings.ADMIN_PAYMENT_USERNAME
+    get_admin()
+    today = date.today()
+    rollover = ReinvestmentRollover.objects.for_month(year or today.year, month or today.month)
+    if rollover.is_completed:
+        logger.info('%s is already done', rollover)
+        return
+
+    with transaction.atomic():
+        eligible_ids = list(Project.objects.get_eligible_projects_for_reinvestment().values_list('pk', flat=True))
+        caps = dict(
+            Project.objects.select_for_update().filter(pk__in=eligible_ids).order_by('pk').values_list(
+                'pk', 'monthly_reinvestment_cap'
+            )
+        )
+        amounts = dict(
+            (project.pk, min(caps[project.pk], float(project.funding_amount_left)))
+            for project in Project.objects.with_funding_stats(
+                Project.objects.filter(pk__in=eligible_ids), min_amount_left=0.0
+            )
+        )
+        reinvest_balance = RevolvUserProfile.objects.aggregate(total=Sum('reinvest_pool'))['total'] or 0.0
+
+    total = sum(amounts.values())
+    if total > reinvest_balance:
+        scale = max(0.0, reinvest_balance) / total
+        amounts = dict((project_id, amount * scale) for project_id, amount in amounts.items())
+    logger.info('Reinvesting {0} into {1} projects'.format(min(total, reinvest_balance), len(amounts)))
 
+    callback = finish_reinvestment_rollover.s(rollover.pk, eligible_ids)
+    header = [
+        reinvest_into_project.s(rollover.pk, project_id, amount)
+        for project_id, amount in sorted(amounts.items()) if amount > 0.0
+    ]
+    if not header:
+        callback.delay([])
+        return
+    chord(header)(callback)
+
+
+@task
+def reinvest_into_project(rollover_id, project_id, amount):
+    """
+    Reinvest (up to) amount into one project, as part of the given rollover,
+    holding the project's lock until the AdminReinvestment is committed.
+
+    Does nothing if the project already got its reinvestment in this rollover.
+    A failure is logged and returned as None rather than raised, because a
+    failed header task would keep the chord from ever running
+    finish_reinvestment_rollover, which then keeps the failed project's cap
+    and leaves the rollover to be run again.
+
+    :return: the amount reinvested into the project in this rollover, or None
+    if the reinvestment failed
+    """
     try:
-        admin = RevolvUserProfile.objects.get(user__username=ADMIN_PAYMENT_USERNAME)
-    except RevolvUserProfile.DoesNotExist:
-        logger.error("Can't find admin user: {0}. System exiting!".format(ADMIN_PAYMENT_USERNAME))
-        sys.exit()
+        return _reinvest_into_project(rollover_id, project_id, amount)
+    except Exception:
+        logger.exception('Reinvestment into project {0} failed'.format(project_id))
+        return None
 
-    for project in Project.objects.get_eligible_projects_for_reinvestment():
-        amount_to_reinvest = project.reinvest_amount_left
+
+def _reinvest_into_project(rollover_id, project_id, amount):
+    admin = get_admin()
+    with transaction.atomic():
+        project = Project.objects.select_for_update().get(pk=project_id)
+        done = AdminReinvestment.objects.filter(rollover_id=rollover_id, project=project).values_list(
+            'amount', flat=True
+        )
+        if done:
+            return done[0]
+        amount_to_reinvest = project.reserve_reinvestment(amount)
         if amount_to_reinvest > 0.0:
             logger.info('Trying to reinvest {0} to {1}-{2}'.format(amount_to_reinvest, project.id, project.title))
             AdminReinvestment.objects.create(
                 amount=amount_to_reinvest,
                 admin=admin,
-                project=project
+                project=project,
+                rollover_id=rollover_id
             )
-        project.monthly_reinvestment_cap = 0.0
-        project.save()
+    return amount_to_reinvest
+
+
+@task
+def finish_reinvestment_rollover(amounts, rollover_id, project_ids):
+    """
+    Chord callback of distribute_reinvestment_fund: set the
+    monthly_reinvestment_cap of every project in the rollover to 0.0, and
+    record the rollover's totals.
+
+    If the reinvestment into some of the projects failed (see
+    reinvest_into_project), only the projects which got their reinvestment
+    have their cap reset, and the rollover isn't completed, so that running
+    it again reinvests into the failed projects.
+
+    :amounts: the results of the reinvest_into_project tasks
+    """
+    failed = sum(1 for amount in amounts if amount is None)
+    with transaction.atomic():
+        reinvestments = AdminReinvestment.objects.filter(rollover_id=rollover_id)
+        if failed:
+            reset_ids = reinvestments.filter(project_id__in=project_ids).values_list('project_id', flat=True)
+        else:
+            reset_ids = project_ids
+        Project.objects.filter(pk__in=list(reset_ids)).update(monthly_reinvestment_cap=0.0)
+        totals = reinvestments.aggregate(total=Sum('amount'), count=Count('pk'))
+        ReinvestmentRollover.objects.filter(pk=rollover_id).update(
+            total_reinvested=totals['total'] or 0.0,
+            project_count=totals['count'],
+            completed_at=None if failed else timezone.now()
+        )
+    logger.info('Reinvested {0} into {1} projects'.format(totals['total'] or 0.0, totals['count']))
+    if failed:
+        logger.error('Reinvestment into {0} projects failed, run the rollover again'.format(failed))
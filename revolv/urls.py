@@ -8,6 +8,7 @@ from wagtail.wagtailcore import urls as wagtail_urls
 from wagtail.wagtaildocs import urls as wagtaildocs_urls
 
 from revolv.base import views as base_views
+from revolv.base.page_cache import cache_anonymous_page
 
 urlpatterns = patterns(
     '',
@@ -15,15 +16,18 @@ urlpatterns = patterns(
     url(r'^facebook/', include('django_facebook.urls')),
     url(r'^admin/', include(admin.site.urls)),
 
-    url(r'^$', base_views.HomePageView.as_view(), name='home'),
+    url(r'^$', cache_anonymous_page(['projects', 'impacts', 'cms'])(base_views.HomePageView.as_view()), name='home'),
     url(r'^project/', include('revolv.project.urls', namespace='project')),
     url(r'^my-portfolio/$', base_views.DashboardRedirect.as_view(), name='dashboard'),
     url(r'^my-portfolio/categories/$', base_views.CategoryPreferenceSetterView.as_view(), name='dashboard_category_setter'),
+    url(r'^my-portfolio/(?P<role>admin|ambassador|donor)/projects/(?P<section>\w+)/$',
+        base_views.DashboardProjectsView.as_view(), name='dashboard_projects'),
     url(r'^my-portfolio/admin/', include('revolv.administrator.urls', namespace='administrator')),
     url(r'^my-portfolio/ambassador/', include('revolv.ambassador.urls', namespace='ambassador')),
     url(r'^my-portfolio/donor/', include('revolv.donor.urls', namespace='donor')),
 
-    url(r'^what-we-do/projects/', base_views.ProjectListView.as_view(), name='projects_list'),
+    url(r'^what-we-do/projects/', cache_anonymous_page(['projects', 'cms'])(base_views.ProjectListView.as_view()),
+        name='projects_list'),
     url(r'^signin/$', base_views.SignInView.as_view(), name='signin'),
     url(r'^login/$', base_views.LoginView.as_view(), name='login'),
     url(r'^signup/$', base_views.SignupView.as_view(), name='signup'),